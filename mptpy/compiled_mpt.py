@@ -0,0 +1,485 @@
+""" Compiled representation of Multinomial Processing Trees (MPTs).
+
+A compiled MPT stores the branch structure of the model as integer arrays:
+for every branch (path from a root to a leaf) its category and how often
+each parameter occurs on the branch as positive (p) and negative (1-p)
+factor. The probability of a branch is therefore
+
+    prod_j p_j ** pos[branch, j] * (1 - p_j) ** neg[branch, j]
+
+and the probability of a category is the sum over its branches. Models
+consisting of several trees are compiled natively: every category belongs to
+exactly one tree and the category probabilities sum to one within each tree.
+
+Submodels of a tree (nodes deleted, parameters split into several) are
+compiled from the precomputed paths of the parent tree (see ParentModel),
+without building their trees.
+
+"""
+
+import numpy as np
+
+from mptpy.node import flatten
+
+
+class CompiledMPT(object):
+    """ Branch structure and parameter index table of an MPT
+
+    """
+
+    def __init__(self, params, categories, branch_cats, branch_pos,
+                 branch_neg, cat_trees=None):
+        """ Constructs the compiled MPT.
+
+        Parameters
+        ----------
+        params : [str]
+            parameter names, defining the column order
+
+        categories : [str]
+            category names, defining the category order
+
+        branch_cats : array_like
+            category index for each branch
+
+        branch_pos : array_like
+            (n_branches, n_params) occurrences of p_j on each branch
+
+        branch_neg : array_like
+            (n_branches, n_params) occurrences of (1-p_j) on each branch
+
+        cat_trees : array_like, optional
+            tree index for each category. Default: single tree.
+
+        """
+
+        self.params = list(params)
+        self.param_index = {param: idx for idx, param in enumerate(params)}
+        self.categories = list(categories)
+
+        if cat_trees is None:
+            cat_trees = np.zeros(len(self.categories), dtype=int)
+        self.cat_trees = np.asarray(cat_trees, dtype=int)
+
+        # branches are kept sorted by category for the summation
+        branch_cats = np.asarray(branch_cats, dtype=int)
+        order = np.argsort(branch_cats, kind='stable')
+        self.branch_cats = branch_cats[order]
+        self.branch_pos = np.asarray(branch_pos, dtype=int).reshape(
+            len(order), len(self.params))[order]
+        self.branch_neg = np.asarray(branch_neg, dtype=int).reshape(
+            len(order), len(self.params))[order]
+
+        self._starts = np.searchsorted(
+            self.branch_cats, np.arange(len(self.categories)))
+        if not np.array_equal(np.unique(self.branch_cats),
+                              np.arange(len(self.categories))):
+            raise ValueError(
+                'Every category needs to be reachable by at least one branch.')
+
+    @classmethod
+    def from_branches(cls, params, categories, branches, cat_trees=None):
+        """ Compile the model from a branch list
+
+        Parameters
+        ----------
+        params : [str]
+            parameter names
+
+        categories : [str]
+            category names
+
+        branches : [(int, [(int, bool)])]
+            category index and (parameter index, positive) factors for each
+            branch
+
+        cat_trees : array_like, optional
+            tree index for each category
+
+        Returns
+        -------
+        CompiledMPT
+
+        """
+
+        branch_pos = np.zeros((len(branches), len(params)), dtype=int)
+        branch_neg = np.zeros((len(branches), len(params)), dtype=int)
+
+        for idx, (_, factors) in enumerate(branches):
+            for param, positive in factors:
+                if positive:
+                    branch_pos[idx, param] += 1
+                else:
+                    branch_neg[idx, param] += 1
+
+        branch_cats = [cat for cat, _ in branches]
+        return cls(params, categories, branch_cats, branch_pos, branch_neg,
+                   cat_trees=cat_trees)
+
+    @classmethod
+    def from_tree(cls, root, categories=None):
+        """ Compile the model from its tree
+
+        Parameters
+        ----------
+        root : Node
+            root node of the MPT
+
+        categories : [str], optional
+            category order. Defaults to the numerical order of the leaves
+            (or the order of appearance for non-numerical leaves).
+
+        Returns
+        -------
+        CompiledMPT
+
+        """
+
+        return cls.from_trees([root], categories=categories)
+
+    @classmethod
+    def from_trees(cls, roots, categories=None):
+        """ Compile a model consisting of one or several trees
+
+        Parameters
+        ----------
+        roots : [Node]
+            root nodes of the trees
+
+        categories : [str], optional
+            category order. Defaults to the numerical order of the leaves
+            (or the order of appearance for non-numerical leaves).
+
+        Returns
+        -------
+        CompiledMPT
+
+        """
+
+        if categories is None:
+            categories = category_order(
+                [cat for root in roots for cat in root.answers()])
+        cat_index = {cat: idx for idx, cat in enumerate(categories)}
+        cat_trees = np.full(len(categories), -1, dtype=int)
+
+        params = []
+        param_index = {}
+        branches = []
+
+        for tree, root in enumerate(roots):
+            stack = [(root, ())]
+            while stack:
+                node, factors = stack.pop()
+                if node.leaf:
+                    cat = cat_index[node.content]
+                    if cat_trees[cat] not in (-1, tree):
+                        raise ValueError(
+                            'Category {} occurs in several trees.'.format(
+                                node.content))
+                    cat_trees[cat] = tree
+                    branches.append((cat, factors))
+                    continue
+
+                if node.content not in param_index:
+                    param_index[node.content] = len(params)
+                    params.append(node.content)
+                param = param_index[node.content]
+
+                stack.append((node.neg, factors + ((param, False),)))
+                stack.append((node.pos, factors + ((param, True),)))
+
+        return cls.from_branches(params, categories, branches,
+                                 cat_trees=cat_trees)
+
+    @property
+    def n_branches(self):
+        """ Number of branches
+
+        """
+
+        return len(self.branch_cats)
+
+    @property
+    def n_trees(self):
+        """ Number of trees
+
+        """
+
+        return int(self.cat_trees.max()) + 1 if len(self.cat_trees) else 0
+
+    def theta(self, assignment):
+        """ Parameter vector for an assignment
+
+        Parameters
+        ----------
+        assignment : dict
+            {parameter : value}
+
+        Returns
+        -------
+        ndarray
+            parameter values in the column order of the model
+
+        """
+
+        return np.array([assignment[param] for param in self.params],
+                        dtype=float)
+
+    def branch_probabilities(self, theta):
+        """ Probabilities of the branches
+
+        Parameters
+        ----------
+        theta : array_like
+            (..., n_params) parameter values
+
+        Returns
+        -------
+        ndarray
+            (..., n_branches) branch probabilities
+
+        """
+
+        theta = np.asarray(theta, dtype=float)
+
+        if np.all((theta > 0) & (theta < 1)):
+            log_probs = np.log(theta) @ self.branch_pos.T + \
+                np.log1p(-theta) @ self.branch_neg.T
+            return np.exp(log_probs)
+
+        # parameters on the boundary, 0 ** 0 = 1 avoids 0 * log(0)
+        theta = theta[..., np.newaxis, :]
+        return np.prod(theta ** self.branch_pos *
+                       (1 - theta) ** self.branch_neg, axis=-1)
+
+    def category_probabilities(self, theta):
+        """ Probabilities of the categories
+
+        Parameters
+        ----------
+        theta : array_like
+            (..., n_params) parameter values
+
+        Returns
+        -------
+        ndarray
+            (..., n_categories) category probabilities
+
+        """
+
+        return np.add.reduceat(
+            self.branch_probabilities(theta), self._starts, axis=-1)
+
+    def jacobian(self, theta):
+        """ Derivatives of the category probabilities w.r.t. the parameters
+
+        Parameters
+        ----------
+        theta : array_like
+            (..., n_params) parameter values in the open interval (0, 1)
+
+        Returns
+        -------
+        ndarray
+            (..., n_categories, n_params) Jacobian
+            d category_probabilities[i] / d theta[j]
+
+        """
+
+        theta = np.asarray(theta, dtype=float)
+
+        # d/dp_j prod_k p_k^pos_k (1-p_k)^neg_k =
+        #   branch probability * (pos_j / p_j - neg_j / (1 - p_j))
+        theta_ = theta[..., np.newaxis, :]
+        factors = self.branch_pos / theta_ - self.branch_neg / (1 - theta_)
+        branch_jac = self.branch_probabilities(theta)[..., np.newaxis] * \
+            factors
+
+        return np.add.reduceat(branch_jac, self._starts, axis=-2)
+
+    def log_likelihood_gradient(self, theta, data):
+        """ Gradient of the log likelihood (without the factorial constants)
+        w.r.t. the parameters
+
+        Parameters
+        ----------
+        theta : array_like
+            (n_params,) parameter values in the open interval (0, 1)
+
+        data : array_like
+            (n_categories,) or (rows, n_categories) observations, all rows
+            sharing the parameters
+
+        Returns
+        -------
+        ndarray
+            (n_params,) d sum(data * log(category_probabilities)) / d theta
+
+        """
+
+        data = np.asarray(data, dtype=float).reshape(
+            -1, len(self.categories)).sum(axis=0)
+        probs = self.category_probabilities(theta)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(data > 0, data / probs, 0)
+        return weights @ self.jacobian(theta)
+
+    def tree_totals(self, data):
+        """ Number of observations of the tree of each category
+
+        Parameters
+        ----------
+        data : array_like
+            (..., n_categories) observations
+
+        Returns
+        -------
+        ndarray
+            (..., n_categories) total observations of the respective tree
+
+        """
+
+        data = np.asarray(data)
+        totals = np.zeros(data.shape[:-1] + (self.n_trees,))
+        for tree in range(self.n_trees):
+            totals[..., tree] = data[..., self.cat_trees == tree].sum(axis=-1)
+        return totals[..., self.cat_trees]
+
+    def __eq__(self, other):
+        return self.params == other.params and \
+            self.categories == other.categories and \
+            np.array_equal(self.branch_cats, other.branch_cats) and \
+            np.array_equal(self.branch_pos, other.branch_pos) and \
+            np.array_equal(self.branch_neg, other.branch_neg) and \
+            np.array_equal(self.cat_trees, other.cat_trees)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class ParentModel(object):
+    """ Paths of a tree, from which its submodels are compiled. A submodel
+    is given by a mask over the tokens of the tree (in BMPT order) and the
+    parameter name of every kept inner node; nodes sharing a name are tied.
+    A deleted node drops its factor from the branches through its kept
+    child, the branches through its deleted child are dropped with their
+    leaves.
+
+    """
+
+    def __init__(self, mpt):
+        """ Precomputes the paths of the tree.
+
+        Parameters
+        ----------
+        mpt : MPT
+            parent model. The dummy nodes joining the trees of a multi-tree
+            model are not parameters of the submodels.
+
+        """
+
+        root = mpt.root
+        compiled = mpt.compile()
+        self.categories = compiled.categories
+        self.cat_trees = compiled.cat_trees
+        cat_index = {cat: idx for idx, cat in enumerate(self.categories)}
+
+        self.tokens, inner = flatten(root)
+        self.is_param = np.array(inner, dtype=bool)
+        self.is_param[_join_positions(root, 0, len(mpt.trees))] = False
+
+        # one branch per leaf token
+        leaves = []
+        paths = []
+        stack = [(root, 0, ())]
+        while stack:
+            node, idx, path = stack.pop()
+            if node.leaf:
+                leaves.append(idx)
+                paths.append(path)
+                continue
+            stack.append((node.neg, idx + 1 + len(node.pos),
+                          path + ((idx, False),)))
+            stack.append((node.pos, idx + 1, path + ((idx, True),)))
+
+        self.leaves = np.array(leaves, dtype=int)
+        self.leaf_cats = np.array(
+            [cat_index[self.tokens[idx]] for idx in leaves], dtype=int)
+        self.node_pos = np.zeros((len(leaves), len(self.tokens)), dtype=int)
+        self.node_neg = np.zeros((len(leaves), len(self.tokens)), dtype=int)
+        for branch, path in enumerate(paths):
+            for idx, positive in path:
+                if self.is_param[idx]:
+                    target = self.node_pos if positive else self.node_neg
+                    target[branch, idx] = 1
+
+    def submodel(self, mask, names):
+        """ Compile a submodel
+
+        Parameters
+        ----------
+        mask : array_like
+            0/1 flags over the tokens of the parent, whether the node is kept
+
+        names : sequence
+            parameter name for every token of the parent (only read for kept
+            inner nodes)
+
+        Returns
+        -------
+        CompiledMPT
+            the submodel, parameters in order of their first occurrence
+
+        """
+
+        mask = np.asarray(mask, dtype=bool)
+        params = {}
+        columns = []
+        for idx in np.flatnonzero(mask & self.is_param):
+            columns.append((idx, params.setdefault(names[idx], len(params))))
+
+        ties = np.zeros((len(self.tokens), len(params)), dtype=int)
+        for idx, column in columns:
+            ties[idx, column] = 1
+
+        kept = mask[self.leaves]
+        return CompiledMPT(list(params), self.categories,
+                           self.leaf_cats[kept], self.node_pos[kept] @ ties,
+                           self.node_neg[kept] @ ties,
+                           cat_trees=self.cat_trees)
+
+
+def _join_positions(node, idx, n_trees):
+    """ Token positions of the dummy nodes joining n_trees trees (see
+    joint_tree.join_nodes)
+
+    """
+
+    if n_trees <= 1:
+        return []
+
+    n_left = n_trees // 2
+    return [idx] + _join_positions(node.pos, idx + 1, n_left) + \
+        _join_positions(node.neg, idx + 1 + len(node.pos), n_trees - n_left)
+
+
+def category_order(answers):
+    """ Default order of the categories of a model
+
+    Parameters
+    ----------
+    answers : [str]
+        leaf contents, possibly with duplicates
+
+    Returns
+    -------
+    [str]
+        distinct categories, numerically sorted if all are numbers, else in
+        order of appearance
+
+    """
+
+    distinct = list(dict.fromkeys(answers))
+    if all(cat.isdigit() for cat in distinct):
+        return sorted(distinct, key=int)
+    return distinct
@@ -0,0 +1,473 @@
+""" Reading of count data (observations per category) for the fitting.
+
+Data files are CSV tables with one row per dataset (e.g. participant) and
+one column per category, optionally preceded by a header line with the
+column names. Files are read in blocks of rows, so arbitrarily large tables
+can be processed with bounded memory.
+
+For very large tables there is a binary format that is memory-mapped
+instead of parsed:
+
+    magic       8 bytes     b'MPTCNT01'
+    n_rows      uint64
+    n_columns   uint64
+    dtype       8 bytes     numpy dtype string, e.g. '<i4'
+    meta_len    uint64
+    meta        meta_len bytes of JSON {"categories": [..], "cat_trees": [..]}
+    padding     up to the next multiple of 64 bytes
+    data        n_rows x n_columns integers, row-major
+
+"""
+
+import itertools as it
+import json
+import struct
+
+import numpy as np
+
+
+DEFAULT_BLOCK_SIZE = 10000
+
+BINARY_MAGIC = b'MPTCNT01'
+_BINARY_HEADER = struct.Struct('<8sQQ8sQ')
+_BINARY_ALIGN = 64
+
+
+class CountReader(object):
+    """ Streaming reader for count data in CSV format
+
+    """
+
+    def __init__(self, data_path, sep=',', n_categories=None,
+                 block_size=DEFAULT_BLOCK_SIZE, header=None):
+        """ Constructs the reader and inspects the first line of the file.
+
+        Parameters
+        ----------
+        data_path : str
+            path to the CSV file
+
+        sep : str, optional
+            column separator
+
+        n_categories : int, optional
+            expected number of columns (categories of the model)
+
+        block_size : int, optional
+            maximal number of rows held in memory at once
+
+        header : boolean, optional
+            whether the first line is a header. Default: detected, the first
+            line is a header if any of its fields is not an integer.
+
+        """
+
+        self.data_path = data_path
+        self.sep = sep
+        self.block_size = block_size
+        self.header = None
+
+        first = next(self._lines(), None)
+        if first is None:
+            raise ValueError("{}: no data found".format(data_path))
+
+        line_no, line = first
+        fields = [field.strip() for field in line.split(sep)]
+        if header is None:
+            header = not all(_is_int(field) for field in fields)
+        if header:
+            self.header = [field.strip('"\'') for field in fields]
+        self._skip = line_no if header else 0
+        self.n_columns = len(fields)
+
+        if n_categories is not None and self.n_columns != n_categories:
+            raise ValueError(
+                "{}:{}: data has {} columns, but the model has {} "
+                "categories".format(data_path, line_no, self.n_columns,
+                                    n_categories))
+
+    def _lines(self):
+        """ Numbered data lines, without empty and comment lines
+
+        """
+
+        with open(self.data_path, 'r') as data_file:
+            for line_no, line in enumerate(data_file, 1):
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line_no, line
+
+    def __iter__(self):
+        """ Iterate over the data in blocks of rows
+
+        Yields
+        ------
+        ndarray
+            (rows, n_columns) integer block with at most block_size rows
+
+        """
+
+        lines = (entry for entry in self._lines() if entry[0] > self._skip)
+        while True:
+            block = list(it.islice(lines, self.block_size))
+            if not block:
+                return
+            yield self._convert(block)
+
+    def _convert(self, block):
+        """ Convert numbered lines to an integer array
+
+        """
+
+        try:
+            data = np.loadtxt([line for _, line in block], delimiter=self.sep,
+                              dtype=int, ndmin=2)
+        except ValueError as err:
+            raise ValueError("{}:{}-{}: invalid count data ({})".format(
+                self.data_path, block[0][0], block[-1][0], err))
+
+        if data.shape[1] != self.n_columns:
+            raise ValueError("{}:{}-{}: expected {} columns, found {}".format(
+                self.data_path, block[0][0], block[-1][0], self.n_columns,
+                data.shape[1]))
+        if np.any(data < 0):
+            row = np.nonzero((data < 0).any(axis=1))[0][0]
+            raise ValueError("{}:{}: negative counts".format(
+                self.data_path, block[row][0]))
+
+        return data
+
+
+def iter_blocks(data_path, sep=',', n_categories=None,
+                block_size=DEFAULT_BLOCK_SIZE, header=None):
+    """ Iterate over the rows of a count data file in blocks
+
+    Parameters
+    ----------
+    data_path : str
+        path to the CSV or binary file
+
+    sep : str, optional
+        column separator
+
+    n_categories : int, optional
+        expected number of columns (categories of the model)
+
+    block_size : int, optional
+        maximal number of rows per block
+
+    header : boolean, optional
+        whether the first line is a header. Default: detected.
+
+    Returns
+    -------
+    iterable
+        (rows, n_columns) integer blocks. Binary count files are
+        memory-mapped instead of parsed.
+
+    """
+
+    if is_binary(data_path):
+        return _load_checked(data_path, n_categories).iter_blocks(block_size)
+
+    return CountReader(data_path, sep=sep, n_categories=n_categories,
+                       block_size=block_size, header=header)
+
+
+def read_counts(data_path, sep=',', n_categories=None, header=None):
+    """ Read a complete count data file
+
+    Parameters
+    ----------
+    data_path : str
+        path to the CSV or binary file
+
+    sep : str, optional
+        column separator
+
+    n_categories : int, optional
+        expected number of columns (categories of the model)
+
+    header : boolean, optional
+        whether the first line is a header. Default: detected.
+
+    Returns
+    -------
+    ndarray
+        (rows, n_columns) counts
+
+    """
+
+    if is_binary(data_path):
+        return np.array(_load_checked(data_path, n_categories).data)
+
+    reader = CountReader(data_path, sep=sep, n_categories=n_categories,
+                         header=header)
+    blocks = list(reader)
+    if not blocks:
+        return np.zeros((0, reader.n_columns), dtype=int)
+    return np.concatenate(blocks)
+
+
+def _is_int(field):
+    try:
+        int(field)
+    except ValueError:
+        return False
+    return True
+
+
+class BinaryCounts(object):
+    """ Memory-mapped count data in the binary format. Slicing returns
+    views on the mapped file, so processes sharing a file share its pages.
+    Pickling transfers the path and row range only.
+
+    """
+
+    def __init__(self, path, start=0, stop=None):
+        """ Maps the binary count file.
+
+        Parameters
+        ----------
+        path : str
+            path to the binary file
+
+        start, stop : int, optional
+            range of rows to expose
+
+        """
+
+        self.path = path
+
+        with open(path, 'rb') as bin_file:
+            magic, n_rows, n_columns, dtype, meta_len = \
+                _BINARY_HEADER.unpack(bin_file.read(_BINARY_HEADER.size))
+            if magic != BINARY_MAGIC:
+                raise ValueError("{}: not a binary count file".format(path))
+            meta = json.loads(bin_file.read(meta_len).decode())
+
+        self.categories = meta.get('categories')
+        self.cat_trees = meta.get('cat_trees')
+        self.n_columns = n_columns
+
+        offset = _data_offset(meta_len)
+        if n_rows:
+            data = np.memmap(path, dtype=np.dtype(dtype.rstrip(b'\0').decode()),
+                             mode='r', offset=offset,
+                             shape=(n_rows, n_columns))
+        else:
+            data = np.zeros((0, n_columns), dtype=int)
+
+        self.start, self.stop, _ = slice(start, stop).indices(n_rows)
+        self.data = data[self.start:self.stop]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        return self.data[idx]
+
+    def rows(self, start, stop):
+        """ A range of rows as BinaryCounts
+
+        Parameters
+        ----------
+        start, stop : int
+            row range relative to this object
+
+        Returns
+        -------
+        BinaryCounts
+
+        """
+
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return BinaryCounts(self.path, self.start + start, self.start + stop)
+
+    def iter_blocks(self, block_size=DEFAULT_BLOCK_SIZE):
+        """ Iterate over the rows in blocks
+
+        Parameters
+        ----------
+        block_size : int, optional
+            rows per block
+
+        Yields
+        ------
+        ndarray
+            (rows, n_columns) view on the mapped data
+
+        """
+
+        for start in range(0, len(self), block_size):
+            yield self.data[start:start + block_size]
+
+    def __reduce__(self):
+        return BinaryCounts, (self.path, self.start, self.stop)
+
+
+def write_binary(path, blocks, n_columns, categories=None, cat_trees=None,
+                 dtype='<i4'):
+    """ Write count data to the binary format
+
+    Parameters
+    ----------
+    path : str
+        path of the binary file
+
+    blocks : iterable
+        (rows, n_columns) integer blocks
+
+    n_columns : int
+        number of columns
+
+    categories : [str], optional
+        category (column) names
+
+    cat_trees : [int], optional
+        tree index of each category
+
+    dtype : str, optional
+        integer type of the stored counts
+
+    Returns
+    -------
+    int
+        number of rows written
+
+    """
+
+    dtype = np.dtype(dtype)
+    info = np.iinfo(dtype)
+    meta = json.dumps({
+        'categories': None if categories is None else list(categories),
+        'cat_trees': None if cat_trees is None else
+                     [int(tree) for tree in cat_trees]}).encode()
+    offset = _data_offset(len(meta))
+
+    n_rows = 0
+    with open(path, 'wb') as bin_file:
+        bin_file.write(_binary_header(0, n_columns, dtype, meta))
+        bin_file.write(meta)
+        bin_file.write(b'\0' * (offset - bin_file.tell()))
+
+        for block in blocks:
+            block = np.asarray(block)
+            if block.shape[1:] != (n_columns,):
+                raise ValueError("expected blocks with {} columns".format(
+                    n_columns))
+            if block.size and (block.min() < info.min or
+                               block.max() > info.max):
+                raise ValueError("counts exceed the range of {}".format(
+                    dtype))
+            bin_file.write(block.astype(dtype).tobytes())
+            n_rows += len(block)
+
+        bin_file.seek(0)
+        bin_file.write(_binary_header(n_rows, n_columns, dtype, meta))
+
+    return n_rows
+
+
+def csv_to_binary(csv_path, bin_path, sep=',', mpt=None,
+                  block_size=DEFAULT_BLOCK_SIZE, dtype='<i4'):
+    """ Convert a CSV count file to the binary format in a streaming fashion
+
+    Parameters
+    ----------
+    csv_path : str
+        path to the CSV file
+
+    bin_path : str
+        path of the binary file
+
+    sep : str, optional
+        column separator of the CSV file
+
+    mpt : MPT, optional
+        model of the data. Its categories and tree layout are stored in the
+        header and the number of columns is validated.
+
+    block_size : int, optional
+        maximal number of rows held in memory
+
+    dtype : str, optional
+        integer type of the stored counts
+
+    Returns
+    -------
+    int
+        number of rows written
+
+    """
+
+    categories = None
+    cat_trees = None
+    if mpt is not None:
+        model = mpt.compile()
+        categories = model.categories
+        cat_trees = model.cat_trees
+
+    reader = CountReader(
+        csv_path, sep=sep, block_size=block_size,
+        n_categories=None if categories is None else len(categories))
+    if categories is None:
+        categories = reader.header
+
+    return write_binary(bin_path, reader, reader.n_columns,
+                        categories=categories, cat_trees=cat_trees,
+                        dtype=dtype)
+
+
+def load_binary(path):
+    """ Memory-map a binary count file
+
+    Parameters
+    ----------
+    path : str
+        path to the binary file
+
+    Returns
+    -------
+    BinaryCounts
+
+    """
+
+    return BinaryCounts(path)
+
+
+def is_binary(path):
+    """ Whether the file is in the binary count format
+
+    Parameters
+    ----------
+    path : str
+        path to the data file
+
+    Returns
+    -------
+    boolean
+
+    """
+
+    with open(path, 'rb') as data_file:
+        return data_file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def _load_checked(data_path, n_categories):
+    counts = BinaryCounts(data_path)
+    if n_categories is not None and counts.n_columns != n_categories:
+        raise ValueError(
+            "{}: data has {} columns, but the model has {} categories".format(
+                data_path, counts.n_columns, n_categories))
+    return counts
+
+
+def _binary_header(n_rows, n_columns, dtype, meta):
+    return _BINARY_HEADER.pack(BINARY_MAGIC, n_rows, n_columns,
+                               dtype.str.encode(), len(meta))
+
+
+def _data_offset(meta_len):
+    size = _BINARY_HEADER.size + meta_len
+    return -(-size // _BINARY_ALIGN) * _BINARY_ALIGN
@@ -6,20 +6,31 @@ import os
 
 import numpy as np
 
+from mptpy.fitting import count_data
 from mptpy.tools import misc
 
 
-def read_data(data_path, sep=','):
+def read_data(data_path, sep=',', n_categories=None):
     """ Read out the data and remove the header
 
+    Parameters
+    ----------
+    data_path : str
+        path to the CSV file
+
+    sep : str, optional
+        column separator
+
+    n_categories : int, optional
+        expected number of columns (categories of the model)
+
     Returns
     -------
-    list
-        data without header
+    ndarray
+        (rows, columns) data without header
     """
-    data = np.genfromtxt(data_path, delimiter=sep, dtype='int')
-    data = remove_header(data)
-    return data
+    return count_data.read_counts(data_path, sep=sep,
+                                  n_categories=n_categories)
 
 
 def remove_header(data):
@@ -30,7 +41,6 @@ def remove_header(data):
     list
         Data without header
     """
-    print(data)
     skip = 0
     if len(data.shape) == 1:
         return data
@@ -98,6 +108,44 @@ def comp_param_ratios(observations, prefix_no=0):
     return result_dict
 
 
+def join_param_ratios(model, params, data):
+    """ Compute the values of the dummy parameters of a joined tree from the
+    tree structure: the proportion of the observations below a dummy node
+    that fall into its positive subtree.
+
+    Parameters
+    ----------
+    model : CompiledMPT
+        compiled joint model
+
+    params : [str]
+        dummy parameters
+
+    data : ndarray
+        (..., n_categories) observations, one row per dataset
+
+    Returns
+    -------
+    ndarray
+        (..., len(params)) parameter values for each dataset
+    """
+    columns = [model.param_index[param] for param in params]
+
+    # categories reachable via the positive/negative branch of each node
+    starts = np.searchsorted(model.branch_cats,
+                             np.arange(len(model.categories)))
+    pos = np.add.reduceat(model.branch_pos[:, columns], starts, axis=0) > 0
+    neg = np.add.reduceat(model.branch_neg[:, columns], starts, axis=0) > 0
+
+    data = np.asarray(data, dtype=float)
+    n_pos = data @ pos
+    n_total = n_pos + data @ neg
+
+    # dummy nodes without observations do not influence the fit
+    return np.divide(n_pos, n_total, out=np.full(n_total.shape, 0.5),
+                     where=n_total > 0)
+
+
 def _save_parameter_ratios(static_params, temp_dir):
     """ Save the restrictions for the static parameters to a file
 
@@ -7,13 +7,61 @@ import re
 
 import numpy as np
 
+from mptpy.compiled_mpt import CompiledMPT
+
 
 def category_probabilities(cat_formulae, assignment):
+    """ Computes the category probabilities of a model.
+
+    Parameters
+    ----------
+    cat_formulae : list(str) or CompiledMPT
+        List of category formulae or the compiled model.
+
+    assignment : dict
+        Dictionary containing parameter names and values as keys and values,
+        respectively.
+
+    Returns
+    -------
+    ndarray
+        Category probabilities.
+
+    """
+
+    if isinstance(cat_formulae, CompiledMPT):
+        return cat_formulae.category_probabilities(
+            cat_formulae.theta(assignment))
+
     cat_probs = [eval_formula(f, assignment) for f in cat_formulae]
     assert math.isclose(np.sum(cat_probs), 1)
     return np.array(cat_probs)
 
 
+def tree_totals(cat_formulae, observations):
+    """ Computes the number of observations of the tree each category
+    belongs to.
+
+    Parameters
+    ----------
+    cat_formulae : list(str) or CompiledMPT
+        List of category formulae (single tree) or the compiled model.
+
+    observations : ndarray
+        Numbers of observations per category.
+
+    Returns
+    -------
+    ndarray or int
+        Tree totals per category.
+
+    """
+
+    if isinstance(cat_formulae, CompiledMPT):
+        return cat_formulae.tree_totals(observations)
+    return np.sum(observations)
+
+
 def eval_formula(formula, assignment):
     """ Evaluates a formula represented as a string.
 
@@ -103,12 +151,12 @@ def log_factorial(val):
 
     Parameters
     ----------
-    val : int
-        Number for which the factorial is to be computed.
+    val : int or ndarray
+        Number(s) for which the factorial is to be computed.
 
     Returns
     -------
-    int
+    float or ndarray
         log(val!)
 
     Examples
@@ -118,13 +166,11 @@ def log_factorial(val):
 
     """
 
-    # pylint: disable=no-member
-    return np.log(np.arange(1, val + 1)).sum()
-    # pylint: enable=no-member
+    return np.vectorize(math.lgamma, otypes=[float])(np.asarray(val) + 1)[()]
 
 
 def log_likelihood(
-        cat_probs, observations, ignore_factorials=False):
+        cat_probs, observations, ignore_factorials=False, cat_trees=None):
     """ Computes the logarithmic likelihood of the MPT model.
 
     Parameters
@@ -143,6 +189,10 @@ def log_likelihood(
         Flag indicating the inclusion or ignorance of the factorial constants.
         Setting this to True results in the same behaviour as MPTinR.
 
+    cat_trees : ndarray, optional
+        Tree index of each category for multi-tree models. The factorial
+        constants are computed per tree (product multinomial).
+
     Returns
     -------
     float
@@ -165,9 +215,14 @@ def log_likelihood(
     # pylint: disable=no-member
     llik = np.sum(observations * np.log(cat_probs))
     if not ignore_factorials:
+        if cat_trees is None:
+            cat_trees = np.zeros(observations.shape[-1], dtype=int)
+
         # Compute the log factorials for the observations
-        obs_factorials = np.sum([log_factorial(x) for x in observations])
-        n_factorial = log_factorial(observations.sum())
+        obs_factorials = np.sum(log_factorial(observations))
+        n_factorial = np.sum([
+            log_factorial(observations[..., cat_trees == tree].sum(axis=-1))
+            for tree in np.unique(cat_trees)])
         llik += n_factorial - obs_factorials
     # pylint: enable=no-member
     return llik
@@ -3,11 +3,21 @@
 """
 
 import numpy as np
-from scipy.optimize import minimize
 
 from . import likelihood as lh
 
 
+# bounds of the parameter values during the optimization
+BOUNDS = (0.000001, 0.999999)
+
+# random restarts after a converged warm start, all n_optim runs are made
+# if one of them finds a better minimum
+WARM_RESTARTS = 2
+
+# improvement of the objective over the warm start that counts as better
+WARM_TOL = 1e-6
+
+
 def optim_llik(param_values, cat_formulae, param_names, data, static_params):
     """ Realizes an objective function based on the log likelihood value of a
     parameterized MPT model.
@@ -17,8 +27,8 @@ def optim_llik(param_values, cat_formulae, param_names, data, static_params):
     param_values : list(float)
         List of parameter values.
 
-    cat_formulae : list(str)
-        List of category formula strings.
+    cat_formulae : list(str) or CompiledMPT
+        List of category formula strings or the compiled model.
 
     param_names : list(str)
         List of parameter identifier strings.
@@ -26,6 +36,9 @@ def optim_llik(param_values, cat_formulae, param_names, data, static_params):
     data : ndarray
         Data array.
 
+    static_params : dict
+        Values of the parameters that are not optimized.
+
     Returns
     -------
     float
@@ -56,7 +69,8 @@ def optim_llik(param_values, cat_formulae, param_names, data, static_params):
     return -1 * llik
 
 
-def optim_rmse(param_values, cat_formulae, param_names, data):
+def optim_rmse(param_values, cat_formulae, param_names, data,
+               static_params=None):
     """ Realizes an objective function based on the Root-Mean-Squared Error
     between a models predictions (i.e. probabilities times number of
     occurrences) and true observations.
@@ -66,8 +80,8 @@ def optim_rmse(param_values, cat_formulae, param_names, data):
     param_values : list(float)
         List of parameter values.
 
-    cat_formulae : list(str)
-        List of category formula strings.
+    cat_formulae : list(str) or CompiledMPT
+        List of category formula strings or the compiled model.
 
     param_names : list(str)
         List of parameter identifier strings.
@@ -75,6 +89,9 @@ def optim_rmse(param_values, cat_formulae, param_names, data):
     data : ndarray
         Data array.
 
+    static_params : dict, optional
+        Values of the parameters that are not optimized.
+
     Returns
     -------
     float
@@ -96,14 +113,52 @@ def optim_rmse(param_values, cat_formulae, param_names, data):
 
     # Construct the assignment dictionary
     ass = dict(zip(param_names, param_values))
+    if static_params:
+        ass.update(static_params)
 
     # Compute the individual RMSE values
-    cat_probs = np.array([lh.eval_formula(f, ass) for f in cat_formulae])
-    preds = data.sum() * cat_probs
+    cat_probs = lh.category_probabilities(cat_formulae, ass)
+    preds = lh.tree_totals(cat_formulae, data) * cat_probs
     return np.sqrt(np.mean((preds - data) ** 2))
 
 
-def fit_classical(fun, cat_formulae, free_params, static_params, data, n_optim=10):
+def grad_llik(param_values, model, param_names, data, static_params):
+    """ Gradient of optim_llik w.r.t. the parameter values
+
+    Parameters
+    ----------
+    param_values : list(float)
+        List of parameter values.
+
+    model : CompiledMPT
+        The compiled model.
+
+    param_names : list(str)
+        List of parameter identifier strings.
+
+    data : ndarray
+        Data array.
+
+    static_params : dict
+        Values of the parameters that are not optimized.
+
+    Returns
+    -------
+    ndarray
+        Derivatives of the negative log likelihood in the order of
+        param_names.
+
+    """
+
+    ass = dict(zip(param_names, param_values))
+    ass.update(static_params)
+
+    grad = model.log_likelihood_gradient(model.theta(ass), data)
+    return -grad[[model.param_index[param] for param in param_names]]
+
+
+def fit_classical(fun, model, free_params, static_params, data, n_optim=10,
+                  jac=None, x0=None):
     """ Fits an MPT model using classical function-based optimization routines
     implemented in the Scipy module.
 
@@ -112,12 +167,15 @@ def fit_classical(fun, cat_formulae, free_params, static_params, data, n_optim=1
     fun : function
         Function to be optimized (e.g. optim_llik or optim_rmse).
 
-    cat_formulae : list(str)
-        List of MPT category formulae.
+    model : list(str) or CompiledMPT
+        List of MPT category formulae or the compiled model.
 
-    param_names : list(str)
+    free_params : list(str)
         List of parameter identifier strings.
 
+    static_params : dict
+        Values of the parameters that are not optimized.
+
     data : ndarray
         Data array.
 
@@ -126,6 +184,16 @@ def fit_classical(fun, cat_formulae, free_params, static_params, data, n_optim=1
         running into local minima). In case of convergence errors, the runs are
         not repeated.
 
+    jac : function, optional
+        Gradient of fun with the same arguments (e.g. grad_llik). Default:
+        numerical approximation.
+
+    x0 : dict, optional
+        Initial estimates {parameter : value} of the first run (e.g. the
+        estimates of a similar model), missing parameters start at random
+        values. If the warm start converges, only WARM_RESTARTS random runs
+        follow unless one of them finds a better minimum.
+
     Returns
     -------
     scipy.optimize.OptimizeResult
@@ -151,26 +219,46 @@ def fit_classical(fun, cat_formulae, free_params, static_params, data, n_optim=1
 
     """
 
+    # SciPy is slow to import and only needed once a model is fitted
+    from scipy.optimize import minimize
+
     best_res = None
+    warm_res = None
     n_errs = 0
-    for _ in range(n_optim):
+    n_runs = n_optim
+    run = 0
+    while run < n_runs:
         # Initialize the parameter set
         init_params = np.random.uniform(0.01, 0.99, size=(len(free_params),))
+        warm = run == 0 and x0 is not None
+        if warm:
+            init_params = np.clip(
+                [x0.get(param, value)
+                 for param, value in zip(free_params, init_params)],
+                *BOUNDS)
+        run += 1
 
         # Perform the optimization
         res = minimize(
             fun=fun,
             x0=init_params,
-            args=(cat_formulae, free_params, data, static_params),
+            args=(model, free_params, data, static_params),
+            jac=jac,
             method='L-BFGS-B',
-            bounds=[(0.000001, 0.999999)] * len(init_params))
+            bounds=[BOUNDS] * len(init_params))
 
         # In case of success, compare the result with the best observed so far
         # and update if better.
         if res.success:
             if not best_res or best_res.fun > res.fun:
                 best_res = res
+            if warm:
+                warm_res = res
+                n_runs = min(n_optim, 1 + WARM_RESTARTS)
+            elif warm_res is not None and res.fun < warm_res.fun - WARM_TOL:
+                # the warm start missed the minimum
+                n_runs = n_optim
         else:
             n_errs += 1
 
-    return best_res, n_errs / n_optim
+    return best_res, n_errs / run
@@ -2,17 +2,18 @@
 
 """
 
-import math
-import re
-
 import numpy as np
 
-from mptpy.fitting import fitter
+from mptpy.fitting import count_data, fitter
+from mptpy.properties import properties
+from mptpy.tools import joint_tree
+from mptpy.tools.parsing import Parser
 from . import likelihood as lh
 from . import optimize as optim
 
 
 FUNCS = {"rmse": optim.optim_rmse, "llik": optim.optim_llik}
+GRADS = {"llik": optim.grad_llik}
 
 
 # def __init__(self, data_path, sep=',', func="rmse", header=None):
@@ -47,28 +48,20 @@ def fit_easy(
         BIC, GSQ, Likelihood (and optionally FIA)
 
     """
-    # read the file
-    easy = open(easy_file_path, 'r')
-    cat_formulae = easy.readlines()
-    cat_formulae = [formula.strip().split(" #")[0]
-                    for formula in cat_formulae]
-    easy.close()
-
-    # find all parameters
-    pattern = re.compile(r"[A-z_]+\d*")
-    params = []
-    for line in cat_formulae:
-        params.extend(pattern.findall(line))
-    params = list(set(params))
-
-    # setup kwargs and fit
-    kwargs = _setup_args(cat_formulae, params, func, data_path, sep)
-    return _fit(kwargs, n_optim=n_optim)
+
+    mpt = Parser().parse(easy_file_path)
+    return fit_mpt(mpt, func, data_path, sep=sep, n_optim=n_optim,
+                   use_fia=use_fia)
 
 
 def fit_mpt(mpt, func, data_path, sep=',', n_optim=10, use_fia=False):
     """ Fit the given tree using SciPy
 
+    Multi-tree models are fitted natively, i.e. the category probabilities
+    are normalized per tree. Single trees that were joined from several
+    trees with dummy nodes (see `joint_tree.join_nodes`) keep their dummy
+    parameters fixed to the observed tree proportions.
+
     Parameters
     ----------
     mpt : MPT
@@ -87,40 +80,128 @@ def fit_mpt(mpt, func, data_path, sep=',', n_optim=10, use_fia=False):
         BIC, GSQ, Likelihood (and optionally FIA)
 
     """
-    # TODO what to do with restricted parameters?
+
+    data = fitter.read_data(data_path, sep,
+                            n_categories=len(mpt.compile().categories))
+    return fit_data(mpt, func, data, n_optim=n_optim, use_fia=use_fia)
+
+
+def fit_data(mpt, func, data, n_optim=10, use_fia=False, x0=None):
+    """ Fit the given tree to a data array using SciPy. All rows of the
+    data are fitted jointly with shared parameters.
+
+    Parameters
+    ----------
+    mpt : MPT
+        mpt model
+
+    data : ndarray
+        (categories,) or (rows, categories) observations
+
+    n_optim : int, optional
+        number of optimization steps
+
+    x0 : dict, optional
+        initial estimates {parameter : value} of the first optimization
+        step (see optimize.fit_classical)
+
+    Returns
+    -------
+    dict
+        BIC, GSQ, Likelihood (and optionally FIA)
 
     """
-    if mpt.prefix_tree is not None:
-        # the model consists of several subtrees, create restriction files
-        self._clear_temp_dir("temp/")
-        self._compute_parameter_ratios(mpt, "temp/")
+
+    kwargs = _setup_args(mpt, func, data)
+    kwargs['x0'] = x0
+    return _fit(kwargs, n_optim=n_optim)
+
+
+def fit_compiled(model, func, data, n_optim=10, x0=None):
+    """ Fit a compiled model (e.g. a submodel compiled by
+    compiled_mpt.ParentModel) to a data array. All parameters are fitted
+    numerically.
+
+    Parameters
+    ----------
+    model : CompiledMPT
+        compiled model
+
+    data : ndarray
+        (categories,) or (rows, categories) observations
+
+    n_optim : int, optional
+        number of optimization steps
+
+    x0 : dict, optional
+        initial estimates {parameter : value} of the first optimization
+        step (see optimize.fit_classical)
+
+    Returns
+    -------
+    dict
+        BIC, GSQ, Likelihood
+
     """
 
-    cat_formulae = _get_cat_formulae(mpt)
+    kwargs = {'fun': FUNCS[func],
+              'jac': GRADS.get(func),
+              'model': model,
+              'free_params': sorted(model.params),
+              'static_params': {},
+              'closed_params': {},
+              'x0': x0}
+    return _fit(_with_data(kwargs, data), n_optim=n_optim)
 
-    params = list(set(mpt.word.parameters))
-    static_params = [x for x in params if x.startswith('y')]
-    free_params = [x for x in params if not x.startswith('y')]
 
-    kwargs = _setup_args(cat_formulae, free_params, func, data_path, sep)
-    static_params = _determine_static_params_values(cat_formulae, static_params, kwargs['data'])
-    kwargs['static_params'] = static_params
-    return _fit(kwargs, n_optim=n_optim)
+def fit_batch(mpt, func, data_path, sep=',', n_optim=10,
+              block_size=count_data.DEFAULT_BLOCK_SIZE):
+    """ Fit the given tree to every row (e.g. participant) of the data
+    separately. The data file is streamed in blocks of rows.
+
+    Parameters
+    ----------
+    mpt : MPT
+        mpt model
+
+    data_path : str
+        path to the data file (CSV or binary count format)
 
-def _determine_static_params_values(cat_formulae, static_params, data):
-    data = np.array(data)
+    n_optim : int, optional
+        number of optimization steps
 
-    split_index = [[y.replace(' ', '') for y in re.split(r'[\+\* \(\)]+', x)] for x in cat_formulae]
-    split_index = list(zip(split_index, range(len(split_index))))
+    block_size : int, optional
+        maximal number of rows read into memory at once
 
-    static_assignment = {}
-    for param in static_params:
-        indices_pos = [y for x, y in split_index if param in x]
-        indices_neg = [y for x, y in split_index if '1-{}'.format(param) in x]
+    Yields
+    ------
+    dict
+        fit result for each row
 
-        static_assignment[param] = data[indices_pos].sum() / (data[indices_pos].sum() + data[indices_neg].sum())
+    """
+
+    reader = count_data.iter_blocks(
+        data_path, sep=sep, n_categories=len(mpt.compile().categories),
+        block_size=block_size)
+
+    kwargs = None
+    for block in reader:
+        if kwargs is None:
+            kwargs = _setup_args(mpt, func, block[0])
+
+        # static and closed-form parameter values of the whole block at once
+        static_params = list(kwargs['static_params'])
+        static_values = fitter.join_param_ratios(
+            kwargs['model'], static_params, block)
+        closed_params = list(kwargs['closed_params'])
+        closed_values = _closed_form(kwargs['model'], closed_params, block)
+
+        for row, static, closed in zip(block, static_values, closed_values):
+            kwargs = dict(kwargs, data=np.asarray(row),
+                          static_params=dict(zip(static_params, static)),
+                          closed_params=dict(zip(closed_params, closed)))
+            yield _fit(kwargs, n_optim=n_optim)
 
-    return static_assignment
 
 def _fit(kwargs, n_optim=10):
     """ Fit the model
@@ -128,19 +209,32 @@ def _fit(kwargs, n_optim=10):
     Parameters
     ----------
     kwargs : dict
-        func, data, cat_formulae, param_names
+        fun, jac, data, model, free_params, static_params, closed_params,
+        optionally x0
 
     """
 
-    res, errs = optim.fit_classical(**kwargs, n_optim=n_optim)
+    fit_args = dict(kwargs)
+    fit_args['static_params'] = dict(kwargs['static_params'],
+                                     **fit_args.pop('closed_params'))
+
+    if kwargs['free_params']:
+        res, errs = optim.fit_classical(**fit_args, n_optim=n_optim)
+    else:
+        # all parameters estimated in closed form, nothing to optimize
+        res = ClosedFormResult(
+            x=np.zeros(0), fun=kwargs['fun'](
+                [], fit_args['model'], [], fit_args['data'],
+                fit_args['static_params']))
+        errs = 0
     #print(res)
 
     # Compute the correct criteria (without ignoring factorials)
     measures = _compute_measures(res, kwargs)
 
     result = {
-        'n_params': len(kwargs['free_params']),
-        'n_datasets': len(kwargs['data']),
+        'n_params': measures['n_params'],
+        'n_datasets': len(np.atleast_2d(kwargs['data'])),
         'func_min': res.fun,
         'LogLik': measures['llik'],
         'LogLik-R': measures['llik-r'],
@@ -163,21 +257,24 @@ def _compute_measures(res, kwargs):
     """ Compute the correct criteria (without ignoring factorials)
     """
     data = kwargs['data']
-    formulae = kwargs['cat_formulae']
+    model = kwargs['model']
 
-    free_params = kwargs['free_params']
-    measures = {}
+    # closed-form parameters are estimated as well
+    free_params = kwargs['free_params'] + list(kwargs['closed_params'])
+    measures = {'n_params': len(free_params)}
     measures['ass'] = dict(list(zip(kwargs['free_params'], res.x)))
+    measures['ass'].update(kwargs['closed_params'])
     measures['ass'].update(kwargs['static_params'])
 
-    probabilities = lh.category_probabilities(formulae, measures['ass'])
-    predicted_data = predict_data(probabilities, data.sum())
+    probabilities = lh.category_probabilities(model, measures['ass'])
+    predicted_data = predict_data(probabilities, model.tree_totals(data))
 
     # Compute the RMSE
     measures['rmse'] = _rmse(data, predicted_data)
 
     measures['llik'] = lh.log_likelihood(
-        probabilities, data, ignore_factorials=False)
+        probabilities, data, ignore_factorials=False,
+        cat_trees=model.cat_trees)
     measures['llik-r'] = lh.log_likelihood(
         probabilities, data, ignore_factorials=True)
     measures['aic'] = -2 * measures['llik'] + 2 * len(free_params)
@@ -204,7 +301,10 @@ def predict_data(probabilities, N):
 
 
 def _g2(data, predict_data):
-    g2 = 2 * np.sum(data * np.log(data / predict_data))
+    # empty categories do not contribute (0 * log(0) = 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(data > 0, data * np.log(data / predict_data), 0)
+    g2 = 2 * np.sum(terms)
     return g2
 
 def _rmse(observed, predicted):
@@ -221,45 +321,116 @@ def _rmse(observed, predicted):
     return np.sqrt((np.sum((predicted - observed) ** 2)) / len(predicted))
 
 
-def _get_cat_formulae(mpt):
-    """ Retrieve categories and respective formulae
+def _setup_args(mpt, func, data):
+    """ Compute the arguments needed for the fitting
 
     Parameters
     ----------
     mpt : MPT
-        model
+        MPT to be fitted
 
+    func : str
+        objective function, key of FUNCS
+
+    data : ndarray
+        observations
+
+    Returns
+    -------
+    dict
     """
+    model = mpt.compile()
 
-    values = []
-    for _, value in mpt.formulae().items():
-        values.append(" + ".join(value))
+    static_params = []
+    if len(mpt.trees) == 1 and len(mpt.subtrees) > 1:
+        static_params = joint_tree.join_params(mpt.root, len(mpt.subtrees))
 
-    return values
+    # separable parameters maximize the likelihood in closed form. For other
+    # objectives this only holds if all parameters are separable, the model
+    # then reproduces the observed proportions exactly.
+    estimated = [x for x in model.params if x not in static_params]
+    closed_params = [x for x in properties.separable_params(mpt)
+                     if x not in static_params]
+    if func != 'llik' and len(closed_params) < len(estimated):
+        closed_params = []
 
+    kwargs = {}
+    kwargs['fun'] = FUNCS[func]
+    kwargs['jac'] = GRADS.get(func)
+    kwargs['model'] = model
+    kwargs['free_params'] = sorted(
+        x for x in estimated if x not in closed_params)
+    kwargs['static_params'] = dict.fromkeys(static_params)
+    kwargs['closed_params'] = dict.fromkeys(closed_params)
 
-def _setup_args(cat_formulae, free_params, func, data_path, sep=','):
-    """ Compute the arguments needed for the fitting
+    return _with_data(kwargs, data)
+
+
+def _with_data(kwargs, data):
+    """ Arguments for fitting the same model to other data
 
     Parameters
     ----------
-    mpt : MPT
-        MPT to be fitted
+    kwargs : dict
+        arguments computed by _setup_args
+
+    data : ndarray
+        observations
 
     Returns
     -------
     dict
     """
-    kwargs = {}
-    kwargs['fun'] = FUNCS[func]
+    kwargs = dict(kwargs)
+    kwargs['data'] = np.asarray(data)
+
+    if kwargs['static_params']:
+        static_params = list(kwargs['static_params'])
+        static_values = fitter.join_param_ratios(
+            kwargs['model'], static_params,
+            np.atleast_2d(kwargs['data']).sum(axis=0))
+        kwargs['static_params'] = dict(zip(static_params, static_values))
+
+    if kwargs['closed_params']:
+        closed_params = list(kwargs['closed_params'])
+        closed_values = _closed_form(
+            kwargs['model'], closed_params,
+            np.atleast_2d(kwargs['data']).sum(axis=0))
+        kwargs['closed_params'] = dict(zip(closed_params, closed_values))
+
+    return kwargs
+
 
-    data = np.array(fitter.read_data(data_path, sep))
-    kwargs['data'] = data
+def _closed_form(model, params, data):
+    """ Maximum likelihood estimates of separable parameters
 
-    #ed = self._compute_parameter_ratios(mpt, data)
+    Parameters
+    ----------
+    model : CompiledMPT
+        compiled model
 
-    kwargs['cat_formulae'] = cat_formulae
+    params : [str]
+        separable parameters (see properties.separable_params)
 
-    kwargs['free_params'] = sorted(free_params)
+    data : ndarray
+        (..., n_categories) observations
 
-    return kwargs
+    Returns
+    -------
+    ndarray
+        (..., len(params)) estimates within the bounds of the optimizer
+    """
+    return np.clip(fitter.join_param_ratios(model, params, data),
+                   *optim.BOUNDS)
+
+
+class ClosedFormResult(object):
+    """ Optimization result of a model without numerically fitted
+    parameters, mirrors the used fields of scipy's OptimizeResult
+
+    """
+
+    def __init__(self, x, fun):
+        self.x = x
+        self.fun = fun
+        self.success = True
@@ -2,9 +2,11 @@
 
 """
 
+from mptpy.compiled_mpt import CompiledMPT
 from mptpy.mpt_word import MPTWord
+from mptpy.node import Node, flatten
 import mptpy.tools.transformations as trans  # pylint: disable=import-error
-from mptpy.visualization.visualize_mpt import cmd_draw  # pylint: disable=import-error
+from mptpy.tools import joint_tree
 from mptpy.tools import misc
 
 
@@ -18,28 +20,82 @@ class MPT(object):
 
         Parameters
         ----------
-        mpt : [str, Node]
-            either tree in bmpt or as root object.
+        mpt : [str, Node, list]
+            either tree in bmpt, as root object or a list of root objects
+            of the trees of a multi-tree model.
 
         """
 
         self.subtrees = []
-        self.word = None
-        self.root = None
+        self.compiled = None
+        self._formulae = None
+        self.sep = sep
+        self.leaf_test = leaf_test
+        self._word = None
+        self._root = None
 
         # mpt given as word
         if isinstance(mpt, str):
-            self.word = MPTWord(mpt, sep=sep, leaf_test=leaf_test)
-            self.root = trans.word_to_nodes(self.word)
+            self._word = MPTWord(mpt, sep=sep, leaf_test=leaf_test)
+            self._root = trans.word_to_nodes(self._word)
+            self.trees = [self._root]
 
         # mpt given as root node
+        elif isinstance(mpt, Node):
+            self._root = mpt
+            self.trees = [mpt]
+
+        # mpt given as list of trees
         else:
-            self.root = mpt
-            self.word = MPTWord(str(self))
+            self.trees = list(mpt)
+            if len(self.trees) == 1:
+                self._root = self.trees[0]
+
+    @property
+    def root(self):
+        """ Root node of the model. Multi-tree models are represented
+        as a single tree by joining the trees with dummy nodes (built on
+        first use).
+
+        """
+
+        if self._root is None:
+            self._root = joint_tree.join_nodes(self.trees)
+        return self._root
+
+    @property
+    def word(self):
+        """ The model in the BMPT language (built on first use)
+
+        """
+
+        if self._word is None:
+            self._word = MPTWord(str(self), sep=self.sep,
+                                 leaf_test=self.leaf_test)
+        return self._word
+
+    def compile(self):
+        """ Compile the branch structure of the model (cached)
+
+        Returns
+        -------
+        CompiledMPT
+            branch structure and parameter index table
+
+        """
+
+        if self.compiled is None:
+            self.compiled = CompiledMPT.from_trees(self.trees)
+        return self.compiled
 
     @property
     def params(self):
-        return self.word.parameters
+        """ The parameters of the trees, with duplicates
+
+        """
+
+        return [content for root in self.trees
+                for content, inner in zip(*flatten(root)) if inner]
 
     @property
     def categories(self):
@@ -47,6 +103,7 @@ class MPT(object):
 
     def formulae(self):
         """ Calculate the branch formulae for the categories in the tree
+        (cached)
 
         Returns
         -------
@@ -55,7 +112,9 @@ class MPT(object):
 
         """
 
-        return trans.get_formulae(self)
+        if self._formulae is None:
+            self._formulae = trans.get_formulae(self)
+        return self._formulae
 
     def max_parameters(self):
         """ The maximal number of free parameters in the model
@@ -67,7 +126,7 @@ class MPT(object):
 
         """
 
-        return sum([len(subtree) - 1 for subtree in self.subtrees])
+        return sum([len(root.categories()) - 1 for root in self.trees])
 
     def get_levels(self, node, level=0):
         """ Generate a dict with all nodes and their respective level
@@ -112,6 +171,8 @@ class MPT(object):
 
         """
 
+        # imported on use, the visualization is not needed for modelling
+        from mptpy.visualization.visualize_mpt import cmd_draw  # pylint: disable=import-error
         cmd_draw(self)
 
     def __eq__(self, other):
@@ -121,21 +182,7 @@ class MPT(object):
         return not self.__eq__(other)
 
     def __str__(self):
-        if self.word:
-            return self.word.str_
-
-        sep = " "
-
-        def dfs(node):
-            """ depth first search
-
-            """
-
-            if node.leaf:
-                return str(node.content)
-
-            pos = dfs(node.pos)
-            neg = dfs(node.neg)
-            return node.content + sep + pos + sep + neg
+        if self._word:
+            return self._word.str_
 
-        return dfs(self.root)
+        return self.sep.join(str(content) for content in flatten(self.root)[0])
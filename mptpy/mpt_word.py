@@ -4,7 +4,24 @@
 
 import string
 from itertools import filterfalse
-from collections import OrderedDict
+
+
+def is_digit_leaf(node):
+    """ Default leaf test: leaves are numbers
+
+    Parameters
+    ----------
+    node : str
+        node of the word
+
+    Returns
+    -------
+    boolean
+        whether the node is a leaf
+
+    """
+
+    return all([ch in string.digits for ch in node])
 
 
 class MPTWord(object):
@@ -18,11 +35,25 @@ class MPTWord(object):
 
         # defines what characterizes a leaf node
         if leaf_test is None:
-            self.is_leaf = lambda node: all(
-                [ch in string.digits for ch in node])
+            self.is_leaf = is_digit_leaf
         else:
             self.is_leaf = leaf_test
 
+    @property
+    def tokens(self):
+        """ The nodes of the word in prefix order (cached)
+
+        Returns
+        -------
+        list
+            list of the nodes
+
+        """
+
+        if getattr(self, '_tokens', (None,))[0] is not self.str_:
+            self._tokens = (self.str_, self.str_.split(self.sep))
+        return self._tokens[1]
+
     @property
     def answers(self):
         """ Return all the answers
@@ -34,8 +65,7 @@ class MPTWord(object):
 
         """
 
-        list_ = self.str_.split(self.sep)
-        return list(filter(self.is_leaf, list_))
+        return list(filter(self.is_leaf, self.tokens))
 
     @property
     def parameters(self):
@@ -48,8 +78,7 @@ class MPTWord(object):
 
         """
 
-        list_ = self.str_.split(self.sep)
-        return list(filterfalse(self.is_leaf, list_))
+        return list(filterfalse(self.is_leaf, self.tokens))
 
     def abstract(self):
         """ Calculate an abstract version of the tree
@@ -61,21 +90,19 @@ class MPTWord(object):
 
         """
 
-        abst = ""
+        abst = []
 
         # this retains the order
-        param_set = list(OrderedDict.fromkeys(self.parameters))
+        param_idx = {}
 
-        for node in self.str_.split(self.sep):
-            # add whitespace only after first node
-            if abst:
-                abst += self.sep
-            if node in self.answers:
-                abst += node
-            elif node in param_set:
-                abst += "p" + str(param_set.index(node))
+        for node in self.tokens:
+            if self.is_leaf(node):
+                abst.append(node)
+            else:
+                idx = param_idx.setdefault(node, len(param_idx))
+                abst.append("p" + str(idx))
 
-        return abst
+        return self.sep.join(abst)
 
     def split_pos_neg(self):
         """ Splits an MPT represented as a word from the formal MPT language
@@ -94,7 +121,7 @@ class MPTWord(object):
 
         expected_outcomes = 1
         pos = []
-        split_string = self.str_.split()
+        split_string = self.tokens
         for idx, item in enumerate(split_string[1:]):
             pos.append(item)
             if not self.is_leaf(item):
@@ -107,7 +134,7 @@ class MPTWord(object):
                     split_string[idx + 2:])
 
     def __len__(self):
-        return len(self.str_.split(sep=self.sep))
+        return len(self.tokens)
 
     def __eq__(self, other):
         return self.str_ == other.str_
@@ -124,8 +151,7 @@ class MPTWord(object):
         return new
 
     def __getitem__(self, idx):
-        return list(self)[idx]
+        return self.tokens[idx]
 
     def __iter__(self):
-        list_ = self.str_.split(sep=self.sep)
-        return iter(list_)
+        return iter(self.tokens)
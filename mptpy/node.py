@@ -1,17 +1,80 @@
 """ Data structure for Multinomial Processing Trees (MPTs) nodes.
 
+Nodes are hash-consed: constructing a node whose content and children equal
+those of a living node returns the existing object. Identical subtrees are
+therefore shared between all trees in memory, nodes are immutable, and
+equality reduces to an identity check.
+
 """
 
+from collections import Counter
+import weakref
+
 
 class Node(object):
     """ Class for MPT nodes
 
     """
 
-    def __init__(self, content, pos=None, neg=None):
-        self.content = content
-        self.pos = pos
-        self.neg = neg
+    __slots__ = ('_content', '_pos', '_neg', '_len', '_hash', '_cats',
+                 '__weakref__')
+
+    # intern table {(content, pos, neg): node}. Entries vanish as soon as the
+    # last tree referencing the node is garbage collected.
+    _table = weakref.WeakValueDictionary()
+
+    def __new__(cls, content, pos=None, neg=None):
+        if (pos is None) != (neg is None):
+            raise ValueError(
+                "Inner node '{}' requires both a positive and a negative "
+                "child".format(content))
+
+        key = (content, pos, neg)
+        node = cls._table.get(key)
+        if node is not None:
+            return node
+
+        node = super().__new__(cls)
+        init = super(Node, node).__setattr__
+        init('_content', content)
+        init('_pos', pos)
+        init('_neg', neg)
+        # the category multiset is computed on first use
+        init('_cats', None)
+
+        if pos is None:
+            init('_len', 1)
+            init('_hash', hash((content,)))
+        else:
+            init('_len', 1 + pos._len + neg._len)
+            init('_hash', hash((content, pos._hash, neg._hash)))
+
+        cls._table[key] = node
+        return node
+
+    @property
+    def content(self):
+        """ Parameter (inner node) or category (leaf) of the node
+
+        """
+
+        return self._content
+
+    @property
+    def pos(self):
+        """ Positive (success) child, None for leaves
+
+        """
+
+        return self._pos
+
+    @property
+    def neg(self):
+        """ Negative (failure) child, None for leaves
+
+        """
+
+        return self._neg
 
     @property
     def leaf(self):
@@ -19,7 +82,7 @@ class Node(object):
 
         """
 
-        return self.pos is None
+        return self._pos is None
 
     def answers(self):
         """ Reachable answer categories from this node
@@ -31,10 +94,46 @@ class Node(object):
 
         """
 
-        if self.leaf:
-            return [self.content]
+        answers = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                answers.append(node.content)
+            else:
+                stack.append(node.neg)
+                stack.append(node.pos)
+
+        return answers
 
-        return self.pos.answers() + self.neg.answers()
+    def categories(self):
+        """ Multiset of the answer categories reachable from this node
+
+        Returns
+        -------
+        Counter
+            {category : number of leaves}, a copy of the cached multiset
+
+        """
+
+        if self._cats is None:
+            # post-order over the subtrees that were not counted yet
+            stack = [(self, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if node._cats is not None:
+                    continue
+                if node.leaf:
+                    cats = Counter([node.content])
+                elif expanded:
+                    cats = node.pos._cats + node.neg._cats
+                else:
+                    stack.extend([(node, True), (node.neg, False),
+                                  (node.pos, False)])
+                    continue
+                super(Node, node).__setattr__('_cats', cats)
+
+        return Counter(self._cats)
 
     def __len__(self):
         """ Number of nodes in the subtree where the
@@ -47,20 +146,91 @@ class Node(object):
 
         """
 
-        if self.leaf:
-            return 1
-
-        return 1 + len(self.pos) + len(self.neg)
+        return self._len
 
     def __str__(self):
-        if self.leaf:
-            return self.content
-        return self.content + " " + str(self.pos) + " " + str(self.neg)
+        return " ".join(flatten(self)[0])
+
+    def __repr__(self):
+        return "Node({!r})".format(str(self))
+
+    def __hash__(self):
+        return self._hash
 
     def __eq__(self, other):
-        pos_subtree = self.pos == other.pos
-        neg_subtree = self.neg == other.neg
-        return self.content == other.content and pos_subtree and neg_subtree
+        # interning guarantees that structurally equal nodes are identical
+        return self is other
 
     def __ne__(self, other):
         return not self.__eq__(other)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Node objects are immutable")
+
+    def __reduce__(self):
+        contents, inner = flatten(self)
+        return unflatten, (contents, inner)
+
+
+def flatten(root):
+    """ Flatten a tree into its prefix (BMPT) order
+
+    Parameters
+    ----------
+    root : Node
+        root of the tree
+
+    Returns
+    -------
+    tuple, tuple
+        node contents and whether the respective node is an inner node
+
+    """
+
+    contents = []
+    inner = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        contents.append(node.content)
+        inner.append(not node.leaf)
+        if not node.leaf:
+            stack.append(node.neg)
+            stack.append(node.pos)
+
+    return tuple(contents), tuple(inner)
+
+
+def unflatten(contents, inner):
+    """ Build the (interned) tree from its prefix order
+
+    Parameters
+    ----------
+    contents : iterable
+        node contents in prefix order
+
+    inner : iterable
+        whether the respective node is an inner node
+
+    Returns
+    -------
+    Node
+        root node
+
+    """
+
+    stack = []
+    for content, is_inner in zip(reversed(contents), reversed(inner)):
+        if is_inner:
+            if len(stack) < 2:
+                raise ValueError("Prefix order does not describe a single tree")
+            pos = stack.pop()
+            neg = stack.pop()
+            stack.append(Node(content, pos, neg))
+        else:
+            stack.append(Node(content))
+
+    if len(stack) != 1:
+        raise ValueError("Prefix order does not describe a single tree")
+
+    return stack[0]
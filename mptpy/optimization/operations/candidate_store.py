@@ -0,0 +1,233 @@
+""" On-disk store of deletion candidates.
+
+Candidates are masks over the tokens of the parent tree (in BMPT order).
+They are stored bit-packed with a fixed record size, so that the file can be
+memory-mapped and every candidate is accessed in constant time:
+
+    magic       8 bytes     b'MPTDEL01'
+    n_records   uint64
+    n_tokens    uint64
+    meta_len    uint64
+    meta        meta_len bytes of JSON {"tokens": [..], "sep": " "}
+    padding     up to the next multiple of 64 bytes
+    records     n_records x ceil(n_tokens / 8) bytes (np.packbits)
+
+"""
+
+import itertools as it
+import json
+import os
+import struct
+
+import numpy as np
+
+from mptpy.mpt_word import MPTWord
+
+
+STORE_MAGIC = b'MPTDEL01'
+_HEADER = struct.Struct('<8sQQQ')
+_ALIGN = 64
+
+# number of records written at once
+WRITE_BATCH = 10000
+
+
+class CandidateStore(object):
+    """ Memory-mapped, bit-packed deletion candidates
+
+    """
+
+    def __init__(self, path):
+        """ Maps the candidate file.
+
+        Parameters
+        ----------
+        path : str
+            path to the candidate file
+
+        """
+
+        self.path = path
+
+        with open(path, 'rb') as store_file:
+            magic, n_records, n_tokens, meta_len = _HEADER.unpack(
+                store_file.read(_HEADER.size))
+            if magic != STORE_MAGIC:
+                raise ValueError("{}: not a candidate store".format(path))
+            meta = json.loads(store_file.read(meta_len).decode())
+
+        self.tokens = np.array(meta['tokens'], dtype=object)
+        self.sep = meta['sep']
+        self.n_tokens = n_tokens
+
+        record_size = _record_size(n_tokens)
+        if n_records:
+            self.records = np.memmap(path, dtype=np.uint8, mode='r',
+                                     offset=_data_offset(meta_len),
+                                     shape=(n_records, record_size))
+        else:
+            self.records = np.zeros((0, record_size), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.records)
+
+    def masks(self, indices):
+        """ Unpacked masks of the given candidates
+
+        Parameters
+        ----------
+        indices : array_like
+            candidate indices
+
+        Returns
+        -------
+        ndarray
+            (len(indices), n_tokens) boolean masks over the parent tokens
+
+        """
+
+        return np.unpackbits(self.records[np.asarray(indices)], axis=-1,
+                             count=self.n_tokens).astype(bool)
+
+    def __getitem__(self, idx):
+        """ Candidate as BMPT string
+
+        """
+
+        if not -len(self) <= idx < len(self):
+            raise IndexError("candidate index out of range")
+        return self.sep.join(self.tokens[self.masks(idx)])
+
+    def __iter__(self):
+        for start in range(0, len(self), WRITE_BATCH):
+            masks = self.masks(np.arange(start, min(start + WRITE_BATCH,
+                                                    len(self))))
+            for mask in masks:
+                yield self.sep.join(self.tokens[mask])
+
+    def word(self, idx, leaf_test=None):
+        """ Candidate as MPT word
+
+        Parameters
+        ----------
+        idx : int
+            candidate index
+
+        leaf_test : function, optional
+            leaf test of the parent tree
+
+        Returns
+        -------
+        MPTWord
+
+        """
+
+        return MPTWord(self[idx], sep=self.sep, leaf_test=leaf_test)
+
+    def sample(self, n_samples, leaf_test=None, random_state=None):
+        """ Draw random candidates (with replacement)
+
+        Parameters
+        ----------
+        n_samples : int
+            number of candidates
+
+        leaf_test : function, optional
+            leaf test of the parent tree
+
+        random_state : numpy.random.RandomState, optional
+            random number generator. Default: numpy's global generator.
+
+        Returns
+        -------
+        [MPTWord]
+
+        """
+
+        if random_state is None:
+            random_state = np.random
+        indices = random_state.randint(0, len(self), size=n_samples)
+        return [MPTWord(self.sep.join(self.tokens[mask]), sep=self.sep,
+                        leaf_test=leaf_test)
+                for mask in self.masks(indices)]
+
+
+def pack(mask):
+    """ Bit-pack a candidate mask
+
+    Parameters
+    ----------
+    mask : iterable
+        0/1 flags over the parent tokens
+
+    Returns
+    -------
+    bytes
+        packed record
+
+    """
+
+    return np.packbits(np.frombuffer(bytes(mask), dtype=np.uint8)).tobytes()
+
+
+def write_store(path, tokens, records, sep=" "):
+    """ Write packed candidates to a store in batches
+
+    Parameters
+    ----------
+    path : str
+        path of the candidate file, its directory is created if needed
+
+    tokens : [str]
+        tokens of the parent tree
+
+    records : iterable
+        packed masks (see pack)
+
+    sep : str, optional
+        token separator of the parent tree
+
+    Returns
+    -------
+    int
+        number of written candidates
+
+    """
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    meta = json.dumps({'tokens': list(tokens), 'sep': sep}).encode()
+    record_size = _record_size(len(tokens))
+
+    n_records = 0
+    records = iter(records)
+    with open(path, 'wb') as store_file:
+        store_file.write(_HEADER.pack(STORE_MAGIC, 0, len(tokens), len(meta)))
+        store_file.write(meta)
+        store_file.write(b'\0' * (_data_offset(len(meta)) - store_file.tell()))
+
+        while True:
+            batch = list(it.islice(records, WRITE_BATCH))
+            if not batch:
+                break
+            if any(len(record) != record_size for record in batch):
+                raise ValueError("records need {} bytes".format(record_size))
+            store_file.write(b''.join(batch))
+            n_records += len(batch)
+
+        store_file.seek(0)
+        store_file.write(_HEADER.pack(STORE_MAGIC, n_records, len(tokens),
+                                      len(meta)))
+
+    return n_records
+
+
+def _record_size(n_tokens):
+    return (n_tokens + 7) // 8
+
+
+def _data_offset(meta_len):
+    size = _HEADER.size + meta_len
+    return -(-size // _ALIGN) * _ALIGN
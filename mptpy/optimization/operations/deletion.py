@@ -1,26 +1,64 @@
 """ Interface for applying operations to MPTs.
 
+Deletion candidates of a subtree are masks over its tokens (in BMPT order).
+They are handled in blocks: a (n, len(subtree)) array of masks together with
+the categories each candidate covers as bitsets, (n, n_words) uint64. The
+candidates of an inner node combine all pairs of candidates of its children
+with NumPy broadcasting.
+
+With n_jobs > 1 the candidates of the two subtrees of the root are
+generated in parallel worker processes, and the product of the root is split
+into chunks of left candidates. The right candidates are shared with the
+workers and the results are returned through memory-mapped files (in
+/dev/shm where available), so no process copies them; the chunks are merged
+in their original order, so the output does not depend on n_jobs.
+
+Without enumeration, the candidates are counted by dynamic programming over
+the tree: the state of a subtree is the set of categories its candidate
+covers among the categories that also occur outside of the subtree (the
+ones occurring only inside have to be covered anyway). This allows to draw
+uniform samples and to unrank candidates of large trees, as long as the
+categories shared between a subtree and the rest of the tree are few (the
+number of states grows exponentially with them).
+
 """
 import sys
 import os
 import itertools as it
-from functools import partial
-from collections import Counter
+import random
+import tempfile
+from bisect import bisect_right
+from collections import Counter, defaultdict, deque
 
-from tqdm import tqdm
+import numpy as np
 
 from mptpy.optimization.operations.operation import Operation
+from mptpy.optimization.operations import candidate_store
 from mptpy import mpt_word
-from mptpy.tools import misc
+from mptpy.node import flatten
+from mptpy.tools import external_sort
+
+
+# subtrees with at most this many candidates are kept in memory, larger
+# candidate sets are regenerated for every pass over them
+CACHE_LIMIT = 100000
 
+# maximal number of left x right pairs evaluated at once
+PAIR_BUDGET = 1000000
 
-DELETION_FLAG = 2
+# number of chunks per worker process in parallel mode
+CHUNKS_PER_JOB = 4
+
+# ways to build a candidate of a node in the counting tables
+_FULL, _BOTH, _LEFT, _RIGHT = range(4)
 
 
 class Deletion():
     """ Parameter deletion operation on MPTs """
 
-    def __init__(self, mpt, ignore_params=None, out='../out/out.txt'):
+    def __init__(self, mpt, ignore_params=None, out='../out/out.bin',
+                 run_size=external_sort.RUN_SIZE, cache_limit=CACHE_LIMIT,
+                 n_jobs=1):
         if ignore_params is None:
             ignore_params = []
         self.mpt = mpt
@@ -28,56 +66,142 @@ class Deletion():
         self.ignore_params = ignore_params
         self.out = out
         self.sep = self.mpt.word.sep
+        self.run_size = run_size
+        self.cache_limit = cache_limit
+        self.n_jobs = n_jobs
+        self._cache = {}
+        self._store = None
+        self._spaces = {}
+
+        # category bitsets
+        self._cat_bits = {cat: idx for idx, cat in enumerate(self.all_cats)}
+        self._n_words = max(1, (len(self._cat_bits) + 63) // 64)
+        self._all_bits = self.bitset(self.all_cats)
+
+    @property
+    def store(self):
+        """ Store of the generated candidates in the output file
+
+        """
+
+        if self._store is None:
+            self._store = candidate_store.CandidateStore(self.out)
+        return self._store
 
     def read_number(self, idx):
-        with open(self.out) as trees:
-            for i, line in enumerate(trees):
-                if i == idx:
-                    return line.strip()
+        return self.store[idx]
 
     def generate_candidates(self):
-        """ Generate all trees possible with this operation
+        """ Generate all trees possible with this operation. The candidates
+        are streamed, deduplicated by their abstract form with a bounded
+        amount of memory and written to the output file as bit-packed masks
+        over the tokens of the tree.
 
-        Parameters
-        ----------
-        mpt : MPT
-            mpt that is to be modified
+        Returns
+        -------
+        CandidateStore
+            memory-mapped candidates in the output file
         """
 
         print("Generating deletion candidates...")
+        sys.stdout.flush()
+
+        tokens = flatten(self.mpt.root)[0]
+        root = self.mpt.root
+        if self.n_jobs > 1 and not root.leaf and \
+                root.content not in self.ignore_params:
+            blocks = self._parallel_keyed()
+        else:
+            blocks = (self.keyed(masks)
+                      for masks, _ in self.iter_candidates(root))
+        keyed = it.chain.from_iterable(blocks)
+
+        directory = os.path.dirname(self.out)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        unique = (record for _, record in external_sort.unique_sorted(
+            keyed, run_size=self.run_size, tmp_dir=directory or None))
+
+        self._store = None
+        candidate_store.write_store(self.out, tokens, unique, sep=self.sep)
+        print("done")
+
+        return self.store
+
+    def keyed(self, masks):
+        """ Deduplication keys and packed records of candidates of the tree
 
-        levels = self.mpt.get_levels(self.mpt.root)
+        Parameters
+        ----------
+        masks : ndarray
+            (n, len(tree)) masks over the tokens of the tree
 
-        bin_s = []
-        for level in reversed(sorted(levels.keys())):
-            print('\n-------------------\nLevel {}'.format(level))
+        Returns
+        -------
+        [(str, bytes)]
+            abstract form and packed mask of each candidate
 
-            for node in levels[level]:
+        """
 
-                bin_s.append(self.possible_subtrees(node, bin_s[:2]))
-                if not node.leaf:
-                    # the first two are the left-most and deepest nodes
-                    bin_s = bin_s[2:]
-        print("Done!")
+        tokens = flatten(self.mpt.root)[0]
+        records = np.packbits(masks, axis=1)
+        return [(self.abstract(self.sep.join(it.compress(tokens, mask))),
+                 record.tobytes())
+                for mask, record in zip(masks, records)]
 
-        candidates = sorted(self.compressed(bin_s[0]), key=self.abstract)
+    def _parallel_keyed(self):
+        """ Keyed candidates of the tree, generated by a pool of processes
 
-        unique = []
-        print("remove redundancies")
-        sys.stdout.flush()
-        for _, group in it.groupby(candidates, key=self.abstract):
-            unique.append(list(group)[0])
-        print("done.")
-        print()
-        print("write to file")
-        f = open(self.out, 'w')
-        for cand in unique:
-            f.write(cand)
-            f.write("\n")
-        f.close()
-        print("done")
+        Yields
+        ------
+        [(str, bytes)]
+            blocks of keyed candidates in sequential order
+
+        """
 
-        return unique
+        from concurrent.futures import ProcessPoolExecutor
+
+        root = self.mpt.root
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+        with tempfile.TemporaryDirectory(dir=shm_dir) as buffer_dir, \
+                ProcessPoolExecutor(
+                    self.n_jobs, initializer=_init_worker,
+                    initargs=(self.mpt, self.ignore_params, self.cache_limit,
+                              buffer_dir)) as pool:
+            # the candidates of both subtrees are independent
+            left_paths, right_paths = pool.map(_subtree_task, [True, False])
+            if left_paths is None:
+                left = self.subtree_candidates(root.pos)
+            else:
+                left = [tuple(np.load(path) for path in left_paths)]
+            if right_paths is None:
+                right = self.subtree_candidates(root.neg)
+            else:
+                right = [tuple(np.load(path) for path in right_paths)]
+
+            n_right = len(right[0][0]) if isinstance(right, list) and \
+                right else 1
+            n_left = len(left[0][0]) if isinstance(left, list) and \
+                left else self.cache_limit
+            step = max(1, min(PAIR_BUDGET // (n_right + 1),
+                              -(-n_left // (CHUNKS_PER_JOB * self.n_jobs))))
+
+            # bounded number of chunks in flight, results in order
+            pending = deque()
+            for left_masks, left_cov in left:
+                for start in range(0, len(left_masks), step):
+                    pending.append(pool.submit(
+                        _product_task, np.array(left_masks[start:start + step]),
+                        np.array(left_cov[start:start + step]), right_paths))
+                    while len(pending) > 2 * self.n_jobs:
+                        yield _collect(pending.popleft().result())
+            while pending:
+                yield _collect(pending.popleft().result())
+
+            # the right subtree replacing the root
+            for masks, _ in self.combine(root, [], right):
+                yield self.keyed(masks)
 
     def abstract(self, candidate):
         """ Calls the abstraction function of the mpt word class
@@ -88,92 +212,365 @@ class Deletion():
         word = mpt_word.MPTWord(candidate, leaf_test=self.mpt.word.is_leaf)
         return word.abstract()
 
-    def compressed(self, binary):
-        res = []
-        for subtree in tqdm(binary):
-            candidate = self.sep.join(
-                (it.compress(str(self.mpt.root).split(self.sep), subtree)))
-            res.append(candidate)
-        return res
+    def count(self):
+        """ Number of candidates, counted without enumerating them. Counts
+        masks over the tokens of the tree, i.e. before the deduplication by
+        abstract form that generate_candidates applies.
 
-    def check_combination(self, cats_wo_node, subtree, comb):
-        """ Check if the given combination for the node is okay
+        Returns
+        -------
+        int
+            number of candidates (arbitrary precision)
+
+        """
+
+        _, table = self._space(self.mpt.root)
+        return sum(total for total, _, _ in table.values())
+
+    def unrank(self, idx):
+        """ Candidate with the given index in the counted candidate space
 
         Parameters
         ----------
-        rem_cats : Counter
-            Counter of the remaining categories in the tree using this combinatio
+        idx : int
+            index in [0, count())
 
-        """
+        Returns
+        -------
+        [int]
+            0/1 mask over the tokens of the tree
 
-        candidate = it.compress(subtree.split(self.sep), comb)
-        cats = Counter(filter(self.mpt.word.is_leaf, candidate))
-        rem_cats = cats_wo_node + cats
+        """
 
-        return all([key in rem_cats for key in self.all_cats.keys()])
+        _, table = self._space(self.mpt.root)
+        if idx < 0:
+            idx += self.count()
+        if idx >= 0:
+            for key, (total, _, _) in table.items():
+                if idx < total:
+                    return self._unrank(self.mpt.root, key, idx)
+                idx -= total
+        raise IndexError("candidate index out of range")
 
-    def substitute_flag(self, comb):
-        """ If the iterable contains a 'd' for delete, remove it and
-        insert a 0 to the first place. Else just insert a 1.
+    def sample(self, n_samples, leaf_test=None, random_state=None):
+        """ Draw candidates uniformly at random (with replacement) without
+        enumerating them
 
         Parameters
         ----------
-        comb : iterable
+        n_samples : int
+            number of candidates
+
+        leaf_test : function, optional
+            leaf test of the tree
+
+        random_state : random.Random, optional
+            random number generator. Default: Python's global generator.
 
         Returns
         -------
-        list
-            iterable without the d and with a 0 or 1 at [0]
+        [MPTWord]
 
         """
 
-        comb = list(comb)
-        if DELETION_FLAG in comb:
-            comb.remove(DELETION_FLAG)
-            comb.insert(0, 0)
+        if random_state is None:
+            random_state = random
+        n_candidates = self.count()
+        if not n_candidates:
+            raise ValueError("no valid deletion candidates")
+
+        tokens = flatten(self.mpt.root)[0]
+        words = []
+        for _ in range(n_samples):
+            mask = self.unrank(random_state.randrange(n_candidates))
+            words.append(mpt_word.MPTWord(
+                self.sep.join(it.compress(tokens, mask)), sep=self.sep,
+                leaf_test=leaf_test))
+        return words
+
+    def _space(self, node):
+        """ Counting table of the candidates of a subtree
+
+        Returns
+        -------
+        int, dict
+            bitset of the categories occurring only inside the subtree, and
+            {covered other categories : (number of candidates, ways to build
+            them, cumulative counts of the ways)}. A way is a tuple (kind,
+            left key, right key, number of candidates).
+
+        """
+
+        space = self._spaces.get(node)
+        if space is not None:
+            return space
+
+        cats = node.categories()
+        outside = self.all_cats - cats
+        exclusive = self._int_bits(cat for cat in cats if cat not in outside)
+        relevant = self._int_bits(cats) & ~exclusive
+
+        ways = defaultdict(list)
+
+        def add(kind, covered, left_key, right_key, n_candidates):
+            if covered & exclusive == exclusive:
+                ways[covered & relevant].append(
+                    (kind, left_key, right_key, n_candidates))
+
+        if node.leaf or node.content in self.ignore_params:
+            add(_FULL, self._int_bits(cats), None, None, 1)
         else:
-            comb.insert(0, 1)
-        return comb
+            left_excl, left = self._space(node.pos)
+            right_excl, right = self._space(node.neg)
+            for left_key, (n_left, _, _) in left.items():
+                for right_key, (n_right, _, _) in right.items():
+                    add(_BOTH, left_key | left_excl | right_key | right_excl,
+                        left_key, right_key, n_left * n_right)
+                add(_LEFT, left_key | left_excl, left_key, None, n_left)
+            for right_key, (n_right, _, _) in right.items():
+                add(_RIGHT, right_key | right_excl, None, right_key, n_right)
+
+        table = {}
+        for key, key_ways in ways.items():
+            offsets = list(it.accumulate(way[-1] for way in key_ways))
+            table[key] = (offsets[-1], key_ways, offsets)
+
+        space = (exclusive, table)
+        self._spaces[node] = space
+        return space
+
+    def _unrank(self, node, key, idx):
+        """ Mask of the idx-th candidate of a subtree with the given key
+
+        """
+
+        _, table = self._space(node)
+        _, key_ways, offsets = table[key]
+        way = bisect_right(offsets, idx)
+        kind, left_key, right_key, _ = key_ways[way]
+        if way:
+            idx -= offsets[way - 1]
+
+        if kind == _FULL:
+            return [1] * len(node)
+        if kind == _LEFT:
+            return [0] + self._unrank(node.pos, left_key, idx) + \
+                [0] * len(node.neg)
+        if kind == _RIGHT:
+            return [0] * (1 + len(node.pos)) + \
+                self._unrank(node.neg, right_key, idx)
+
+        n_right = self._space(node.neg)[1][right_key][0]
+        left_idx, right_idx = divmod(idx, n_right)
+        return [1] + self._unrank(node.pos, left_key, left_idx) + \
+            self._unrank(node.neg, right_key, right_idx)
+
+    def _int_bits(self, cats):
+        """ Bitset of categories as integer
 
-    def lazy_generation(self, check_func, left, right):
-        """ Itertools variation of the generation process.
+        """
+
+        bits = 0
+        for cat in cats:
+            bits |= 1 << self._cat_bits[cat]
+        return bits
+
+    def bitset(self, cats):
+        """ Bitset of categories
 
         Parameters
         ----------
-        check_func : func
-            (partial) function to check if the combination is possible
+        cats : iterable
+            categories
+
+        Returns
+        -------
+        ndarray
+            (n_words,) uint64 bitset
+
+        """
 
-        left : list
-            candidates for the left child
+        bits = np.zeros(self._n_words, dtype=np.uint64)
+        for cat in cats:
+            idx = self._cat_bits[cat]
+            bits[idx // 64] |= np.uint64(1) << np.uint64(idx % 64)
+        return bits
+
+    def coverage(self, node, masks):
+        """ Categories covered by candidates of a subtree
+
+        Parameters
+        ----------
+        node : Node
+            root of the subtree
 
-        right : list
-            candidates for the right child
+        masks : array_like
+            (n, len(node)) masks over the tokens of the subtree
 
         Returns
         -------
-        list
-            all possible deletion candidates
+        ndarray
+            (n, n_words) category bitsets
+
+        """
+
+        contents, inner = flatten(node)
+        token_bits = np.array([
+            np.zeros(self._n_words, dtype=np.uint64) if is_inner
+            else self.bitset([content])
+            for content, is_inner in zip(contents, inner)])
+
+        masks = np.asarray(masks, dtype=bool).reshape(-1, len(node))
+        return np.bitwise_or.reduce(
+            np.where(masks[..., np.newaxis], token_bits, np.uint64(0)),
+            axis=1)
+
+    def combine(self, node, left, right, replace_by_right=True):
+        """ Combine the candidates of the children of a node. The node is
+        either kept with both children or replaced by one of them. The
+        candidates are yielded in the order of the loop
+        `for l in left: for r in right + [deleted]`, followed by the right
+        candidates replacing the node.
+
+        Parameters
+        ----------
+        node : Node
+            inner node
+
+        left : iterable
+            blocks (masks, coverage) of the left child
+
+        right : iterable
+            blocks of the right child, iterated once per left block
+
+        replace_by_right : boolean, optional
+            whether to yield the right candidates replacing the node
+
+        Yields
+        ------
+        ndarray, ndarray
+            blocks of masks over the node's subtree and their coverage
+
+        """
+
+        n_left, n_right = len(node.pos), len(node.neg)
+        # categories that remain in the tree without this subtree
+        outside = self.bitset(self.all_cats - node.categories())
+
+        def covering(cov):
+            """ Which candidates keep every category in the tree """
+            return np.all((cov | outside) == self._all_bits, axis=-1)
+
+        def block(rows, left_masks, right_masks):
+            masks = np.zeros((rows, 1 + n_left + n_right), dtype=np.uint8)
+            if left_masks is not None:
+                masks[:, 1:1 + n_left] = left_masks
+            if right_masks is not None:
+                masks[:, 1 + n_left:] = right_masks
+            return masks
+
+        if isinstance(right, list):
+            # candidates in memory: evaluate left rows x all right candidates
+            # at once, the last column stands for the deleted right child
+            r_masks, r_cov = right[0] if right else (
+                np.zeros((0, n_right), dtype=np.uint8),
+                np.zeros((0, self._n_words), dtype=np.uint64))
+            step = max(1, PAIR_BUDGET // (len(r_masks) + 1))
+
+            for left_masks, left_cov in left:
+                for start in range(0, len(left_masks), step):
+                    l_masks = left_masks[start:start + step]
+                    l_cov = left_cov[start:start + step, np.newaxis]
+                    pair_cov = np.concatenate(
+                        [l_cov | r_cov[np.newaxis], l_cov], axis=1)
+                    rows, cols = np.nonzero(covering(pair_cov))
+                    if not len(rows):
+                        continue
+
+                    kept = cols < len(r_masks)
+                    masks = block(len(rows), l_masks[rows], None)
+                    masks[kept, 0] = 1
+                    masks[kept, 1 + n_left:] = r_masks[cols[kept]]
+                    yield masks, pair_cov[rows, cols]
+        else:
+            # regenerated candidates: one left row at a time
+            for left_masks, left_cov in left:
+                for l_mask, l_cov in zip(left_masks, left_cov):
+                    for r_masks, r_cov in right:
+                        pair_cov = l_cov | r_cov
+                        valid = covering(pair_cov)
+                        if valid.any():
+                            masks = block(valid.sum(), l_mask,
+                                          r_masks[valid])
+                            masks[:, 0] = 1
+                            yield masks, pair_cov[valid]
+                    if covering(l_cov):
+                        yield block(1, l_mask, None), l_cov[np.newaxis]
+
+        if not replace_by_right:
+            return
+
+        # the right child replaces the node
+        for right_masks, right_cov in right:
+            valid = covering(right_cov)
+            if valid.any():
+                yield (block(valid.sum(), None, right_masks[valid]),
+                       right_cov[valid])
+
+    def iter_candidates(self, node):
+        """ Stream the possible subtrees for node
+
+        Parameters
+        ----------
+        node : Node
+
+        Yields
+        ------
+        ndarray, ndarray
+            blocks of masks over the tokens of the subtree and the
+            categories they cover
 
         """
 
-        left_candidates = left + [bytearray([0] * len(left[0]) + [2])]
-        right_candidates = right + [bytearray([0] * len(right[0]) + [2])]
+        if node.leaf or node.content in self.ignore_params:
+            masks = np.ones((1, len(node)), dtype=np.uint8)
+            yield masks, self.bitset(node.categories())[np.newaxis]
+            return
+
+        for block in self.combine(node, self.subtree_candidates(node.pos),
+                                  self.subtree_candidates(node.neg)):
+            yield block
 
-        candidates = it.product(left_candidates, right_candidates)
+    def subtree_candidates(self, node):
+        """ Re-iterable candidates of a subtree. Identical subtrees share
+        their candidates, small candidate sets are kept in memory.
 
-        possible = []
-        total = len(left_candidates) * len(right_candidates)
+        Parameters
+        ----------
+        node : Node
+
+        Returns
+        -------
+        iterable
+            blocks of masks and coverage, a list if held in memory
+
+        """
 
-        for combination in tqdm(candidates, total=total):
+        cached = self._cache.get(node)
+        if cached is not None:
+            return cached
 
-            combination = self.substitute_flag(
-                it.chain.from_iterable(combination))
-            if 2 in combination:
-                continue
-            if check_func(combination):
-                possible.append(combination)
+        blocks = []
+        n_candidates = 0
+        for block in self.iter_candidates(node):
+            blocks.append(block)
+            n_candidates += len(block[0])
+            if n_candidates > self.cache_limit:
+                return _Regenerated(self.iter_candidates, node)
 
-        return possible
+        cached = [_concat(blocks)] if blocks else []
+        self._cache[node] = cached
+        return cached
 
     def possible_subtrees(self, node, arr_bin):
         """ Generates all possible subtrees for node.
@@ -193,10 +590,117 @@ class Deletion():
         """
 
         if node.leaf or node.content in self.ignore_params:
-            return [bytearray([1] * len(str(node).split(self.mpt.word.sep)))]
+            return [np.ones(len(node), dtype=np.uint8)]
+
+        left = np.array(arr_bin[0], dtype=np.uint8)
+        right = np.array(arr_bin[1], dtype=np.uint8)
+        blocks = self.combine(
+            node, [(left, self.coverage(node.pos, left))],
+            [(right, self.coverage(node.neg, right))])
+
+        return [mask for masks, _ in blocks for mask in masks]
+
+
+def _concat(blocks):
+    """ Concatenate blocks of masks and coverage
+
+    """
+
+    return (np.concatenate([masks for masks, _ in blocks]),
+            np.concatenate([cov for _, cov in blocks]))
+
+
+class _Regenerated(object):
+    """ Iterable that regenerates the candidates of a node on every pass
+
+    """
+
+    def __init__(self, generate, node):
+        self.generate = generate
+        self.node = node
+
+    def __iter__(self):
+        return self.generate(self.node)
+
+
+# state of a worker process of the parallel generation
+_WORKER = {}
+
+
+def _init_worker(mpt, ignore_params, cache_limit, buffer_dir):
+    _WORKER['deletion'] = Deletion(mpt, ignore_params=ignore_params,
+                                   cache_limit=cache_limit)
+    _WORKER['buffer_dir'] = buffer_dir
+    _WORKER['mapped'] = {}
+
+
+def _subtree_task(positive):
+    """ Candidates of a subtree of the root written to buffer files, None if
+    there are too many to hold them in memory
+
+    """
+
+    deletion = _WORKER['deletion']
+    root = deletion.mpt.root
+    blocks = deletion.subtree_candidates(root.pos if positive else root.neg)
+    if not isinstance(blocks, list) or not blocks:
+        return None
+    return tuple(_share(array) for array in blocks[0])
+
+
+def _product_task(left_masks, left_cov, right_paths):
+    """ Keyed root candidates for a chunk of left candidates
+
+    """
+
+    deletion = _WORKER['deletion']
+    root = deletion.mpt.root
+
+    if right_paths is None:
+        right = deletion.subtree_candidates(root.neg)
+    else:
+        # mapped once per worker, the pages are shared between processes
+        if right_paths not in _WORKER['mapped']:
+            _WORKER['mapped'][right_paths] = tuple(
+                np.load(path, mmap_mode='r') for path in right_paths)
+        right = [_WORKER['mapped'][right_paths]]
+
+    keys = []
+    records = []
+    for masks, _ in deletion.combine(root, [(left_masks, left_cov)], right,
+                                     replace_by_right=False):
+        for key, record in deletion.keyed(masks):
+            keys.append(key)
+            records.append(record)
+
+    record_size = (len(root) + 7) // 8
+    packed = np.frombuffer(b''.join(records), dtype=np.uint8).reshape(
+        len(records), record_size)
+    return keys, _share(packed)
+
+
+def _collect(result):
+    """ Keyed candidates from the result of a product task
+
+    """
+
+    keys, path = result
+    records = np.load(path)
+    os.remove(path)
+    return list(zip(keys, (record.tobytes() for record in records)))
+
+
+def _share(array):
+    """ Write an array to a new buffer file of the worker
+
+    Returns
+    -------
+    str
+        path of the buffer file
 
-        cats_wo_node = self.all_cats - Counter(node.answers())
-        # initialize the check function with the categories and the node
-        check = partial(self.check_combination, cats_wo_node, str(node))
+    """
 
-        return self.lazy_generation(check, arr_bin[0], arr_bin[1])
+    handle, path = tempfile.mkstemp(suffix='.npy', dir=_WORKER['buffer_dir'])
+    with os.fdopen(handle, 'wb') as buffer_file:
+        np.save(buffer_file, array)
+    return path
@@ -0,0 +1,394 @@
+""" Local search over deletion and substitution models.
+
+A candidate is a submodel of the original model: a mask of the kept tokens
+and a parameter name for every token (see compiled_mpt.ParentModel). Its
+neighbors differ by a single move:
+
+- deletion: a kept node is replaced by one of its children, the other
+  child is deleted with its subtree,
+- undeletion: a deleted node on the path to kept tokens is kept again,
+  its deleted child is restored completely,
+- tie: a node joins another parameter split off the same original
+  parameter,
+- untie: a node tied to others gets a parameter of its own.
+
+Moves keep the candidates within the candidate space of the random search:
+every category stays in the model, ignored parameters are neither deleted
+(nor anything below them) nor split. The names of the parameters are
+numbered like the substitutions, so equal models have equal BMPT words.
+
+The search is a simulated annealing: in every step a batch of random
+neighbors is evaluated in parallel, the best neighbor is accepted if it is
+better than the current model or with probability exp(-difference /
+temperature) otherwise. Temperature 0 is a (stochastic) hill climbing. The
+search restarts from a random candidate once the best model of the run has
+not improved for a number of steps, or all neighbors have been evaluated.
+If a run evaluated no new model and the random start is known as well, the
+search restarts next to the evaluated models instead; it ends once every
+candidate is evaluated (the moves connect all candidates).
+Fits are warm-started and cached by the optimizer.
+
+"""
+
+import math
+import random
+import time
+
+import numpy as np
+
+from mptpy.compiled_mpt import ParentModel
+from mptpy.node import flatten
+
+
+# initial temperature, in units of the criterion
+TEMPERATURE = 2.
+
+# factor of the temperature after every step
+COOLING = 0.9
+
+# steps without improvement of the best model of a run before a restart
+PATIENCE = 10
+
+
+class Neighborhood(object):
+    """ Single moves between submodels of a tree
+
+    """
+
+    def __init__(self, mpt, ignore_params=None):
+        """ Precomputes the subtrees of the tree.
+
+        Parameters
+        ----------
+        mpt : MPT
+            original model
+
+        ignore_params : [str], optional
+            parameters that are neither deleted nor split
+
+        """
+
+        if ignore_params is None:
+            ignore_params = []
+        self.sep = mpt.word.sep
+        self.tokens, _ = flatten(mpt.root)
+        n_tokens = len(self.tokens)
+
+        # subtree of token idx: [idx, ends[idx]), negative child from
+        # negs[idx]; a node may be deleted if no ancestor is ignored
+        self.ends = np.zeros(n_tokens, dtype=int)
+        self.negs = np.zeros(n_tokens, dtype=int)
+        self.deletable = np.zeros(n_tokens, dtype=bool)
+        stack = [(mpt.root, 0, False)]
+        while stack:
+            node, idx, fixed = stack.pop()
+            self.ends[idx] = idx + len(node)
+            if node.leaf:
+                continue
+            fixed = fixed or node.content in ignore_params
+            self.negs[idx] = idx + 1 + len(node.pos)
+            self.deletable[idx] = not fixed
+            stack.append((node.pos, idx + 1, fixed))
+            stack.append((node.neg, self.negs[idx], fixed))
+
+        parent = ParentModel(mpt)
+        self.deletable &= parent.is_param
+        self.splittable = parent.is_param & np.array(
+            [token not in ignore_params for token in self.tokens])
+        self.leaves = parent.leaves
+        self.leaf_cats = parent.leaf_cats
+        self.n_categories = len(parent.categories)
+
+    def candidate(self, mask, names):
+        """ Candidate with the parameters numbered like the substitutions:
+        the i-th parameter split off a parameter p (in order of occurrence)
+        is named p + str(i), the first one p
+
+        Parameters
+        ----------
+        mask : array_like
+            0/1 flags over the tokens, whether the token is kept
+
+        names : sequence
+            parameter of every token, tokens with equal (hashable) names
+            are tied
+
+        Returns
+        -------
+        str, ndarray, list
+            BMPT word, mask and parameter names (see
+            Optimizer.sample_candidate)
+
+        """
+
+        mask = np.asarray(mask, dtype=np.uint8)
+        blocks = {}
+        numbered = list(self.tokens)
+        for idx in np.flatnonzero(mask):
+            if not self.splittable[idx]:
+                continue
+            param = self.tokens[idx]
+            param_blocks = blocks.setdefault(param, {})
+            block = param_blocks.setdefault(names[idx], len(param_blocks))
+            if block != 0:
+                numbered[idx] = param + str(block)
+
+        word = self.sep.join(numbered[idx] for idx in np.flatnonzero(mask))
+        return word, mask, numbered
+
+    def covers(self, mask):
+        """ Whether every category remains in the model
+
+        """
+
+        kept = self.leaf_cats[mask[self.leaves].astype(bool)]
+        return bool(np.all(np.bincount(
+            kept, minlength=self.n_categories) > 0))
+
+    def neighbors(self, mask, names):
+        """ All candidates one move away from a candidate
+
+        Parameters
+        ----------
+        mask : ndarray
+            0/1 flags over the tokens, whether the token is kept
+
+        names : sequence
+            parameter name of every token
+
+        Returns
+        -------
+        [(str, ndarray, list)]
+            neighbors (see candidate)
+
+        """
+
+        mask = np.asarray(mask, dtype=np.uint8)
+        neighbors = []
+        for idx in np.flatnonzero(self.deletable):
+            start, neg, end = idx + 1, self.negs[idx], self.ends[idx]
+            if mask[idx]:
+                # replace the node by one of its children
+                for deleted in [(neg, end), (start, neg)]:
+                    moved = mask.copy()
+                    moved[idx] = 0
+                    moved[deleted[0]:deleted[1]] = 0
+                    if self.covers(moved):
+                        neighbors.append(self.candidate(moved, names))
+            elif mask[start:end].any():
+                # keep the node again, restore its deleted child
+                moved = mask.copy()
+                moved[idx] = 1
+                if mask[start:neg].any():
+                    moved[neg:end] = 1
+                else:
+                    moved[start:neg] = 1
+                neighbors.append(self.candidate(moved, names))
+
+        # {parameter : {name : kept tokens}}
+        blocks = {}
+        for idx in np.flatnonzero(mask):
+            if self.splittable[idx]:
+                blocks.setdefault(self.tokens[idx], {}).setdefault(
+                    names[idx], []).append(idx)
+
+        for param, param_blocks in blocks.items():
+            for name, members in param_blocks.items():
+                for idx in members:
+                    if len(members) > 1:
+                        neighbors.append(self.candidate(
+                            mask, _renamed(names, idx, (param, 'untied'))))
+                    for other in param_blocks:
+                        if other != name:
+                            neighbors.append(self.candidate(
+                                mask, _renamed(names, idx, other)))
+        return neighbors
+
+
+class LocalSearch(object):
+    """ Simulated annealing over the candidates of an optimizer
+
+    """
+
+    def __init__(self, optimizer, criterion='BIC', temperature=TEMPERATURE,
+                 cooling=COOLING, patience=PATIENCE):
+        """ Creates the search.
+
+        Parameters
+        ----------
+        optimizer : Optimizer
+            optimizer sampling the start candidates and evaluating,
+            recording and caching the fits
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion to be minimized
+
+        temperature : float, optional
+            initial temperature of every run, 0 for hill climbing
+
+        cooling : float, optional
+            factor of the temperature after every step
+
+        patience : int, optional
+            steps without improvement of the best model of a run before a
+            restart
+
+        """
+
+        self.optimizer = optimizer
+        self.criterion = criterion
+        self.temperature = temperature
+        self.cooling = cooling
+        self.patience = patience
+        self.neighborhood = Neighborhood(optimizer.mpt,
+                                         optimizer.ignore_params)
+
+        # {model : criterion}, inf if not identifiable
+        self.scores = {}
+
+        # {model : candidate} of the evaluated models
+        self.visited = {}
+        self.n_fits = 0
+        self.n_restarts = 0
+
+    def run(self, max_fits=None, max_time=None, n_jobs=1, n_optim=10,
+            batch_size=None):
+        """ Search until one of the budgets is exhausted, starting with the
+        original model
+
+        Parameters
+        ----------
+        max_fits : int, optional
+            maximal number of evaluated models. Default: unlimited.
+
+        max_time : float, optional
+            maximal wall-clock time in seconds, checked between the steps.
+            Default: unlimited.
+
+        n_jobs : int, optional
+            number of worker processes fitting the models
+
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        batch_size : int, optional
+            number of neighbors evaluated per step. Default: n_jobs.
+
+        Returns
+        -------
+        (str, dict)
+            best model and its evaluation, None if no model was fitted
+
+        """
+
+        if max_fits is None and max_time is None:
+            raise ValueError("the local search needs a budget")
+        if batch_size is None:
+            batch_size = n_jobs
+
+        optimizer = self.optimizer
+        optimizer.best = None
+        deadline = None if max_time is None else time.time() + max_time
+        self.n_fits = 0
+
+        def budget_left():
+            return (max_fits is None or self.n_fits < max_fits) and \
+                (deadline is None or time.time() < deadline)
+
+        with optimizer.start_pool(n_jobs, n_optim) as pool:
+            current = optimizer.original_candidate()
+            while budget_left():
+                n_fits = self.n_fits
+                self.run_from(pool, current, batch_size, budget_left,
+                              max_fits)
+                current = self.neighborhood.candidate(
+                    *optimizer.sample_candidate()[1:])
+                if self.n_fits == n_fits and current[0] in self.scores:
+                    current = self.unexplored()
+                    if current is None:
+                        break
+                self.n_restarts += 1
+
+        return optimizer.best
+
+    def run_from(self, pool, current, batch_size, budget_left, max_fits):
+        """ One run of the annealing from a start candidate
+
+        """
+
+        current_score = self.evaluate(pool, [current])[0]
+        best_score = current_score
+        temperature = self.temperature
+        stalled = 0
+
+        while budget_left() and stalled < self.patience:
+            neighbors = self.neighborhood.neighbors(*current[1:])
+            random.shuffle(neighbors)
+
+            batch = []
+            for neighbor in neighbors:
+                if len(batch) == batch_size:
+                    break
+                if neighbor[0] not in self.scores and \
+                        neighbor[0] not in [word for word, _, _ in batch]:
+                    batch.append(neighbor)
+            if not batch:
+                # every neighbor is known
+                return
+            if max_fits is not None:
+                batch = batch[:max_fits - self.n_fits]
+            self.evaluate(pool, batch)
+
+            proposal = min(neighbors, key=lambda neighbor: self.scores.get(
+                neighbor[0], math.inf))
+            proposal_score = self.scores.get(proposal[0], math.inf)
+            difference = proposal_score - current_score
+            if difference < 0 or (
+                    temperature > 0 and math.isfinite(difference) and
+                    random.random() < math.exp(-difference / temperature)):
+                current, current_score = proposal, proposal_score
+
+            if current_score < best_score:
+                best_score = current_score
+                stalled = 0
+            else:
+                stalled += 1
+            temperature *= self.cooling
+
+    def unexplored(self):
+        """ A model next to the evaluated ones that is not evaluated yet
+
+        Returns
+        -------
+        (str, ndarray, list)
+            candidate, None if every candidate is evaluated
+
+        """
+
+        for candidate in self.visited.values():
+            for neighbor in self.neighborhood.neighbors(*candidate[1:]):
+                if neighbor[0] not in self.scores:
+                    return neighbor
+        return None
+
+    def evaluate(self, pool, candidates):
+        """ Criteria of candidates, evaluating the unknown ones
+
+        """
+
+        unknown = [candidate for candidate in candidates
+                   if candidate[0] not in self.scores]
+        evaluations = self.optimizer.evaluate_batch(pool, unknown,
+                                                    self.criterion)
+        self.n_fits += len(unknown)
+        for candidate, evaluation in zip(unknown, evaluations):
+            self.scores[candidate[0]] = math.inf if evaluation is None \
+                else evaluation[self.criterion]
+            self.visited[candidate[0]] = candidate
+        return [self.scores[candidate[0]] for candidate in candidates]
+
+
+def _renamed(names, idx, name):
+    names = list(names)
+    names[idx] = name
+    return names
@@ -0,0 +1,544 @@
+""" Surrogate-based search over deletion and substitution models.
+
+Sequential model-based optimization in the style of SMAC: the criteria of
+the evaluated candidates are learned by a random forest on features of the
+candidates (kept tokens, tie structure, parameter counts). In every
+iteration, a pool of proposals (random candidates and neighbors of the best
+evaluated ones, see local_search) is ranked by the expected improvement
+over the best criterion, and a batch of the best proposals is fitted in the
+worker pool of the optimizer. Some batch slots are filled with random
+candidates instead, so the search keeps exploring regions the forest
+underestimates.
+
+The forest is implemented with NumPy: regression trees on bootstrap
+samples, a random subset of the features per split. The spread of the
+tree predictions estimates the uncertainty of the mean prediction.
+
+"""
+
+import math
+import random
+import time
+
+import numpy as np
+
+from mptpy.optimization.operations.local_search import Neighborhood
+
+
+# number of trees of the forest
+N_TREES = 10
+
+# fraction of the features considered per split
+MAX_FEATURES = 0.5
+
+# nodes with fewer samples are not split
+MIN_SAMPLES_SPLIT = 3
+
+# evaluated models before the surrogate is used
+N_INITIAL = 8
+
+# random candidates and best evaluated models whose neighbors are proposed
+# per iteration
+N_RANDOM_PROPOSALS = 100
+N_LOCAL_STARTS = 5
+
+# random proposals replaced by new ones per iteration
+N_RANDOM_REFRESH = 10
+
+# probability of a random candidate instead of the best proposal per slot
+RANDOM_PROB = 0.2
+
+# lower bound of the predicted standard deviation
+MIN_STD = 1e-6
+
+
+class Encoder(object):
+    """ Feature vectors of candidates
+
+    Features: the mask of kept tokens, per splittable node whether it is
+    tied to the first occurrence of its parameter, per parameter the number
+    of parameters split off it, and the numbers of kept nodes and free
+    parameters.
+
+    """
+
+    def __init__(self, neighborhood):
+        """ Creates the encoder.
+
+        Parameters
+        ----------
+        neighborhood : Neighborhood
+            moves of the original model, with its tokens and the nodes that
+            may be split
+
+        """
+
+        self.tokens = neighborhood.tokens
+        self.splittable = neighborhood.splittable
+        self.params = sorted(set(
+            token for token, split in zip(self.tokens, self.splittable)
+            if split))
+        self.param_index = {param: idx for idx, param in
+                            enumerate(self.params)}
+
+    @property
+    def n_features(self):
+        return 2 * len(self.tokens) + len(self.params) + 2
+
+    def encode(self, candidates):
+        """ Feature matrix of candidates
+
+        Parameters
+        ----------
+        candidates : [(str, ndarray, list)]
+            candidates (see Optimizer.sample_candidate)
+
+        Returns
+        -------
+        ndarray
+            (n_candidates, n_features)
+
+        """
+
+        n_tokens = len(self.tokens)
+        features = np.zeros((len(candidates), self.n_features))
+        for row, (_, mask, names) in enumerate(candidates):
+            mask = np.asarray(mask, dtype=bool)
+            features[row, :n_tokens] = mask
+
+            # {parameter : {name, ...}}
+            blocks = {}
+            first = {}
+            n_params = 0
+            for idx in np.flatnonzero(mask & self.splittable):
+                param = self.tokens[idx]
+                first.setdefault(param, names[idx])
+                features[row, n_tokens + idx] = names[idx] == first[param]
+                param_blocks = blocks.setdefault(param, set())
+                if names[idx] not in param_blocks:
+                    param_blocks.add(names[idx])
+                    n_params += 1
+
+            for param, param_blocks in blocks.items():
+                features[row, 2 * n_tokens + self.param_index[param]] = \
+                    len(param_blocks)
+            features[row, -2] = mask.sum()
+            features[row, -1] = n_params
+        return features
+
+
+class RandomForest(object):
+    """ Random forest of regression trees
+
+    """
+
+    def __init__(self, n_trees=N_TREES, max_features=MAX_FEATURES,
+                 min_samples_split=MIN_SAMPLES_SPLIT, random_state=None):
+        """ Creates an unfitted forest.
+
+        Parameters
+        ----------
+        n_trees : int, optional
+            number of trees
+
+        max_features : float, optional
+            fraction of the features considered per split
+
+        min_samples_split : int, optional
+            nodes with fewer samples are leaves
+
+        random_state : numpy.random.RandomState, optional
+            random number generator. Default: numpy's global generator.
+
+        """
+
+        if random_state is None:
+            random_state = np.random
+        self.n_trees = n_trees
+        self.max_features = max_features
+        self.min_samples_split = min_samples_split
+        self.random_state = random_state
+        self.trees = []
+
+    def fit(self, features, targets):
+        """ Fit the trees to bootstrap samples
+
+        Parameters
+        ----------
+        features : ndarray
+            (n_samples, n_features)
+
+        targets : ndarray
+            (n_samples,)
+
+        """
+
+        features = np.asarray(features, dtype=float)
+        targets = np.asarray(targets, dtype=float)
+        self.trees = []
+        for _ in range(self.n_trees):
+            sample = self.random_state.randint(0, len(targets),
+                                               size=len(targets))
+            self.trees.append(self._grow(features[sample], targets[sample]))
+        return self
+
+    def predict(self, features):
+        """ Mean and standard deviation of the tree predictions
+
+        Parameters
+        ----------
+        features : ndarray
+            (n_samples, n_features)
+
+        Returns
+        -------
+        ndarray, ndarray
+            (n_samples,) means and standard deviations
+
+        """
+
+        features = np.asarray(features, dtype=float)
+        rows = np.arange(len(features))
+        predictions = []
+        for feature, threshold, left, right, value in self.trees:
+            node = np.zeros(len(features), dtype=int)
+            inner = left[node] >= 0
+            while inner.any():
+                goes_left = features[rows, feature[node]] <= threshold[node]
+                node = np.where(inner, np.where(goes_left, left[node],
+                                                right[node]), node)
+                inner = left[node] >= 0
+            predictions.append(value[node])
+
+        predictions = np.array(predictions)
+        return predictions.mean(axis=0), predictions.std(axis=0)
+
+    def _grow(self, features, targets):
+        """ Regression tree as arrays (feature, threshold, left child,
+        right child, value), children -1 for leaves
+
+        """
+
+        n_features = features.shape[1]
+        n_considered = max(1, int(round(self.max_features * n_features)))
+        feature, threshold, left, right, value = [], [], [], [], []
+
+        stack = [(np.arange(len(targets)), None)]
+        while stack:
+            samples, parent = stack.pop()
+            node = len(value)
+            if parent is not None:
+                parent_node, is_left = parent
+                (left if is_left else right)[parent_node] = node
+            feature.append(0)
+            threshold.append(0.)
+            left.append(-1)
+            right.append(-1)
+            value.append(targets[samples].mean())
+
+            if len(samples) < self.min_samples_split or \
+                    np.ptp(targets[samples]) == 0:
+                continue
+            # a random subset of the features that vary within the node
+            varying = np.flatnonzero(np.ptp(features[samples], axis=0) > 0)
+            if not len(varying):
+                continue
+            considered = self.random_state.permutation(varying)[
+                :n_considered]
+            split = _best_split(features[samples][:, considered],
+                                targets[samples])
+            if split is None:
+                continue
+
+            column, split_value = split
+            feature[node] = considered[column]
+            threshold[node] = split_value
+            goes_left = features[samples, feature[node]] <= split_value
+            stack.append((samples[~goes_left], (node, False)))
+            stack.append((samples[goes_left], (node, True)))
+
+        return (np.array(feature, dtype=int), np.array(threshold),
+                np.array(left, dtype=int), np.array(right, dtype=int),
+                np.array(value))
+
+
+def _best_split(features, targets):
+    """ Split minimizing the sum of squared errors of both sides
+
+    Returns
+    -------
+    (int, float)
+        column and threshold (values <= threshold go left), None if no
+        column has two distinct values
+
+    """
+
+    n_samples = len(targets)
+    order = np.argsort(features, axis=0, kind='mergesort')
+    values = np.take_along_axis(features, order, axis=0)
+    sorted_targets = targets[order]
+
+    # split after row k: left = [0, k], right = (k, n)
+    sums = np.cumsum(sorted_targets, axis=0)
+    squares = np.cumsum(sorted_targets ** 2, axis=0)
+    n_left = np.arange(1, n_samples)[:, np.newaxis]
+    left_error = squares[:-1] - sums[:-1] ** 2 / n_left
+    right_error = (squares[-1] - squares[:-1]) - \
+        (sums[-1] - sums[:-1]) ** 2 / (n_samples - n_left)
+    errors = np.where(values[:-1] < values[1:], left_error + right_error,
+                      math.inf)
+
+    split, column = np.unravel_index(np.argmin(errors), errors.shape)
+    if not np.isfinite(errors[split, column]):
+        return None
+    return column, (values[split, column] + values[split + 1, column]) / 2.
+
+
+def expected_improvement(mean, std, best):
+    """ Expected improvement of a minimization below the best value
+
+    Parameters
+    ----------
+    mean : ndarray
+        predicted means
+
+    std : ndarray
+        predicted standard deviations
+
+    best : float
+        best value observed
+
+    Returns
+    -------
+    ndarray
+        E[max(best - value, 0)] for normally distributed values
+
+    """
+
+    std = np.maximum(std, MIN_STD)
+    improvement = best - mean
+    z = improvement / std
+    cdf = 0.5 * (1 + np.vectorize(math.erf)(z / math.sqrt(2)))
+    pdf = np.exp(-0.5 * z ** 2) / math.sqrt(2 * math.pi)
+    return improvement * cdf + std * pdf
+
+
+class SurrogateSearch(object):
+    """ Search guided by a random forest of the criteria
+
+    """
+
+    def __init__(self, optimizer, criterion='BIC', n_initial=N_INITIAL,
+                 n_trees=N_TREES, random_prob=RANDOM_PROB):
+        """ Creates the search.
+
+        Parameters
+        ----------
+        optimizer : Optimizer
+            optimizer sampling the candidates and evaluating, recording and
+            caching the fits
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion to be minimized
+
+        n_initial : int, optional
+            random candidates evaluated (after the original model) before
+            the surrogate is used
+
+        n_trees : int, optional
+            number of trees of the forest
+
+        random_prob : float, optional
+            probability of a random candidate instead of the best proposal
+            per batch slot
+
+        """
+
+        self.optimizer = optimizer
+        self.criterion = criterion
+        self.n_initial = n_initial
+        self.random_prob = random_prob
+        self.neighborhood = Neighborhood(optimizer.mpt,
+                                         optimizer.ignore_params)
+        self.encoder = Encoder(self.neighborhood)
+        self.forest = RandomForest(n_trees=n_trees)
+
+        # evaluated candidates and their criteria (inf if not identifiable)
+        self.candidates = []
+        self.scores = []
+        self.n_fits = 0
+
+        # random proposals, oldest first
+        self.random_proposals = []
+
+    def run(self, max_fits=None, max_time=None, n_jobs=1, n_optim=10,
+            batch_size=None):
+        """ Search until one of the budgets is exhausted, starting with the
+        original model
+
+        Parameters
+        ----------
+        max_fits : int, optional
+            maximal number of evaluated models. Default: unlimited.
+
+        max_time : float, optional
+            maximal wall-clock time in seconds, checked between the
+            batches. Default: unlimited.
+
+        n_jobs : int, optional
+            number of worker processes fitting the models
+
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        batch_size : int, optional
+            number of models evaluated per iteration. Default: n_jobs.
+
+        Returns
+        -------
+        (str, dict)
+            best model and its evaluation, None if no model was fitted
+
+        """
+
+        if max_fits is None and max_time is None:
+            raise ValueError("the surrogate search needs a budget")
+        if batch_size is None:
+            batch_size = n_jobs
+
+        optimizer = self.optimizer
+        optimizer.best = None
+        deadline = None if max_time is None else time.time() + max_time
+
+        def n_left():
+            if deadline is not None and time.time() >= deadline:
+                return 0
+            return math.inf if max_fits is None else max_fits - self.n_fits
+
+        with optimizer.start_pool(n_jobs, n_optim) as pool:
+            initial = {}
+            for candidate in [optimizer.original_candidate()] + [
+                    self.random_candidate() for _ in range(self.n_initial)]:
+                initial.setdefault(candidate[0], candidate)
+            initial = list(initial.values())
+            while initial and n_left() > 0:
+                size = int(min(batch_size, n_left()))
+                self.evaluate(pool, initial[:size])
+                initial = initial[size:]
+
+            while n_left() > 0:
+                batch = self.next_batch(int(min(batch_size, n_left())))
+                if not batch:
+                    break
+                self.evaluate(pool, batch)
+
+        return optimizer.best
+
+    def random_candidate(self):
+        """ Candidate drawn by the optimizer, with numbered parameters
+
+        """
+
+        return self.neighborhood.candidate(
+            *self.optimizer.sample_candidate()[1:])
+
+    def next_batch(self, size):
+        """ Unevaluated candidates of maximal expected improvement
+
+        Parameters
+        ----------
+        size : int
+            number of candidates
+
+        Returns
+        -------
+        [(str, ndarray, list)]
+            candidates, empty if every neighbor of the evaluated models is
+            evaluated
+
+        """
+
+        known = set(candidate[0] for candidate in self.candidates)
+        proposals = {}
+        for candidate in self.proposals(known):
+            if candidate[0] not in known:
+                proposals.setdefault(candidate[0], candidate)
+        if not proposals:
+            # the neighbors of the best models are known, continue next to
+            # any evaluated model
+            for candidate in self.candidates:
+                for neighbor in self.neighborhood.neighbors(*candidate[1:]):
+                    if neighbor[0] not in known:
+                        proposals.setdefault(neighbor[0], neighbor)
+        proposals = list(proposals.values())
+        if not proposals:
+            return []
+
+        scores = np.array(self.scores)
+        finite = np.isfinite(scores)
+        if not finite.any():
+            ranking = list(range(len(proposals)))
+            random.shuffle(ranking)
+        else:
+            # models that are not identifiable count as the worst ones
+            targets = np.where(finite, scores, scores[finite].max())
+            self.forest.fit(self.encoder.encode(self.candidates), targets)
+            mean, std = self.forest.predict(self.encoder.encode(proposals))
+            improvement = expected_improvement(mean, std,
+                                               scores[finite].min())
+            ranking = list(np.argsort(-improvement, kind='mergesort'))
+
+        # proposals are unique, so a ranked one is only chosen already if
+        # it was drawn at random before
+        chosen = set()
+        ranked = (proposals[idx] for idx in ranking
+                  if proposals[idx][0] not in chosen)
+        batch = []
+        while len(batch) < size:
+            candidate = None
+            if random.random() < self.random_prob:
+                candidate = self.random_candidate()
+                if candidate[0] in known or candidate[0] in chosen:
+                    # known draw, take the next ranked proposal instead
+                    candidate = None
+            if candidate is None:
+                candidate = next(ranked, None)
+            if candidate is None:
+                break
+            chosen.add(candidate[0])
+            batch.append(candidate)
+        return batch
+
+    def proposals(self, known):
+        """ Random candidates and the neighbors of the best evaluated ones.
+        The random candidates are kept between the iterations, evaluated and
+        the oldest ones are replaced.
+
+        """
+
+        self.random_proposals = [
+            candidate for candidate in self.random_proposals[N_RANDOM_REFRESH:]
+            if candidate[0] not in known]
+        self.random_proposals.extend(
+            self.random_candidate() for _ in range(
+                N_RANDOM_PROPOSALS - len(self.random_proposals)))
+
+        proposals = list(self.random_proposals)
+        for idx in np.argsort(self.scores, kind='mergesort')[:N_LOCAL_STARTS]:
+            if np.isfinite(self.scores[idx]):
+                proposals.extend(self.neighborhood.neighbors(
+                    *self.candidates[idx][1:]))
+        return proposals
+
+    def evaluate(self, pool, candidates):
+        """ Evaluate candidates and remember their criteria
+
+        """
+
+        evaluations = self.optimizer.evaluate_batch(pool, candidates,
+                                                    self.criterion)
+        self.n_fits += len(candidates)
+        for candidate, evaluation in zip(candidates, evaluations):
+            self.candidates.append(candidate)
+            self.scores.append(math.inf if evaluation is None
+                               else evaluation[self.criterion])
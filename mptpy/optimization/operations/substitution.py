@@ -1,11 +1,20 @@
 """ Interface for applying operations to MPTs.
 
+A substitution splits the occurrences of a parameter into several
+parameters, described by a restricted growth string (RGS) over the
+occurrences: occurrence i is renamed to the parameter with suffix rgs[i]
+(no suffix for 0). The substitutions of a tree are the product of the RGSs
+of its parameters.
+
 """
 
+from collections import OrderedDict
 
-from sympy.combinatorics.partitions import RGS_enum, RGS_unrank
+import numpy as np
 
+from mptpy.mpt import MPT
 from mptpy.optimization.operations.operation import Operation
+from mptpy.tools import rgs as rgs_rank
 
 
 class Substitution(Operation):
@@ -15,6 +24,8 @@ class Substitution(Operation):
         self.config = config  # {param: rgs}
 
     def apply(self, word):
+        if isinstance(word, MPT):
+            word = word.word
         elements = list(word)
         for param, rgs in self.config.items():
             elements = apply_rgs(param, rgs, elements)
@@ -36,25 +47,112 @@ def apply_rgs(param, rgs, mpt_list):
 
 
 def get_RGS(rank, param_occurences):
-    rgs = RGS_unrank(rank, param_occurences)
-    return rgs
+    return rgs_rank.unrank(rank, param_occurences).tolist()
 
 
-def generate_all(mpt, ignore=None):
-    """ Generate all trees possible with this operation
+def occurrences(word, ignore=None):
+    """ Token positions of the parameters that can be substituted
 
     Parameters
     ----------
-    mpt : MPT
+    word : MPTWord
+        tree in the BMPT language
+
+    ignore : iterable, optional
+        parameters that are not to be modified
+
+    Returns
+    -------
+    OrderedDict
+        {parameter : token positions} for the parameters occurring more
+        than once, in order of their first occurrence
+
+    """
+
+    ignore = set(ignore or [])
+    positions = OrderedDict()
+    for idx, token in enumerate(word.tokens):
+        if not word.is_leaf(token) and token not in ignore:
+            positions.setdefault(token, []).append(idx)
+    return OrderedDict((param, pos) for param, pos in positions.items()
+                       if len(pos) > 1)
+
+
+def count_all(mpt, ignore=None):
+    """ Number of trees generated by generate_all
+
+    Parameters
+    ----------
+    mpt : MPT or MPTWord
         mpt that is to be modified
 
+    ignore : iterable, optional
+        parameters that are not to be modified
+
+    Returns
+    -------
+    int
+
     """
 
-    if ignore is None:
-        ignore = set()
+    word = mpt.word if isinstance(mpt, MPT) else mpt
+    total = 1
+    for positions in occurrences(word, ignore).values():
+        total *= rgs_rank.bell(len(positions))
+    return total
+
+
+def generate_all(mpt, ignore=None, start=0, stride=1):
+    """ Lazily generate all trees possible with this operation. The trees
+    are numbered by the ranks of the RGSs of the parameters (the last
+    parameter changing fastest); workers can split the space by start and
+    stride.
+
+    Parameters
+    ----------
+    mpt : MPT or MPTWord
+        mpt that is to be modified
+
+    ignore : iterable, optional
+        parameters that are not to be modified
+
+    start : int, optional
+        number of the first generated tree
+
+    stride : int, optional
+        distance between the numbers of consecutive generated trees
+
+    Yields
+    ------
+    ndarray
+        tokens of the modified tree. The same array is updated in place
+        for every tree, only the occurrences of parameters with a changed
+        RGS are rewritten; copy it to keep it.
+
+    """
 
-    for param in set(mpt.categories) - set(ignore):
-        num = mpt.parameters.count(param)
-        for i in range(RGS_enum(num)):
-            rgs = RGS_unrank(i, num)
-            # return get_parameterization(rgs, param)    # TODO
+    word = mpt.word if isinstance(mpt, MPT) else mpt
+    positions = occurrences(word, ignore)
+    params = list(positions)
+    sizes = [rgs_rank.bell(len(positions[param])) for param in params]
+    names = {param: np.array([param] + [param + str(block) for block in
+                                        range(1, len(positions[param]))],
+                             dtype=object)
+             for param in params}
+
+    total = 1
+    for size in sizes:
+        total *= size
+
+    tokens = np.array(word.tokens, dtype=object)
+    current = [None] * len(params)
+    for number in range(start, total, stride):
+        # mixed-radix digits of the tree number, one RGS rank per parameter
+        for idx in reversed(range(len(params))):
+            number, rank = divmod(number, sizes[idx])
+            if rank != current[idx]:
+                param = params[idx]
+                rgs = rgs_rank.unrank(rank, len(positions[param]))
+                tokens[positions[param]] = names[param][rgs]
+                current[idx] = rank
+        yield tokens
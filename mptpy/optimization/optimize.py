@@ -1,121 +1,869 @@
 """ Optimization procedures for MPTs.
 
+The random search samples deletion and substitution models in the main
+process and keeps a bounded queue of them filled, while a pool of worker
+processes checks and fits them concurrently.
+
+Every evaluation is appended to the evaluation file as a JSON line, and the
+rest of the search state (random number generator states, number of fitted
+models, elapsed time and the models sampled but not yet evaluated) is
+checkpointed periodically. A resumed search reads both and continues with
+the same sequence of models, without evaluating a model twice. Models equal
+up to parameter names are fitted once per data set and fit settings, the
+evaluation cache (see tools.eval_cache) is shared by all processes and
+runs.
+
+Candidates are sampled as a deletion mask over the tokens of the original
+model and a parameter name for every token. The workers compile them from
+the precomputed paths of the original model (see
+compiled_mpt.ParentModel) instead of parsing and compiling their BMPT
+words, and fit them with the analytic gradient of the likelihood. The
+first optimization run of a fit starts at the estimates of the nearest
+model fitted before (see warm_start).
+
 """
 
-from collections import Counter
+from collections import Counter, deque
+from itertools import compress
+import itertools as it
+import json
 import os
+import pickle
+import random
 import sys
+import time
 
 import numpy as np
-from sympy.combinatorics.partitions import RGS_enum
 
 from mptpy.optimization.operations.deletion import Deletion
-import mptpy.optimization.operations.substitution as substitution
-from mptpy.mpt_word import MPTWord
+from mptpy.optimization.operations.local_search import LocalSearch
+from mptpy.optimization.operations.smac_optim import SurrogateSearch
+from mptpy.optimization.warm_start import WarmStarts
+from mptpy.compiled_mpt import CompiledMPT, ParentModel
 from mptpy.mpt import MPT
+from mptpy.mpt_word import MPTWord
+from mptpy.tools import eval_cache, joint_tree, rgs
 import mptpy.fitting.scipy_fit as fitting
+from mptpy.fitting import fitter
 import mptpy.properties.properties as props
 
 
+# model selection criteria of the fit results, lower is better
+CRITERIA = ('AIC', 'BIC', 'G2')
+
+# number of queued candidates per worker process
+QUEUE_PER_JOB = 2
+
+# seconds between two checkpoints of the search state
+CHECKPOINT_EVERY = 60.
+
+# consecutive samples of evaluated models that end the random search
+MAX_KNOWN_SAMPLES = 1000
+
+
 class Optimizer():
     def __init__(self, mpt, data_path, name, sep=',', func='rmse',
                  ignore_params=None):
         if ignore_params is None:
             ignore_params = []
         self.mpt = mpt
-        self.deletion_file = 'delete_{}.txt'.format(name)
+        self.deletion_file = 'delete_{}.bin'.format(name)
         self.deletion = Deletion(
             mpt,
             ignore_params=ignore_params,
             out=self.deletion_file)
         self.ignore_params = ignore_params
         self.eval_file = 'evals_{}.txt'.format(name)
+        self.checkpoint_file = 'search_{}.ckpt'.format(name)
+        self.cache_file = 'cache_{}.sqlite'.format(name)
+        self._parent = None
+        self.warm_starts = None
         self.data_path = data_path
         self.no_del_trees = 0
         self.func = func
         self.sep = sep
+        self.best = None
+        self.evaluated = set()
 
     def init_deletion(self):
         if not os.path.exists(self.deletion_file):
-            deletion_trees = self.deletion.generate_candidates()
-            self.no_del_trees = len(deletion_trees) - 1
+            self.deletion.generate_candidates()
         else:
             print("Deletion list exists. Load..")
             sys.stdout.flush()
-            self.no_del_trees = sum(1 for line in open(self.deletion_file))
+        self.no_del_trees = len(self.deletion.store)
 
-    def random_search(self):
+    def random_search(self, max_fits=None, max_time=None, n_jobs=1,
+                      criterion='BIC', n_optim=10, resume=False,
+                      checkpoint_every=CHECKPOINT_EVERY):
+        """ Random search over deletion and substitution models, starting
+        with the original model. The search runs until one of the budgets
+        is exhausted or MAX_KNOWN_SAMPLES models in a row were evaluated
+        before; every evaluation is appended to the evaluation file and the
+        search state is saved to the checkpoint file. Models that were
+        evaluated before are not evaluated again.
 
-        evaluation = fitting.fit_mpt(
-            self.mpt, self.func, self.data_path, sep=self.sep)
-        from pprint import pprint
-        pprint(evaluation)
-        exit()
-        self.write_to_file(str(self.mpt), evaluation)
+        Parameters
+        ----------
+        max_fits : int, optional
+            maximal number of fitted models (including the ones rejected
+            as not identifiable). Models sampled again are skipped without
+            counting. Default: unlimited.
 
-        i = 0
-        while(1):
-            i += 1
-            print("Optimizing {}...".format(i))
-            model, evaluation = self.eval_random_model(self.mpt.subtrees)
-            if model:
-                self.write_to_file(str(model), evaluation)
+        max_time : float, optional
+            maximal wall-clock time in seconds. Models in evaluation when
+            the time is up are completed. Default: unlimited.
 
+        n_jobs : int, optional
+            number of worker processes fitting the models
 
-    def eval_random_model(self, subtrees):
-        # deletion
-        del_tree = self.random_deletion_model()
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
 
-        # substitutions
-        param_rgs = self.random_substitution_configs(del_tree)
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        resume : boolean, optional
+            continue the search of the checkpoint file. The budgets include
+            the models and time of the previous runs.
+
+        checkpoint_every : float, optional
+            seconds between two checkpoints
+
+        Returns
+        -------
+        (str, dict)
+            best model and its evaluation, None if no model was fitted
+
+        """
+
+        if criterion not in CRITERIA:
+            raise ValueError("criterion needs to be one of {}".format(
+                ", ".join(CRITERIA)))
+
+        state = {'n_fits': 0, 'elapsed': 0., 'pending': []}
+        self.best = None
+        self.evaluated = set()
+        self.warm_starts = WarmStarts(self.parent.is_param)
+        if resume:
+            state = self.resume(criterion)
+
+        started = time.time() - state['elapsed']
+        deadline = None if max_time is None else started + max_time
+        n_fits = state['n_fits']
+        queue = deque(state['pending'])
+        candidates = iter(self.sample_candidate, None)
+        if not n_fits:
+            candidates = it.chain([self.original_candidate()], candidates)
+
+        def sample_left():
+            return (max_fits is None or n_fits < max_fits) and \
+                (deadline is None or time.time() < deadline)
+
+        pool = self.start_pool(n_jobs, n_optim)
+
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        # {future : candidate} in order of submission, and their models
+        running = {}
+        in_flight = set()
+        n_known = 0
+        last_checkpoint = time.time()
+        with pool:
+            try:
+                while True:
+                    while len(running) < QUEUE_PER_JOB * n_jobs and \
+                            (deadline is None or time.time() < deadline):
+                        # queued models were counted when first submitted
+                        counted = bool(queue)
+                        if queue:
+                            candidate = queue.popleft()
+                        elif sample_left() and n_known < MAX_KNOWN_SAMPLES:
+                            candidate = next(candidates)
+                        else:
+                            break
+                        if candidate[0] in self.evaluated or \
+                                candidate[0] in in_flight:
+                            n_known += not counted
+                            continue
+                        if not counted:
+                            n_known = 0
+                            n_fits += 1
+                        running[self.submit(pool, candidate)] = candidate
+                        in_flight.add(candidate[0])
+
+                    if deadline is not None and time.time() >= deadline:
+                        # return the queued models, complete the running ones
+                        cancelled = [future for future in running
+                                     if future.cancel()]
+                        queue.extendleft(reversed(
+                            [running.pop(future) for future in cancelled]))
+                        in_flight.difference_update(
+                            candidate[0] for candidate in queue)
+                    if not running:
+                        break
+
+                    # once the time is up, block until a running fit ends
+                    timeout = None if deadline is None else \
+                        deadline - time.time()
+                    if timeout is not None and timeout <= 0:
+                        timeout = None
+                    done, _ = wait(running, timeout=timeout,
+                                   return_when=FIRST_COMPLETED)
+                    for future in [f for f in running if f in done]:
+                        candidate = running.pop(future)
+                        in_flight.discard(candidate[0])
+                        self.complete(candidate, future.result()[1],
+                                      criterion)
+
+                    if time.time() - last_checkpoint >= checkpoint_every:
+                        self.save_checkpoint(
+                            n_fits, time.time() - started,
+                            list(running.values()) + list(queue))
+                        last_checkpoint = time.time()
+            finally:
+                self.save_checkpoint(n_fits, time.time() - started,
+                                     list(running.values()) + list(queue))
+
+        return self.best
+
+    def local_search(self, max_fits=None, max_time=None, n_jobs=1,
+                     criterion='BIC', n_optim=10, **kwargs):
+        """ Simulated annealing over deletion and substitution models
+        with restarts, starting with the original model (see
+        operations.local_search). Evaluations are appended to the
+        evaluation file.
+
+        Parameters
+        ----------
+        max_fits : int, optional
+            maximal number of evaluated models
+
+        max_time : float, optional
+            maximal wall-clock time in seconds
+
+        n_jobs : int, optional
+            number of worker processes, neighbors evaluated per step
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
+
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        kwargs : dict
+            temperature, cooling and patience of LocalSearch
+
+        Returns
+        -------
+        (str, dict)
+            best model and its evaluation, None if no model was fitted
+
+        """
+
+        if criterion not in CRITERIA:
+            raise ValueError("criterion needs to be one of {}".format(
+                ", ".join(CRITERIA)))
+
+        self.evaluated = set()
+        search = LocalSearch(self, criterion=criterion, **kwargs)
+        return search.run(max_fits=max_fits, max_time=max_time,
+                          n_jobs=n_jobs, n_optim=n_optim)
+
+    def surrogate_search(self, max_fits=None, max_time=None, n_jobs=1,
+                         criterion='BIC', n_optim=10, **kwargs):
+        """ Search guided by a random forest of the criteria, choosing
+        batches of models by expected improvement (see
+        operations.smac_optim). Evaluations are appended to the evaluation
+        file.
+
+        Parameters
+        ----------
+        max_fits : int, optional
+            maximal number of evaluated models
+
+        max_time : float, optional
+            maximal wall-clock time in seconds
+
+        n_jobs : int, optional
+            number of worker processes, models evaluated per batch
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
+
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        kwargs : dict
+            n_initial, n_trees and random_prob of SurrogateSearch
+
+        Returns
+        -------
+        (str, dict)
+            best model and its evaluation, None if no model was fitted
+
+        """
+
+        if criterion not in CRITERIA:
+            raise ValueError("criterion needs to be one of {}".format(
+                ", ".join(CRITERIA)))
+
+        self.evaluated = set()
+        search = SurrogateSearch(self, criterion=criterion, **kwargs)
+        return search.run(max_fits=max_fits, max_time=max_time,
+                          n_jobs=n_jobs, n_optim=n_optim)
+
+    def start_pool(self, n_jobs=1, n_optim=10):
+        """ Pool of worker processes evaluating candidates
+
+        Parameters
+        ----------
+        n_jobs : int, optional
+            number of worker processes, 1 evaluates in the main process
+
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        Returns
+        -------
+        concurrent.futures.Executor
+            pool with a submit method, to be used as a context manager
+
+        """
+
+        settings = self.eval_settings(n_optim)
+        if self.warm_starts is None:
+            self.warm_starts = WarmStarts(self.parent.is_param)
+
+        if n_jobs == 1:
+            _init_worker(settings)
+            return _SerialPool()
+
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                                   initargs=(settings,))
+
+    def submit(self, pool, candidate):
+        """ Submit a candidate to the pool, starting its fit at the
+        estimates of the nearest fitted candidate
+
+        Parameters
+        ----------
+        pool : concurrent.futures.Executor
+            pool of start_pool
+
+        candidate : (str, ndarray, list)
+            candidate (see sample_candidate)
+
+        Returns
+        -------
+        concurrent.futures.Future
+            (model, evaluation)
+
+        """
+
+        x0 = self.warm_starts.initial_estimates(*candidate[1:])
+        return pool.submit(_evaluate, candidate, x0)
+
+    def complete(self, candidate, evaluation, criterion='BIC'):
+        """ Record the evaluation of a candidate and keep its estimates as
+        a warm start
+
+        Parameters
+        ----------
+        candidate : (str, ndarray, list)
+            evaluated candidate
+
+        evaluation : dict
+            fit result, None if the model is not identifiable
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
+
+        """
+
+        word, mask, names = candidate
+        self.record(word, evaluation, criterion=criterion)
+        if evaluation is not None:
+            self.warm_starts.add(mask, names, evaluation['ParamAssignment'])
+
+    def evaluate_batch(self, pool, candidates, criterion='BIC'):
+        """ Evaluate candidates concurrently and record their evaluations
+
+        Parameters
+        ----------
+        pool : concurrent.futures.Executor
+            pool of start_pool
+
+        candidates : [(str, ndarray, list)]
+            candidates (see sample_candidate)
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
+
+        Returns
+        -------
+        [dict]
+            evaluations in the order of the candidates, None for models
+            that are not identifiable
+
+        """
+
+        futures = [self.submit(pool, candidate) for candidate in candidates]
+        evaluations = []
+        for candidate, future in zip(candidates, futures):
+            evaluation = future.result()[1]
+            self.complete(candidate, evaluation, criterion)
+            evaluations.append(evaluation)
+        return evaluations
+
+    def save_checkpoint(self, n_fits, elapsed, pending):
+        """ Save the search state to the checkpoint file (atomically)
+
+        Parameters
+        ----------
+        n_fits : int
+            number of fitted models
+
+        elapsed : float
+            seconds spent searching
+
+        pending : [(str, ndarray, list)]
+            candidates sampled but not yet evaluated, in order of sampling
+            (see sample_candidate)
+
+        """
+
+        state = {'n_fits': n_fits,
+                 'elapsed': elapsed,
+                 'pending': pending,
+                 'warm_starts': self.warm_starts,
+                 'np_random': np.random.get_state(),
+                 'random': random.getstate()}
+
+        tmp_file = self.checkpoint_file + '.tmp'
+        with open(tmp_file, 'wb') as ckpt_file:
+            pickle.dump(state, ckpt_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def resume(self, criterion='BIC'):
+        """ Restore the search state of the checkpoint file and the
+        evaluated models of the evaluation file
+
+        Parameters
+        ----------
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
+
+        Returns
+        -------
+        dict
+            n_fits, elapsed and pending of the checkpoint
+
+        """
+
+        with open(self.checkpoint_file, 'rb') as ckpt_file:
+            state = pickle.load(ckpt_file)
+        np.random.set_state(state['np_random'])
+        random.setstate(state['random'])
+        self.warm_starts = state['warm_starts']
 
-        subst = substitution.Substitution(param_rgs)
-        model = MPT(subst.apply(del_tree))
-        model.subtrees = subtrees
+        self.best = None
+        self.evaluated = set()
+        for model, evaluation in self.read_evaluations():
+            self.evaluated.add(model)
+            if evaluation is not None and (self.best is None or
+                                           evaluation[criterion] <
+                                           self.best[1][criterion]):
+                self.best = (model, evaluation)
 
-        if props.check(model, 'identifiable'):
+        print("Resuming search after {} models".format(state['n_fits']))
+        sys.stdout.flush()
+        return state
 
-            evaluation = fitting.fit_mpt(
-                model, self.func, self.data_path, sep=self.sep)
-            print(str(model))
-            print(evaluation)
-            print()
+    def record(self, model, evaluation, criterion='BIC'):
+        """ Write an evaluation to the evaluation file and keep track of the
+        best model
+
+        Parameters
+        ----------
+        model : str
+            evaluated model
+
+        evaluation : dict
+            fit result, None if the model is not identifiable
+
+        criterion : ['AIC', 'BIC', 'G2'], optional
+            criterion selecting the best model
+
+        """
+
+        self.evaluated.add(model)
+        self.write_to_file(model, evaluation)
+        if evaluation is None:
+            return
+
+        if self.best is None or evaluation[criterion] < \
+                self.best[1][criterion]:
+            self.best = (model, evaluation)
+            print("Best model ({}={:.4f}): {}".format(
+                criterion, evaluation[criterion], model))
             sys.stdout.flush()
-            return str(model), evaluation
 
-        return None, None
+    def eval_settings(self, n_optim=10):
+        """ Everything needed to evaluate candidate models in another
+        process
+
+        Parameters
+        ----------
+        n_optim : int, optional
+            number of optimization runs per fit
+
+        Returns
+        -------
+        dict
+            leaf_test, n_trees, subtrees, parent, func, data, n_optim,
+            cache_file and the fingerprint of data and fit settings for the
+            cache
+
+        """
+
+        data = fitter.read_data(
+            self.data_path, self.sep,
+            n_categories=len(self.mpt.compile().categories))
+        return {'leaf_test': self.mpt.word.is_leaf,
+                'n_trees': len(self.mpt.trees),
+                'subtrees': self.mpt.subtrees,
+                'parent': self.parent,
+                'func': self.func,
+                'data': data,
+                'n_optim': n_optim,
+                'cache_file': self.cache_file,
+                'fingerprint': eval_cache.settings_key(
+                    data, func=self.func, n_optim=n_optim)}
+
+    @property
+    def parent(self):
+        """ Precomputed paths of the original model, from which the
+        candidates are compiled
+
+        """
+
+        if self._parent is None:
+            self._parent = ParentModel(self.mpt)
+        return self._parent
+
+    def sample_model(self):
+        """ Draw a random deletion and substitution model
+
+        Returns
+        -------
+        str
+            model in the BMPT language, trees joined with dummy nodes
+
+        """
+
+        return self.sample_candidate()[0]
+
+    def original_candidate(self):
+        """ The original model as a candidate
+
+        Returns
+        -------
+        str, ndarray, list
+            model, mask and parameter names (see sample_candidate)
+
+        """
+
+        tokens = self.parent.tokens
+        return (str(self.mpt), np.ones(len(tokens), dtype=np.uint8),
+                list(tokens))
+
+    def sample_candidate(self):
+        """ Draw a random deletion and substitution model as a submodel of
+        the original model
 
+        Returns
+        -------
+        str, ndarray, list
+            model in the BMPT language (trees joined with dummy nodes), mask
+            of the kept tokens of the original model and the name of every
+            token in the model
+
+        """
+
+        mask = self.random_deletion_masks(1)[0]
+        tokens = self.parent.tokens
+        sep = self.mpt.word.sep
+        del_tree = MPTWord(sep.join(compress(tokens, mask)), sep=sep,
+                           leaf_test=self.mpt.word.is_leaf)
+        param_rgs = self.random_substitution_configs(del_tree)
+
+        # the blocks of a parameter in order of its occurrences
+        blocks = {param: iter(config) for param, config in param_rgs.items()}
+        names = list(tokens)
+        for idx in np.flatnonzero(mask):
+            if tokens[idx] in blocks:
+                block = next(blocks[tokens[idx]])
+                if block != 0:
+                    names[idx] = tokens[idx] + str(block)
+
+        word = sep.join(names[idx] for idx in np.flatnonzero(mask))
+        return word, mask, names
+
+    def eval_random_model(self, subtrees=None):
+        candidate = self.sample_candidate()
+        model = candidate[0]
+        settings = self.eval_settings()
+        if subtrees is not None:
+            settings['subtrees'] = subtrees
+
+        _init_worker(settings)
+        _, evaluation = _evaluate(candidate)
+        if evaluation is None:
+            return None, None
+
+        print(model)
+        print(evaluation)
+        print()
+        sys.stdout.flush()
+        return model, evaluation
 
     def random_substitution_configs(self, model):
+        """ Draw a substitution for every parameter of a model uniformly at
+        random
+
+        Parameters
+        ----------
+        model : MPTWord
+            model to be modified
+
+        Returns
+        -------
+        dict
+            {parameter : rgs}, all zeros for ignored parameters
+
+        """
+
         param_nos = Counter(model.parameters)
-        rand_perm = {param: np.random.randint(0, RGS_enum(param_nos[param])) for param in param_nos}
 
         param_rgs = {}
-        for param in rand_perm.keys():
-            rand = rand_perm[param]
-            param_count = param_nos[param]
-
+        for param, param_count in param_nos.items():
             if param in self.ignore_params:
-                rgs = [0] * param_count
+                param_rgs[param] = [0] * param_count
             else:
-                rgs = substitution.get_RGS(rand, param_count)
-            param_rgs[param] = rgs
+                param_rgs[param] = rgs.random_rgs(param_count)[0].tolist()
         return param_rgs
 
 
     def random_deletion_model(self):
-        deletion_no = np.random.randint(0, self.no_del_trees)
-        del_tree = self.deletion.read_number(deletion_no)
+        return self.random_deletion_models(1)[0]
+
+    def random_deletion_models(self, n_models):
+        """ Draw deletion candidates uniformly at random (see
+        random_deletion_masks)
+
+        Parameters
+        ----------
+        n_models : int
+            number of candidates
+
+        Returns
+        -------
+        [MPTWord]
+        """
 
-        del_tree = MPTWord(
-            del_tree,
-            sep=self.mpt.word.sep,
-            leaf_test=self.mpt.word.is_leaf)
+        tokens = self.parent.tokens
+        sep = self.mpt.word.sep
+        return [MPTWord(sep.join(compress(tokens, mask)), sep=sep,
+                        leaf_test=self.mpt.word.is_leaf)
+                for mask in self.random_deletion_masks(n_models)]
 
-        return del_tree
+    def random_deletion_masks(self, n_models):
+        """ Draw deletion candidates uniformly at random. Without a
+        generated candidate file, the candidates are sampled from the counted
+        candidate space directly (uniform over masks, i.e. before the
+        deduplication by abstract form).
+
+        Parameters
+        ----------
+        n_models : int
+            number of candidates
+
+        Returns
+        -------
+        ndarray
+            (n_models, n_tokens) 0/1 masks of the kept tokens of the
+            original model
+        """
+
+        if not os.path.exists(self.deletion.out):
+            n_candidates = self.deletion.count()
+            masks = [self.deletion.unrank(random.randrange(n_candidates))
+                     for _ in range(n_models)]
+            return np.array(masks, dtype=np.uint8).reshape(n_models, -1)
+
+        store = self.deletion.store
+        return store.masks(np.random.randint(0, len(store), size=n_models))
 
 
     def write_to_file(self, model, evaluation):
+        """ Append an evaluation to the evaluation file as a JSON line
+
+        Parameters
+        ----------
+        model : str
+            evaluated model
+
+        evaluation : dict
+            fit result, None if the model is not identifiable
+
+        """
+
+        line = json.dumps({'model': model, 'evaluation': evaluation},
+                          default=eval_cache.to_json)
         with open(self.eval_file, 'a') as out_file:
-            out_file.write(" ".join([model, str(evaluation)]))
+            out_file.write(line)
             out_file.write("\n")
+            out_file.flush()
+
+    def read_evaluations(self):
+        """ The evaluations in the evaluation file. A line cut off by an
+        interrupted write is ignored.
+
+        Yields
+        ------
+        str, dict
+            model and its evaluation (None if not identifiable)
+
+        """
+
+        if not os.path.exists(self.eval_file):
+            return
+        with open(self.eval_file) as eval_file:
+            for line in eval_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                yield entry['model'], entry['evaluation']
+
+
+def evaluate_model(model, settings, cache=None, x0=None):
+    """ Check a candidate model for identifiability and fit it, unless it
+    is in the cache
+
+    Parameters
+    ----------
+    model : str or CompiledMPT
+        model in the BMPT language (trees joined with dummy nodes) or the
+        compiled model
+
+    settings : dict
+        evaluation settings (see Optimizer.eval_settings)
+
+    cache : EvalCache, optional
+        cache of evaluations
+
+    x0 : dict, optional
+        initial parameter estimates (see fitting.optimize.fit_classical)
+
+    Returns
+    -------
+    dict
+        fit result, None if the model is not identifiable
+
+    """
+
+    if not isinstance(model, CompiledMPT):
+        model = MPT(model, leaf_test=settings['leaf_test'])
+
+        # fit multi-tree models natively without the dummy join nodes
+        model = MPT(joint_tree.split(model.root, settings['n_trees']),
+                    leaf_test=settings['leaf_test']).compile()
+
+    # checked before the cache: a model with parameters without effect
+    # shares its formula form with its identifiable reduction
+    if not props.identifiable(model):
+        return None
+
+    if cache is not None:
+        found, evaluation = cache.get(model, settings['fingerprint'])
+        if found:
+            return evaluation
+
+    evaluation = fitting.fit_compiled(model, settings['func'],
+                                      settings['data'],
+                                      n_optim=settings['n_optim'], x0=x0)
+
+    if cache is not None:
+        cache.put(model, settings['fingerprint'], evaluation)
+    return evaluation
+
+
+def evaluate_candidate(candidate, settings, cache=None, x0=None):
+    """ Evaluate a candidate compiled as a submodel of the original model
+
+    Parameters
+    ----------
+    candidate : (str, ndarray, list)
+        candidate (see Optimizer.sample_candidate)
+
+    settings : dict
+        evaluation settings (see Optimizer.eval_settings)
+
+    cache : EvalCache, optional
+        cache of evaluations
+
+    x0 : dict, optional
+        initial parameter estimates (see fitting.optimize.fit_classical)
+
+    Returns
+    -------
+    dict
+        fit result, None if the model is not identifiable
+
+    """
+
+    _, mask, names = candidate
+    model = settings['parent'].submodel(mask, names)
+    return evaluate_model(model, settings, cache, x0=x0)
+
+
+# evaluation settings and cache of a worker process
+_WORKER = {}
+
+
+def _init_worker(settings):
+    cache = _WORKER.get('cache')
+    if cache is None or cache.path != settings['cache_file']:
+        if cache is not None:
+            cache.close()
+        cache = eval_cache.EvalCache(settings['cache_file'])
+    _WORKER['settings'] = settings
+    _WORKER['cache'] = cache
+
+
+def _evaluate(candidate, x0=None):
+    return candidate[0], evaluate_candidate(
+        candidate, _WORKER['settings'], _WORKER['cache'], x0=x0)
+
+
+class _SerialPool(object):
+    """ Runs tasks in the main process, with the interface of the process
+    pool
+
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, func, *args):
+        from concurrent.futures import Future
+
+        future = Future()
+        future.set_result(func(*args))
+        return future
@@ -0,0 +1,155 @@
+""" Warm starts of candidate fits.
+
+Candidates of the model search are submodels of the original model, given
+by a mask of the kept tokens and a parameter name for every token (see
+compiled_mpt.ParentModel). A candidate differs from the models fitted
+before by a few deletions and ties, so the estimates of the nearest fitted
+model are a good initial point: every node kept in both models starts at
+the estimate of its parameter in the fitted model, tied nodes at the mean
+of their estimates. Nodes that were deleted in the fitted model start at
+random values.
+
+The nearest model has the fewest differently kept tokens and, among those,
+the fewest nodes whose ties differ.
+
+"""
+
+import numpy as np
+
+
+# number of fitted models kept as references
+WARM_START_SIZE = 1000
+
+# number of the most recent models at minimal mask distance whose ties are
+# compared
+MAX_TIE_COMPARISONS = 20
+
+
+class WarmStarts(object):
+    """ Estimates of the most recently fitted candidates
+
+    """
+
+    def __init__(self, is_param, size=WARM_START_SIZE):
+        """ Creates an empty store.
+
+        Parameters
+        ----------
+        is_param : array_like
+            flags over the tokens of the original model, whether the token
+            is a parameter (see ParentModel.is_param)
+
+        size : int, optional
+            maximal number of fitted models kept
+
+        """
+
+        self.is_param = np.asarray(is_param, dtype=bool)
+        self.size = size
+        self.masks = np.zeros((size, len(self.is_param)), dtype=bool)
+        self.models = [None] * size
+        self.n_models = 0
+
+    def __len__(self):
+        return min(self.n_models, self.size)
+
+    def add(self, mask, names, estimates):
+        """ Keep the estimates of a fitted candidate, replacing the oldest
+        one if the store is full
+
+        Parameters
+        ----------
+        mask : array_like
+            0/1 flags over the tokens, whether the token is kept
+
+        names : sequence
+            parameter name of every token
+
+        estimates : dict
+            {parameter : estimate}
+
+        """
+
+        slot = self.n_models % self.size
+        self.masks[slot] = np.asarray(mask, dtype=bool)
+        self.models[slot] = (list(names), dict(estimates))
+        self.n_models += 1
+
+    def initial_estimates(self, mask, names):
+        """ Estimates of the nearest fitted model mapped onto a candidate
+
+        Parameters
+        ----------
+        mask : array_like
+            0/1 flags over the tokens, whether the token is kept
+
+        names : sequence
+            parameter name of every token
+
+        Returns
+        -------
+        dict
+            {parameter : initial estimate} for the parameters of the
+            candidate at nodes kept in the nearest model, None if no model
+            was fitted yet
+
+        """
+
+        if not len(self):
+            return None
+
+        mask = np.asarray(mask, dtype=bool)
+        ref_mask, (ref_names, estimates) = self.nearest(mask, names)
+
+        values = {}
+        for idx in np.flatnonzero(mask & ref_mask & self.is_param):
+            estimate = estimates.get(ref_names[idx])
+            if estimate is not None:
+                values.setdefault(names[idx], []).append(estimate)
+        return {param: float(np.mean(estimate))
+                for param, estimate in values.items()}
+
+    def nearest(self, mask, names):
+        """ The fitted model nearest to a candidate
+
+        Parameters
+        ----------
+        mask : ndarray
+            flags over the tokens, whether the token is kept
+
+        names : sequence
+            parameter name of every token
+
+        Returns
+        -------
+        ndarray, (list, dict)
+            mask, parameter names and estimates of the nearest model
+
+        """
+
+        distances = (self.masks[:len(self)] != mask).sum(axis=1)
+        closest = np.flatnonzero(distances == distances.min())
+
+        # most recent first
+        order = np.argsort((closest - self.n_models) % self.size)[::-1]
+        closest = closest[order][:MAX_TIE_COMPARISONS]
+
+        best = min(closest, key=lambda slot: _tie_distance(
+            mask & self.masks[slot] & self.is_param, names,
+            self.models[slot][0]))
+        return self.masks[best], self.models[best]
+
+
+def _tie_distance(common, names, other_names):
+    """ Number of common nodes whose tied nodes among the common nodes
+    differ between the models
+
+    """
+
+    labels = [{}, {}]
+    distance = 0
+    for idx in np.flatnonzero(common):
+        first = [label.setdefault(name[idx], idx)
+                 for label, name in zip(labels, (names, other_names))]
+        distance += first[0] != first[1]
+    return distance
@@ -2,7 +2,25 @@
 
 """
 
-import re
+from collections import Counter, OrderedDict
+import itertools as it
+
+import numpy as np
+
+from mptpy.compiled_mpt import CompiledMPT
+from mptpy.mpt import MPT
+from mptpy.tools import joint_tree
+
+
+# number of random parameter points for the rank test
+N_POINTS = 5
+
+# {canonical form : non-identified combinations as parameter indices}
+_CACHE = OrderedDict()
+_CACHE_SIZE = 10000
+
+# maximal number of parameter labelings compared for the formula form
+MAX_LABELINGS = 120
 
 
 def check(mpt, mpt_property):
@@ -26,11 +44,11 @@ def check(mpt, mpt_property):
     return globals()[mpt_property](mpt)
 
 def identifiable(mpt):
-    """ Check for identifiability
+    """ Check for (local) identifiability
 
     Parameters
     ----------
-    mpt : MPT
+    mpt : MPT or CompiledMPT
         MPT to be checked for identifiability
 
     Returns
@@ -40,12 +58,326 @@ def identifiable(mpt):
 
     """
 
-    max_params = 0
-    for subtree in mpt.subtrees:
-        max_params += len(subtree) - 1
+    if isinstance(mpt, CompiledMPT):
+        max_params = len(mpt.categories) - mpt.n_trees
+        if len(mpt.params) > max_params:
+            return False
+        return not non_identified(mpt)
+
+    trees = mpt.trees
+    if len(trees) == 1 and len(mpt.subtrees) > 1:
+        # single tree joined from several trees with dummy nodes
+        trees = joint_tree.split(mpt.root, len(mpt.subtrees))
+
+    # necessary condition: no more parameters than degrees of freedom
+    max_params = sum([len(root.categories()) - 1 for root in trees])
+    free_params = MPT(trees).params
+    if len(set(free_params)) > max_params:
+        return False
+
+    return not non_identified(mpt)
+
+
+def non_identified(mpt):
+    """ Parameter combinations that are not locally identified. The
+    Jacobian of the category probabilities is evaluated at a batch of random
+    parameter points; its null space at the point of maximal rank couples
+    the parameters that can be traded off against each other.
+
+    Results are cached by the canonical form of the model (its branch
+    structure up to parameter and category names).
+
+    Parameters
+    ----------
+    mpt : MPT or CompiledMPT
+        MPT to be checked
+
+    Returns
+    -------
+    [tuple]
+        groups of parameters that are not identified, empty if the model is
+        locally identifiable
+
+    """
+
+    model = mpt if isinstance(mpt, CompiledMPT) else mpt.compile()
+
+    key = canonical_form(model)
+    groups = _CACHE.get(key)
+    if groups is None:
+        groups = _null_space_groups(model)
+        _CACHE[key] = groups
+        if len(_CACHE) > _CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    else:
+        _CACHE.move_to_end(key)
+
+    return [tuple(sorted(model.params[idx] for idx in group))
+            for group in groups]
+
+
+def separable_params(mpt):
+    """ Parameters whose maximum likelihood estimate has a closed form: the
+    parameter occurs at a single node, the categories below the node occur
+    nowhere else, and its positive and negative subtree share no category.
+    The estimate is the proportion of the observations below the node that
+    fall into the positive subtree, independent of all other parameters.
+
+    Parameters
+    ----------
+    mpt : MPT
+        MPT to be checked
+
+    Returns
+    -------
+    [str]
+        separable parameters in order of their first occurrence
+
+    """
+
+    occurrences = Counter(mpt.params)
+    leaves = Counter()
+    for root in mpt.trees:
+        leaves.update(root.categories())
+
+    separable = []
+    for root in mpt.trees:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                continue
+            stack.append(node.neg)
+            stack.append(node.pos)
+
+            if occurrences[node.content] != 1:
+                continue
+            pos = node.pos.categories()
+            neg = node.neg.categories()
+            if pos.keys() & neg.keys():
+                continue
+            if all(leaves[cat] == count
+                   for cat, count in (pos + neg).items()):
+                separable.append(node.content)
+
+    return separable
+
+
+def canonical_form(model):
+    """ Form of a compiled model that ignores the names of parameters and
+    categories. Parameters are numbered in order of their first occurrence.
+
+    Parameters
+    ----------
+    model : CompiledMPT
+        compiled model
+
+    Returns
+    -------
+    tuple
+        hashable canonical form
+
+    """
+
+    return (model.branch_pos.shape, model.branch_cats.tobytes(),
+            model.branch_pos.tobytes(), model.branch_neg.tobytes(),
+            model.cat_trees.tobytes())
+
+
+def formula_form(model):
+    """ Form of the category formulae of a compiled model that ignores the
+    names of the parameters. Branches of a category that differ only in
+    p and (1-p) of one parameter are merged (x * p + x * (1-p) = x) until
+    no such pair is left, so that models with different trees but equal
+    category probabilities share their form. The parameters are then
+    labeled by color refinement; ties are broken by comparing the encodings
+    of up to MAX_LABELINGS labelings.
+
+    Equal forms imply equal category formulae up to parameter names. In
+    rare cases with many symmetric parameters, equivalent models may get
+    different forms.
+
+    Parameters
+    ----------
+    model : CompiledMPT
+        compiled model
+
+    Returns
+    -------
+    tuple, [str]
+        hashable form and the parameters of the model that remain after the
+        merging, in canonical order
+
+    """
+
+    branches = _merged_branches(model)
+    n_params = len(model.params)
+    used = [idx for idx in range(n_params)
+            if any(pos[idx] or neg[idx] for _, pos, neg, _ in branches)]
+
+    best = None
+    for order in _labelings(branches, used):
+        encoding = tuple(sorted(
+            (cat, count, tuple(pos[idx] for idx in order),
+             tuple(neg[idx] for idx in order))
+            for cat, pos, neg, count in branches))
+        if best is None or encoding < best[0]:
+            best = (encoding, order)
+
+    encoding, order = best
+    form = (len(order), len(model.categories), tuple(model.cat_trees.tolist()),
+            encoding)
+    return form, [model.params[idx] for idx in order]
+
+
+def _merged_branches(model):
+    """ Branches with merged p/(1-p) pairs
+
+    Returns
+    -------
+    [(int, tuple, tuple, int)]
+        category, exponents of p and (1-p), and multiplicity of each
+        distinct branch
+
+    """
+
+    counts = Counter(zip(model.branch_cats.tolist(),
+                         map(tuple, model.branch_pos.tolist()),
+                         map(tuple, model.branch_neg.tolist())))
+
+    merged = True
+    while merged:
+        merged = False
+        for (cat, pos, neg), count in list(counts.items()):
+            if not counts[(cat, pos, neg)]:
+                continue
+            for idx, exp in enumerate(pos):
+                if not exp:
+                    continue
+                # partner with (1-p) instead of p
+                base_pos = pos[:idx] + (exp - 1,) + pos[idx + 1:]
+                partner = (cat, base_pos,
+                           neg[:idx] + (neg[idx] + 1,) + neg[idx + 1:])
+                n_pairs = min(counts[(cat, pos, neg)], counts[partner])
+                if not n_pairs:
+                    continue
+                counts[(cat, pos, neg)] -= n_pairs
+                counts[partner] -= n_pairs
+                counts[(cat, base_pos, neg)] += n_pairs
+                merged = True
+                break
+
+    return [(cat, pos, neg, count)
+            for (cat, pos, neg), count in counts.items() if count]
+
+
+def _labelings(branches, params):
+    """ Parameter orders of the individualization-refinement search
+
+    Yields
+    ------
+    [int]
+        parameter indices in a candidate canonical order
+
+    """
+
+    budget = [MAX_LABELINGS]
+
+    def search(colors):
+        colors = _refine(branches, colors)
+        classes = {}
+        for param in params:
+            classes.setdefault(colors[param], []).append(param)
+        tied = [members for _, members in sorted(classes.items())
+                if len(members) > 1]
+
+        if not tied:
+            budget[0] -= 1
+            yield sorted(params, key=lambda param: colors[param])
+            return
+
+        for member in tied[0]:
+            if budget[0] <= 0 and member != tied[0][0]:
+                return
+            individualized = {param: 2 * color
+                              for param, color in colors.items()}
+            individualized[member] -= 1
+            for order in search(individualized):
+                yield order
+
+    return search(dict.fromkeys(params, 0))
+
+
+def _refine(branches, colors):
+    """ Color refinement of the parameters by their occurrences
+
+    """
+
+    n_colors = len(set(colors.values()))
+    while True:
+        signatures = {}
+        for param, color in colors.items():
+            occurrences = []
+            for cat, pos, neg, count in branches:
+                if not pos[param] and not neg[param]:
+                    continue
+                others = sorted(
+                    (colors[other], pos[other], neg[other])
+                    for other in colors
+                    if other != param and (pos[other] or neg[other]))
+                occurrences.append(
+                    (cat, count, pos[param], neg[param], tuple(others)))
+            signatures[param] = (color, tuple(sorted(occurrences)))
+
+        ranks = {signature: rank for rank, signature in
+                 enumerate(sorted(set(signatures.values())))}
+        colors = {param: ranks[signature]
+                  for param, signature in signatures.items()}
+        if len(ranks) == n_colors:
+            return colors
+        n_colors = len(ranks)
+
+
+def _null_space_groups(model):
+    """ Groups of parameter indices coupled by the null space of the
+    Jacobian
+
+    """
+
+    n_params = len(model.params)
+    if not n_params:
+        return []
+
+    rand = np.random.RandomState(0)
+    theta = rand.uniform(0.1, 0.9, size=(N_POINTS, n_params))
+    jac = model.jacobian(theta)
+
+    ranks = np.linalg.matrix_rank(jac)
+    best = int(np.argmax(ranks))
+    rank = ranks[best]
+    if rank == n_params:
+        return []
+
+    # projector onto the null space, parameters with non-negligible entries
+    # are not identified, and coupled entries belong to the same group
+    _, _, vt = np.linalg.svd(jac[best])
+    null_space = vt[rank:]
+    projector = np.abs(null_space.T @ null_space) > 1e-8
 
-    free_params = [
-        x for x in set(mpt.word.parameters) if not re.match(r'y\d+', x)
-    ]
+    groups = []
+    assigned = set()
+    for idx in range(n_params):
+        if idx in assigned or not projector[idx, idx]:
+            continue
+        group = set()
+        stack = [idx]
+        while stack:
+            param = stack.pop()
+            if param in group:
+                continue
+            group.add(param)
+            stack.extend(np.nonzero(projector[param])[0].tolist())
+        assigned.update(group)
+        groups.append(tuple(sorted(group)))
 
-    return len(free_params) <= max_params
+    return groups
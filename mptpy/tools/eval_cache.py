@@ -0,0 +1,229 @@
+""" Persistent cache of model evaluations.
+
+Evaluations are keyed by the form of the category formulae of the model
+(up to parameter names and equivalent branch sets, see
+properties.formula_form), its number of parameters and a fingerprint of the data and fit settings, so
+a model that is statistically the same as one evaluated before is not
+fitted again. Parameter estimates are stored in the canonical parameter
+order and renamed on lookup.
+
+Recent entries are held in memory, all entries in an SQLite database that
+can be shared by several processes.
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+
+import mptpy
+from mptpy.properties import properties
+
+
+CACHE_SIZE = 10000
+
+# seconds to wait for a database locked by another process
+DB_TIMEOUT = 30.
+
+# key of the parameter estimates in an evaluation
+ASSIGNMENT = 'ParamAssignment'
+
+
+def settings_key(data, **settings):
+    """ Fingerprint of the data and the fit settings
+
+    Parameters
+    ----------
+    data : ndarray
+        observations
+
+    settings : dict
+        fit settings (JSON serializable)
+
+    Returns
+    -------
+    str
+        hex digest
+
+    """
+
+    data = np.ascontiguousarray(data, dtype=float)
+    digest = hashlib.sha256(mptpy.__version__.encode() + b'\0')
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    digest.update(str(data.shape).encode())
+    digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+def model_key(model, settings):
+    """ Key of a model evaluation in the cache
+
+    Parameters
+    ----------
+    model : CompiledMPT
+        compiled model
+
+    settings : str
+        fingerprint of the data and fit settings (see settings_key)
+
+    Returns
+    -------
+    str, [str]
+        hex digest and the parameters of the model in canonical order
+
+    """
+
+    form, params = properties.formula_form(model)
+    digest = hashlib.sha256(settings.encode() + b'\0')
+    # the form drops parameters without effect, the key keeps their number
+    digest.update(repr((len(model.params), form)).encode())
+    return digest.hexdigest(), params
+
+
+class EvalCache(object):
+    """ Evaluations in memory (LRU) and on disk (SQLite)
+
+    """
+
+    def __init__(self, path=None, size=CACHE_SIZE):
+        """ Opens the cache.
+
+        Parameters
+        ----------
+        path : str, optional
+            path of the database, None for an in-memory cache only
+
+        size : int, optional
+            maximal number of evaluations held in memory
+
+        """
+
+        self.path = path
+        self.size = size
+        self._memory = OrderedDict()
+        self._db = None
+
+        if path is not None:
+            try:
+                self._db = sqlite3.connect(path, timeout=DB_TIMEOUT)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('CREATE TABLE IF NOT EXISTS evaluations '
+                                 '(key TEXT PRIMARY KEY, value TEXT)')
+                self._db.commit()
+            except sqlite3.Error:
+                self._db = None
+
+    def get(self, model, settings):
+        """ Cached evaluation of a model
+
+        Parameters
+        ----------
+        model : CompiledMPT
+            compiled model
+
+        settings : str
+            fingerprint of the data and fit settings
+
+        Returns
+        -------
+        (bool, dict)
+            whether the model was found, and its evaluation (None if the
+            model is not identifiable) with the model's parameter names
+
+        """
+
+        key, params = model_key(model, settings)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return True, _rename(self._memory[key], params)
+
+        if self._db is None:
+            return False, None
+        try:
+            row = self._db.execute(
+                'SELECT value FROM evaluations WHERE key = ?',
+                (key,)).fetchone()
+        except sqlite3.Error:
+            return False, None
+        if row is None:
+            return False, None
+
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return True, _rename(value, params)
+
+    def put(self, model, settings, evaluation):
+        """ Store the evaluation of a model. Failures of the database are
+        ignored, the cache is an optimization only.
+
+        Parameters
+        ----------
+        model : CompiledMPT
+            compiled model
+
+        settings : str
+            fingerprint of the data and fit settings
+
+        evaluation : dict
+            fit result, None if the model is not identifiable
+
+        """
+
+        key, params = model_key(model, settings)
+        value = evaluation
+        if evaluation is not None:
+            assignment = evaluation.get(ASSIGNMENT, {})
+            value = dict(evaluation, **{ASSIGNMENT: [
+                assignment.get(param) for param in params]})
+        value = json.loads(json.dumps(value, default=to_json))
+
+        self._remember(key, value)
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO evaluations VALUES (?, ?)',
+                    (key, json.dumps(value)))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """ Close the database
+
+        """
+
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+
+def to_json(value):
+    """ JSON representation of the NumPy values in fit results
+
+    """
+
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{} is not JSON serializable".format(type(value)))
+
+
+def _rename(value, params):
+    """ Evaluation with the parameter estimates named after params
+
+    """
+
+    if value is None:
+        return None
+    return dict(value, **{ASSIGNMENT: dict(zip(params, value[ASSIGNMENT]))})
@@ -0,0 +1,137 @@
+""" Sorting and deduplication of streams that do not fit into memory.
+
+Items are collected in sorted runs of bounded size. Runs that fill up are
+spilled to temporary files. While there are more runs than the fan-in,
+consecutive groups of them are merged into longer runs on disk; the last
+runs are merged lazily. The memory needed and the number of open files
+depend on the run size and the fan-in only, not on the number of items.
+
+"""
+
+import heapq
+import itertools as it
+import os
+import pickle
+import tempfile
+
+
+RUN_SIZE = 100000
+
+# maximal number of runs merged at once
+FAN_IN = 64
+
+# number of items pickled together in a run file
+_CHUNK_SIZE = 1000
+
+
+def unique_sorted(items, run_size=RUN_SIZE, tmp_dir=None, fan_in=FAN_IN):
+    """ Sort (key, value) pairs by key and keep the first value of each key
+
+    Parameters
+    ----------
+    items : iterable
+        (key, value) pairs. Among pairs with equal keys, the first one of the
+        stream is kept.
+
+    run_size : int, optional
+        maximal number of pairs held in memory
+
+    tmp_dir : str, optional
+        directory for the run files. Default: system temporary directory.
+
+    fan_in : int, optional
+        maximal number of runs merged at once, at least 2
+
+    Yields
+    ------
+    key, value
+        unique pairs in key order
+
+    """
+
+    if fan_in < 2:
+        raise ValueError("the fan-in needs to be at least 2")
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        runs = []
+        items = iter(items)
+        while True:
+            run = _sorted_run(it.islice(items, run_size))
+            if not run:
+                break
+            if len(run) < run_size and not runs:
+                # everything fits into memory
+                runs.append(run)
+                break
+            runs.append(_spill(run, os.path.join(run_dir, str(len(runs)))))
+
+        n_spilled = len(runs)
+        while len(runs) > fan_in:
+            merged = []
+            for start in range(0, len(runs), fan_in):
+                group = runs[start:start + fan_in]
+                path = os.path.join(run_dir, str(n_spilled))
+                n_spilled += 1
+                merged.append(_spill(_merge_unique(group), path))
+                for run in group:
+                    os.remove(run.path)
+            runs = merged
+
+        for pair in _merge_unique(runs):
+            yield pair
+
+
+def _merge_unique(runs):
+    """ Merge sorted runs, keeping the first pair of each key. The merge is
+    stable: equal keys keep the order of the runs.
+
+    """
+
+    merged = heapq.merge(*[iter(run) for run in runs],
+                         key=lambda pair: pair[0])
+    for _, group in it.groupby(merged, key=lambda pair: pair[0]):
+        yield next(group)
+
+
+def _sorted_run(items):
+    """ Sort a run, the original position breaks ties
+
+    """
+
+    return sorted(items, key=lambda pair: pair[0])
+
+
+def _spill(run, path):
+    """ Write a sorted run (an iterable) to a file and return a reader for
+    it
+
+    """
+
+    run = iter(run)
+    with open(path, 'wb') as run_file:
+        while True:
+            chunk = list(it.islice(run, _CHUNK_SIZE))
+            if not chunk:
+                break
+            pickle.dump(chunk, run_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return _RunReader(path)
+
+
+class _RunReader(object):
+    """ Lazy iterator over a spilled run
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'rb') as run_file:
+            while True:
+                try:
+                    chunk = pickle.load(run_file)
+                except EOFError:
+                    return
+                for pair in chunk:
+                    yield pair
@@ -10,8 +10,8 @@ import mptpy.mpt
 from mptpy.tools import misc
 
 
-def join(args, prefix_no=0):
-    """ Join two MPTs with dummy nodes
+def join(args):
+    """ Join MPTs into a multi-tree model
 
     Arguments
     ---------
@@ -28,12 +28,84 @@ def join(args, prefix_no=0):
     if len(args) <= 1:
         return args[0]
 
-    left, right = misc.split_half(args)
+    return mptpy.mpt.MPT([root for mpt in args for root in mpt.trees],
+                         sep=args[0].word.sep,
+                         leaf_test=args[0].word.is_leaf)
 
-    left_child = join(left, prefix_no + int(math.ceil(len(args) / 2))).root
-    right_child = join(right, prefix_no + 1).root
 
-    dummy = Node("y" + str(prefix_no), left_child, right_child)
+def join_nodes(roots, prefix_no=0):
+    """ Join trees with dummy nodes into an equivalent single tree
 
-    return mptpy.mpt.MPT(dummy,
-                         leaf_test=args[0].word.is_leaf)
+    Arguments
+    ---------
+    roots : [Node]
+        root nodes of the trees
+
+    Returns
+    -------
+    Node
+        root of the joint tree
+
+    """
+
+    if len(roots) <= 1:
+        return roots[0]
+
+    left, right = misc.split_half(roots)
+
+    left_child = join_nodes(left, prefix_no + int(math.ceil(len(roots) / 2)))
+    right_child = join_nodes(right, prefix_no + 1)
+
+    return Node("y" + str(prefix_no), left_child, right_child)
+
+
+def split(root, n_trees):
+    """ Split a tree joined by join_nodes into its trees. The dummy
+    nodes are identified by their position, not by their names.
+
+    Arguments
+    ---------
+    root : Node
+        root of the joint tree
+
+    n_trees : int
+        number of joined trees
+
+    Returns
+    -------
+    [Node]
+        root nodes of the trees
+
+    """
+
+    if n_trees <= 1:
+        return [root]
+
+    n_left = n_trees // 2
+    return split(root.pos, n_left) + split(root.neg, n_trees - n_left)
+
+
+def join_params(root, n_trees):
+    """ The parameters of the dummy nodes of a tree joined by join_nodes
+
+    Arguments
+    ---------
+    root : Node
+        root of the joint tree
+
+    n_trees : int
+        number of joined trees
+
+    Returns
+    -------
+    [str]
+        dummy parameters in prefix order
+
+    """
+
+    if n_trees <= 1:
+        return []
+
+    n_left = n_trees // 2
+    return [root.content] + join_params(root.pos, n_left) + \
+        join_params(root.neg, n_trees - n_left)
@@ -0,0 +1,122 @@
+""" Persistent cache of parsed and compiled MPT models.
+
+Parsed models are pickled into a cache directory under a key derived from
+the content of the model file and the mptpy version. Changing the file (or
+updating mptpy) therefore changes the key, so stale entries are never
+loaded.
+
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import mptpy
+from mptpy.tools.parsing import Parser
+
+
+CACHE_ENV = 'MPTPY_CACHE_DIR'
+
+
+def default_cache_dir():
+    """ The cache directory, $MPTPY_CACHE_DIR or ~/.cache/mptpy
+
+    Returns
+    -------
+    str
+        path to the cache directory
+
+    """
+
+    return os.environ.get(
+        CACHE_ENV, os.path.join(os.path.expanduser('~'), '.cache', 'mptpy'))
+
+
+def cache_key(content):
+    """ Key of a model file in the cache
+
+    Parameters
+    ----------
+    content : bytes
+        content of the model file
+
+    Returns
+    -------
+    str
+        hex digest of the content and the mptpy version
+
+    """
+
+    digest = hashlib.sha256(mptpy.__version__.encode() + b'\0')
+    digest.update(content)
+    return digest.hexdigest()
+
+
+def load_model(file_path, cache_dir=None):
+    """ Load a model, from the cache if the file was parsed before
+
+    Parameters
+    ----------
+    file_path : str
+        path to the model file
+
+    cache_dir : str, optional
+        cache directory. Default: default_cache_dir()
+
+    Returns
+    -------
+    MPT
+        the parsed and compiled model
+
+    """
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    with open(file_path, 'rb') as model_file:
+        content = model_file.read()
+
+    cache_path = os.path.join(cache_dir, cache_key(content) + '.pkl')
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError):
+        pass
+
+    mpt = Parser().parse_text(content.decode(), source=file_path)
+    mpt.compile()
+    mpt.formulae()
+
+    save_model(mpt, cache_path)
+    return mpt
+
+
+def save_model(mpt, cache_path):
+    """ Atomically write a model to the cache. Failures are ignored, the
+    cache is an optimization only.
+
+    Parameters
+    ----------
+    mpt : MPT
+        the parsed model
+
+    cache_path : str
+        path of the cache entry
+
+    """
+
+    directory = os.path.dirname(cache_path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(handle, 'wb') as tmp_file:
+            pickle.dump(mpt, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PicklingError):
+        os.remove(tmp_path)
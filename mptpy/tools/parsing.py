@@ -2,11 +2,13 @@
 
 """
 
-import string
+import re
 from itertools import groupby
 
-import mptpy.tools.transformations as trans
+from mptpy.compiled_mpt import CompiledMPT
 from mptpy.mpt import MPT
+from mptpy.mpt_word import is_digit_leaf
+from mptpy.node import unflatten
 from . import joint_tree
 
 
@@ -24,9 +26,22 @@ def construct_leaf_test(leaves):
         leaf test
     """
     if leaves:
-        return lambda node: node in leaves
+        return LeafSet(leaves)
+
+    return is_digit_leaf
+
+
+class LeafSet(object):
+    """ Leaf test for custom leaf names
+
+    """
+
+    def __init__(self, leaves):
+        self.leaves = frozenset(leaves)
+
+    def __call__(self, node):
+        return node in self.leaves
 
-    return lambda node: all([ch in string.digits for ch in node])
 
 
 def get_leaf_info(lines):
@@ -52,8 +67,9 @@ def get_leaf_info(lines):
     return leaves
 
 
-def strip(lines):
-    """ Removes comments, new lines and empty lines from the file content
+def strip_numbered(lines):
+    """ Removes comments and new lines from the file content, keeping the
+    line numbers of the remaining lines
 
     Parameters
     ----------
@@ -62,78 +78,270 @@ def strip(lines):
 
     Returns
     -------
-    [str]
-        file content without comments
+    [(int, str)]
+        line number and content of the lines without comments
     """
 
-    lines = filter(lambda line: line[0] != "#", lines)  # commentary and empty lines
-    lines = [line.split("#")[0].strip() for line in lines]  # in-line
+    numbered = []
+    for number, line in enumerate(lines, 1):
+        line = line.split("#")[0].strip()
+        if line or not lines[number - 1].lstrip().startswith("#"):
+            numbered.append((number, line))
 
-    return lines
+    return numbered
 
 
-def open_model(file_path):
-    """ Opens the file and return its contents
+class ParseError(ValueError):
+    """ Syntax or structure error in a model file
 
-    Parameters
-    ----------
-    file_path : str
-        path to the mpt file
     """
 
-    with open(file_path, 'r') as mpt_file:
-        lines = strip(mpt_file.readlines())  # remove comments
+    def __init__(self, message, source="<model>", line=None, col=None):
+        self.message = message
+        self.source = source
+        self.line = line
+        self.col = col
 
-    return [escape_parameters(x) for x in lines]
+        location = source
+        if line is not None:
+            location += ":{}".format(line)
+            if col is not None:
+                location += ":{}".format(col)
+        super().__init__("{}: {}".format(location, message))
 
-def escape_parameters(formula, escape_char='_'):
-    """ Escapes the parameters of a category formula.
+
+# characters occurring in the easy format, but not in BMPT words
+EASY_CHARS = frozenset("*+()")
+
+# parameters are any names without whitespace and operators that do not
+# start with a digit or '-', e.g. 'Dn', 'g_1', 'a.b' or 'c-d'
+TOKEN_PATTERN = re.compile(
+    r"(?P<space>\s+)|(?P<param>[^\s\d*+()-][^\s*+()]*)|(?P<number>\d+)|"
+    r"(?P<op>[-*+()])")
+
+
+def tokenize(formula):
+    """ Splits a category formula of the easy format into tokens. Every
+    character belongs to a token, misplaced tokens are reported by the
+    parser.
 
     Parameters
     ----------
     formula : str
-        Category formula.
-
-    escape_char : str, optional
-        Character string to escape parameters with (prepended and appended to
-        variables).
+        category formula, e.g. 'a * (1-b) + (1-a)'
 
-    Note
-    ----
-    Currently, the algorithm fails to correctly account for variables starting
-    with a '1'.
+    Returns
+    -------
+    [(str, str, int)]
+        kind ('param', 'number' or 'op'), text and column of each token
 
     Examples
     --------
-    >>> escape_parameters('a * b * c')
-    '_a_ * _b_ * _c_'
-    >>> escape_parameters('e * ee * a * ea * _ba')
-    '_e_ * _ee_ * _a_ * _ea_ * __ba_'
-    >>> escape_parameters('a1 * a2 * e1a')
-    '_a1_ * _a2_ * _e1a_'
+    >>> tokenize('a * (1-b)')
+    [('param', 'a', 1), ('op', '*', 3), ('op', '(', 5), ('number', '1', 6), \
+('op', '-', 7), ('param', 'b', 8), ('op', ')', 9)]
+
+    """
+
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(formula):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        tokens.append((kind, match.group(), match.start() + 1))
+
+    return tokens
+
+
+class _EasyTree(object):
+    """ Incrementally built tree of one (sub)model in the easy format.
+    Branches are inserted like into a trie, so each token is visited once.
+
+    """
+
+    def __init__(self, source):
+        self.source = source
+        # inner nodes: [param, pos, neg, line, col], leaves: category
+        self.root = None
+
+    def insert(self, factors, category, line):
+        """ Insert the branch given by its factors ending in category
+
+        """
+
+        parent, side = None, None
+        slot = self.root
+        for param, positive, col in factors:
+            if slot is None:
+                slot = [param, None, None, line, col]
+                self._attach(parent, side, slot)
+            elif not isinstance(slot, list):
+                raise ParseError(
+                    "branch continues below category {}".format(slot),
+                    self.source, line, col)
+            elif slot[0] != param:
+                raise ParseError(
+                    "expected parameter '{}' (line {}, column {}), found "
+                    "'{}'".format(slot[0], slot[3], slot[4], param),
+                    self.source, line, col)
+
+            parent, side = slot, 1 if positive else 2
+            slot = slot[side]
+
+        if slot is not None:
+            raise ParseError(
+                "branch of category {} is a prefix of another branch".format(
+                    category), self.source, line)
+        self._attach(parent, side, category)
+
+    def _attach(self, parent, side, child):
+        if parent is None:
+            self.root = child
+        else:
+            parent[side] = child
+
+    def to_nodes(self):
+        """ Convert the tree to (interned) nodes
+
+        """
+
+        contents = []
+        inner = []
+        stack = [self.root]
+        while stack:
+            slot = stack.pop()
+            if not isinstance(slot, list):
+                contents.append(slot)
+                inner.append(False)
+                continue
+
+            param, pos, neg, line, col = slot
+            if pos is None or neg is None:
+                raise ParseError(
+                    "parameter '{}' has no branch for '{}'".format(
+                        param, param if pos is None else "(1-{})".format(
+                            param)), self.source, line, col)
+
+            contents.append(param)
+            inner.append(True)
+            stack.append(neg)
+            stack.append(pos)
+
+        return unflatten(contents, inner)
+
+
+def parse_easy(subtrees, source="<model>"):
+    """ Parse (sub)models in the easy format in a single pass over the tokens.
+
+    Parameters
+    ----------
+    subtrees : [[(int, str)]]
+        line number and category formula of each line, grouped by subtree
+
+    source : str, optional
+        name of the model file (for error messages)
+
+    Returns
+    -------
+    [Node]
+        root node of each subtree
+
+    CompiledMPT
+        branch structure and parameter index table of the multi-tree model
 
     """
 
-    escaped = ''
+    roots = []
+    params = []
+    param_index = {}
+    categories = []
+    cat_trees = []
+    branches = []
+
+    for subtree in subtrees:
+        tree = _EasyTree(source)
+
+        for line, formula in subtree:
+            category = str(len(categories))
+            categories.append(category)
+            cat_trees.append(len(roots))
+
+            for factors in _parse_formula(tokenize(formula), line, source):
+                tree.insert(factors, category, line)
+
+                compiled = []
+                for param, positive, _ in factors:
+                    if param not in param_index:
+                        param_index[param] = len(params)
+                        params.append(param)
+                    compiled.append((param_index[param], positive))
+                branches.append((len(categories) - 1, compiled))
+
+        roots.append(tree.to_nodes())
+
+    compiled = CompiledMPT.from_branches(params, categories, branches,
+                                         cat_trees=cat_trees)
+    return roots, compiled
+
 
-    reading_mode = False
-    for char in formula:
-        if char not in ['*', '(', ')', '+', ' ', '-', '1']:
-            if not reading_mode:
-                escaped += escape_char
-                reading_mode = True
+def _parse_formula(tokens, line, source):
+    """ Recursive descent parser for a category formula.
 
-        if char in ['*', '(', ')', '+', ' ', '-']:
-            if reading_mode:
-                escaped += escape_char
-                reading_mode = False
+        formula := branch ('+' branch)*
+        branch  := factor ('*' factor)*
+        factor  := param | '(' '1' '-' param ')'
 
-        escaped += char
+    Returns
+    -------
+    [[(str, bool, int)]]
+        (parameter, positive, column) factors for each branch
+
+    """
 
-    if reading_mode:
-        escaped += escape_char
+    def error(message, idx):
+        col = tokens[idx][2] if idx < len(tokens) else None
+        found = "'{}'".format(tokens[idx][1]) if idx < len(tokens) \
+            else "end of line"
+        raise ParseError("{}, found {}".format(message, found),
+                         source, line, col)
+
+    def expect(idx, kind, text=None):
+        if idx >= len(tokens) or tokens[idx][0] != kind or \
+                (text is not None and tokens[idx][1] != text):
+            error("expected '{}'".format(text) if text else
+                  "expected parameter", idx)
+        return idx + 1
+
+    branches = []
+    factors = []
+    idx = 0
+    while True:
+        if idx < len(tokens) and tokens[idx][0] == 'param':
+            factors.append((tokens[idx][1], True, tokens[idx][2]))
+            idx += 1
+        elif idx < len(tokens) and tokens[idx][1] == '(':
+            idx = expect(idx + 1, 'number', '1')
+            idx = expect(idx, 'op', '-')
+            param_idx = idx
+            idx = expect(idx, 'param')
+            idx = expect(idx, 'op', ')')
+            factors.append(
+                (tokens[param_idx][1], False, tokens[param_idx][2]))
+        else:
+            error("expected parameter or '(1-'", idx)
+
+        if idx == len(tokens):
+            branches.append(factors)
+            return branches
+        if tokens[idx][1] == '*':
+            idx += 1
+        elif tokens[idx][1] == '+':
+            branches.append(factors)
+            factors = []
+            idx += 1
+        else:
+            error("expected '*' or '+'", idx)
 
-    return escaped
 
 class Parser():
     """ Parsing for easy format
@@ -150,61 +358,96 @@ class Parser():
 
         Returns
         -------
+        MPT
+            the parsed model
 
         """
 
-        lines = open_model(file_path)
+        with open(file_path, 'r') as mpt_file:
+            return self.parse_text(mpt_file.read(), source=file_path)
+
+    def parse_text(self, text, source="<model>"):
+        """ Parse the mpt from the content of a model file
 
+        Parameters
+        ----------
+        text : str
+            content of the model file
+
+        source : str, optional
+            name of the model file (for error messages)
+
+        Returns
+        -------
+        MPT
+            the parsed model
+
+        """
+
+        numbered = strip_numbered(text.splitlines())
+
+        lines = [line for _, line in numbered]
         parser = self.instantiate(lines)
-        built = parser.build(lines)
-        return built
+        return parser.build(
+            lines, line_numbers=[no for no, _ in numbered], source=source)
 
-    def build(self, lines):
+    def build(self, lines, line_numbers=None, source="<model>"):
         """ Build MPT from lines. Can have multiple subtrees.
 
+        Parameters
+        ----------
+        lines : [str]
+            lines of the model without comments
+
+        line_numbers : [int], optional
+            line numbers of the lines in the model file
+
+        source : str, optional
+            name of the model file (for error messages)
+
         """
 
-        subtrees = [
-            list(g) for k,
-            g in groupby(
-                lines,
-                key=lambda x: x != '') if k]
+        if line_numbers is None:
+            line_numbers = range(1, len(lines) + 1)
 
-        joint = self.build_mpt_from_subtrees(subtrees)
+        numbered = list(zip(line_numbers, lines))
+        subtrees = [
+            list(g) for k, g in groupby(numbered, key=lambda x: x[1] != '')
+            if k]
 
-        return joint
+        return self.build_mpt_from_subtrees(subtrees, source=source)
 
-    def build_mpt_from_subtrees(self, subtrees):
+    def build_mpt_from_subtrees(self, subtrees, source="<model>"):
         """ Build MPTs from the given subtrees
 
         Parameters
         ----------
-        subtrees : [str]
-            List of subtrees
+        subtrees : [[(int, str)]]
+            line number and formula of the lines, grouped by subtree
+
+        source : str, optional
+            name of the model file (for error messages)
 
         Returns
         -------
+        MPT
+            joint model
 
         """
 
-        mpts = []
-        leaf_step = 0
-
-        for subtree in subtrees:
-            # transform each subtree to bmpt
-            bmpt = trans.easy_to_bmpt(subtree, leaf_step=leaf_step)
-            mpts.append(MPT(bmpt))
-            leaf_step += len(subtree)
-
+        roots, compiled = parse_easy(subtrees, source=source)
 
-        joint = joint_tree.join(mpts)
-        joint.subtrees = subtrees  # TODO to easy?
+        joint = MPT(roots)
+        joint.compiled = compiled
+        joint.subtrees = [[line for _, line in subtree]
+                          for subtree in subtrees]
 
         return joint
 
     def instantiate(self, lines):
-        """ Checks if we have a '*' or '+' in the file.
-        If yes, assumes the file is in easy. else bmpt
+        """ Checks if the file contains operators of category formulae
+        ('*', '+', '(' or ')'). If yes, assumes the file is in easy, else
+        bmpt. Easy files with a single factor per line contain '(1-'.
 
         Parameters
         ----------
@@ -213,7 +456,7 @@ class Parser():
 
         """
 
-        if any(["*" in line or "+" in line for line in lines]):
+        if any(EASY_CHARS.intersection(line) for line in lines):
             return self
 
         return BmptParser()
@@ -227,26 +470,32 @@ class BmptParser(Parser):
     def __init__(self):
         self.leaf_test = None
 
-    def build(self, lines):
+    def build(self, lines, line_numbers=None, source="<model>"):
         """ Build MPT from lines. Can have multiple subtrees.
 
         """
 
+        if line_numbers is None:
+            line_numbers = range(1, len(lines) + 1)
+
         leaves = get_leaf_info(lines)  # retrieve leaf information
-        words = list(
-            filter(
-                lambda x: not x.startswith("["),
-                lines))  # retrieve the mpt word
+        numbered = [(no, line) for no, line in zip(line_numbers, lines)
+                    if not line.startswith("[")]  # retrieve the mpt word
         self.leaf_test = construct_leaf_test(leaves)
-        return super().build(words)
+        return super().build([line for _, line in numbered],
+                             line_numbers=[no for no, _ in numbered],
+                             source=source)
 
-    def build_mpt_from_subtrees(self, subtrees):
+    def build_mpt_from_subtrees(self, subtrees, source="<model>"):
         """ Build MPTs from the given subtrees
 
         Parameters
         ----------
-        subtrees : [str]
-            List of subtrees
+        subtrees : [[(int, str)]]
+            line number and word of the lines, grouped by subtree
+
+        source : str, optional
+            name of the model file (for error messages)
 
         Returns
         -------
@@ -256,11 +505,19 @@ class BmptParser(Parser):
 
         mpts = []
         for subtree in subtrees:
+            if len(subtree) > 1:
+                raise ParseError("a tree in the BMPT format takes one line",
+                                 source, subtree[1][0])
 
-            bmpt = subtree[0]
-            mpts.append(MPT(bmpt, leaf_test=self.leaf_test))
+            line, bmpt = subtree[0]
+            try:
+                mpts.append(MPT(bmpt, leaf_test=self.leaf_test))
+            except ValueError as err:
+                raise ParseError("invalid BMPT word '{}': {}".format(
+                    bmpt, err), source, line) from err
 
         joint = joint_tree.join(mpts)
-        joint.subtrees = subtrees  # TODO to easy?
+        joint.subtrees = [[line for _, line in subtree]
+                          for subtree in subtrees]
 
         return joint
@@ -0,0 +1,228 @@
+""" Ranking of restricted growth strings (RGSs).
+
+An RGS of length n describes a partition of n elements: a[0] = 0 and
+a[i] <= max(a[:i]) + 1. RGSs are ranked in lexicographic order (the order
+of SymPy's RGS_rank / RGS_unrank). The ranking uses the number of
+completions
+
+    D(m, k) = k * D(m - 1, k) + D(m - 1, k + 1),    D(0, k) = 1
+
+of an RGS with m remaining elements and k blocks used so far; the number
+of RGSs of length n is the Bell number D(n - 1, 1). The table is exact
+(Python integers); as long as the Bell numbers fit into int64, batches of
+RGSs are ranked and unranked with NumPy.
+
+"""
+
+import numpy as np
+
+
+# longest RGS whose Bell number fits into int64
+MAX_INT64_LENGTH = 25
+
+# {n : table of D(m, k) for RGSs of length n}
+_TABLES = {}
+_INT64_TABLES = {}
+
+
+def completions(n):
+    """ Table of the number of completions for RGSs of length n
+
+    Parameters
+    ----------
+    n : int
+        length of the RGSs
+
+    Returns
+    -------
+    ndarray
+        (n, n + 2) object array, entry [m, k] = D(m, k) (exact integers)
+
+    """
+
+    table = _TABLES.get(n)
+    if table is None:
+        table = np.zeros((max(n, 1), n + 2), dtype=object)
+        table[0, :] = 1
+        for m in range(1, n):
+            for k in range(n + 1):
+                table[m, k] = k * table[m - 1, k] + table[m - 1, k + 1]
+        _TABLES[n] = table
+    return table
+
+
+def bell(n):
+    """ Number of RGSs of length n (the Bell number)
+
+    Parameters
+    ----------
+    n : int
+
+    Returns
+    -------
+    int
+
+    """
+
+    if n == 0:
+        return 1
+    return int(completions(n)[n - 1, 1])
+
+
+def rank(rgs):
+    """ Lexicographic rank of an RGS
+
+    Parameters
+    ----------
+    rgs : array_like
+        restricted growth string
+
+    Returns
+    -------
+    int
+        rank in [0, bell(len(rgs)))
+
+    """
+
+    rgs = [int(block) for block in rgs]
+    table = completions(len(rgs))
+
+    result = 0
+    blocks = 1
+    for idx in range(1, len(rgs)):
+        result += rgs[idx] * int(table[len(rgs) - 1 - idx, blocks])
+        blocks = max(blocks, rgs[idx] + 1)
+    return result
+
+
+def unrank(rank_, n):
+    """ RGS of length n with the given lexicographic rank
+
+    Parameters
+    ----------
+    rank_ : int
+        rank in [0, bell(n))
+
+    n : int
+        length of the RGS
+
+    Returns
+    -------
+    ndarray
+        (n,) restricted growth string
+
+    """
+
+    if not 0 <= rank_ < bell(n):
+        raise ValueError("rank needs to be in [0, {})".format(bell(n)))
+
+    table = completions(n)
+    rgs = np.zeros(n, dtype=int)
+    blocks = 1
+    for idx in range(1, n):
+        count = int(table[n - 1 - idx, blocks])
+        block = min(rank_ // count, blocks)
+        rank_ -= block * count
+        rgs[idx] = block
+        blocks = max(blocks, block + 1)
+    return rgs
+
+
+def unrank_batch(ranks, n):
+    """ RGSs of length n with the given ranks
+
+    Parameters
+    ----------
+    ranks : array_like
+        ranks in [0, bell(n))
+
+    n : int
+        length of the RGSs
+
+    Returns
+    -------
+    ndarray
+        (len(ranks), n) restricted growth strings
+
+    """
+
+    if n > MAX_INT64_LENGTH:
+        return np.array([unrank(int(rank_), n) for rank_ in ranks],
+                        dtype=int).reshape(-1, n)
+
+    ranks = np.array(ranks, dtype=np.int64).reshape(-1)
+    if len(ranks) and (ranks.min() < 0 or ranks.max() >= bell(n)):
+        raise ValueError("ranks need to be in [0, {})".format(bell(n)))
+
+    table = _int64_completions(n)
+    rgs = np.zeros((len(ranks), n), dtype=int)
+    blocks = np.ones(len(ranks), dtype=np.int64)
+    for idx in range(1, n):
+        counts = table[n - 1 - idx, blocks]
+        block = np.minimum(ranks // counts, blocks)
+        ranks -= block * counts
+        rgs[:, idx] = block
+        blocks = np.maximum(blocks, block + 1)
+    return rgs
+
+
+def _int64_completions(n):
+    """ Completion table as int64 for n <= MAX_INT64_LENGTH
+
+    """
+
+    table = _INT64_TABLES.get(n)
+    if table is None:
+        # entries beyond the int64 range are never reached, D(m, k) is
+        # bounded by bell(m + k) for the reachable k <= n - 1 - m
+        int64_max = np.iinfo(np.int64).max
+        table = np.array([[min(count, int64_max) for count in row]
+                          for row in completions(n)], dtype=np.int64)
+        _INT64_TABLES[n] = table
+    return table
+
+
+def random_rgs(n, size=1, random_state=None):
+    """ Draw RGSs of length n uniformly at random
+
+    Parameters
+    ----------
+    n : int
+        length of the RGSs
+
+    size : int, optional
+        number of RGSs
+
+    random_state : numpy.random.RandomState, optional
+        random number generator. Default: numpy's global generator.
+
+    Returns
+    -------
+    ndarray
+        (size, n) restricted growth strings
+
+    """
+
+    if random_state is None:
+        random_state = np.random
+
+    total = bell(n)
+    if n <= MAX_INT64_LENGTH:
+        ranks = random_state.randint(0, total, size=size, dtype=np.int64)
+    else:
+        ranks = [_random_below(total, random_state) for _ in range(size)]
+    return unrank_batch(ranks, n)
+
+
+def _random_below(total, random_state):
+    """ Uniform random integer in [0, total) of arbitrary size
+
+    """
+
+    n_bits = (total - 1).bit_length()
+    n_bytes = (n_bits + 7) // 8
+    while True:
+        value = int.from_bytes(random_state.bytes(n_bytes), 'little') >> \
+            (8 * n_bytes - n_bits)
+        if value < total:
+            return value
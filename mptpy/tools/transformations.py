@@ -2,13 +2,13 @@
 
 """
 
-import re
 from collections import OrderedDict
 
-from mptpy.node import Node
+from mptpy.compiled_mpt import category_order
+from mptpy.node import unflatten
 
 
-def word_to_nodes(word, idx=0):
+def word_to_nodes(word):
     """ Translate an MPT in the BMPT language (see Purdy & Batchelder 2009) to
     a binary tree
 
@@ -24,16 +24,12 @@ def word_to_nodes(word, idx=0):
 
     """
 
-    node = Node(word[idx])
-
-    if not word.is_leaf(word[idx]):
-        node.pos = word_to_nodes(word, idx=idx + 1)
-        node.neg = word_to_nodes(word, idx=idx + 1 + len(node.pos))
-
-    return node
+    tokens = list(word)
+    return unflatten(tokens, [not word.is_leaf(token) for token in tokens])
 
 def to_easy(mpt):
-    """ Transforms the MPT to the easy format
+    """ Transforms the MPT to the easy format. The trees of multi-tree
+    models are separated by empty lines.
 
     Parameters
     ----------
@@ -47,111 +43,46 @@ def to_easy(mpt):
 
     """
 
-    lines = get_formulae(mpt)
-
-    easy = ""
-    for key in sorted(lines.keys()):
-        line = " + ".join(lines[key]) + "\n"
-        easy += line
-    return easy
-
-def easy_to_bmpt(lines, sep=' ', leaf_step=0):
-    """ Turns the lines of a tree in the easy file format
-    to a tree in the formal language
-
-    Parameters
-    ----------
-    lines : list
-        list of lines of the file in the easy format
-    sep : str
-        separator
-    leaf_step : int
-
-    Returns
-    -------
-    str
-        Tree in Formal language form, with sep as separator
-
-    """
-
-    tree = dict()
-    for i, line in enumerate(lines):
-        leaf_name = i + leaf_step
-        line = line.replace(" ", "").strip()
-        tree[leaf_name] = line.split("+")
-
-    for answer in tree.items():
-        for i, branch in enumerate(answer[1]):
-            answer[1][i] = branch.split("*")
-
-    tree_str = dict_to_bmpt(tree, sep=sep)
-
-    return tree_str
-
-def dict_to_bmpt(tree, sep=" "):
-    """ Turns a dictionary of answers and corresponding branches
-    to a tree in the formal language
-
-    Parameters
-    ----------
-    tree : dict
-        answers and corresponding branches
-
-    Returns
-    -------
-    str
-        Tree in Formal language form, with " " as separator
-
-    """
-
-    if len(tree.keys()) == 1 and list(tree.items())[0][1] == [[]] :
-        return str(list(tree.keys())[0])
-
-    # match the parameters : letter(s) + optional number
-    root = re.search(r"[A-z_]+\d*", list(tree.values())[0][0][0]).group()
-
-    pos_tree, neg_tree = split_tree(tree)
+    blocks = []
+    for root in mpt.trees:
+        lines = get_tree_formulae(root)
+        blocks.append("".join(" + ".join(branches) + "\n"
+                              for branches in lines.values()))
+    return "\n".join(blocks)
 
-    res= sep.join([root, dict_to_bmpt(pos_tree), dict_to_bmpt(neg_tree)])
-
-    return res
-
-def split_tree(tree):
-    """ Splits the dictionary of answers and corresponding branches
-    to the positive and the negative subtrees
+def get_formulae(mpt):
+    """ Builds a dictionary of the answers and the
+    respective branch formulas
 
     Parameters
     ----------
-    tree : dict
-        answers and corresponding branches
+    mpt : MPT
 
     Returns
     -------
-    tuple
-        positive subtree, negative subtree
+    dict(int, string)
+        Dictionary of the answer categories of the tree and the branch formulas
 
     """
 
-    neg_tree = dict()
-    pos_tree = dict()
-
-    for answer in tree.items():
-        for branch in answer[1]:
-            subtree = pos_tree if '1-' not in branch[0] else neg_tree
+    formulae = OrderedDict()
+    for root in mpt.trees:
+        formulae.update(get_tree_formulae(root))
 
-            if answer[0] not in subtree.keys():
-                subtree[answer[0]] = []
-            subtree[answer[0]].append(branch[1:])
+    ordered = OrderedDict()
+    for key in category_order(formulae.keys()):
+        ordered[key] = formulae[key]
 
-    return pos_tree, neg_tree
+    return ordered
 
-def get_formulae(mpt):
+def get_tree_formulae(root):
     """ Builds a dictionary of the answers and the
-    respective branch formulas
+    respective branch formulas of a single tree
 
     Parameters
     ----------
-    mpt : MPT
+    root : Node
+        root of the tree
 
     Returns
     -------
@@ -159,29 +90,26 @@ def get_formulae(mpt):
         Dictionary of the answer categories of the tree and the branch formulas
 
     """
-    lines = {answer : [] for answer in mpt.word.answers}
-    def recursive_to_formulae(node, temp=""):
-        """ Recursively compute the branch formulae
 
-        """
+    lines = {answer : [] for answer in root.answers()}
+
+    stack = [(root, "")]
+    while stack:
+        node, temp = stack.pop()
 
         if node.leaf:
             lines[node.content] += [temp]
-            return None
+            continue
 
         left_mult = "" if node.pos.leaf else " * "
         right_mult = "" if node.neg.leaf else " * "
 
-        recursive_to_formulae(node.pos, temp +
-                              node.content + left_mult)
-        recursive_to_formulae(node.neg, temp +
-                              "(1-" + node.content + ")" + right_mult)
-
-        return lines
+        stack.append((node.neg, temp + "(1-" + node.content + ")" +
+                      right_mult))
+        stack.append((node.pos, temp + node.content + left_mult))
 
-    formulae = recursive_to_formulae(mpt.root)
     ordered = OrderedDict()
-    for key in sorted(formulae, key=int):
-        ordered[key] = formulae[key]
+    for key in category_order(lines.keys()):
+        ordered[key] = lines[key]
 
     return ordered
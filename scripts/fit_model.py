@@ -6,6 +6,7 @@ Usage: python3 -m fit_model <model_file> <data_file>
 import argparse
 
 from mptpy.tools.parsing import Parser
+from mptpy.tools import model_cache
 import mptpy.fitting.scipy_fit as fitting
 
 
@@ -66,10 +67,17 @@ def parse_commandlineargs():
         action='store_true'
     )
 
+    parser.add_argument(
+        '--no-cache',
+        dest='cache',
+        action='store_false',
+        help="Parse the model file instead of loading it from the model cache.")
+
     args = parser.parse_args()
     return vars(args)
 
-def run(model_path, data_path, sep=',', header=None, n_optim=10, llik=False):
+def run(model_path, data_path, sep=',', header=None, n_optim=10, llik=False,
+        cache=True):
     """ Draw an MPT modelto the command line
 
     Parameters
@@ -81,8 +89,10 @@ def run(model_path, data_path, sep=',', header=None, n_optim=10, llik=False):
 
     """
 
-    parser = Parser()
-    mpt = parser.parse(model_path)
+    if cache:
+        mpt = model_cache.load_model(model_path)
+    else:
+        mpt = Parser().parse(model_path)
     mpt.draw()
     func = "llik" if llik else "rmse"
 
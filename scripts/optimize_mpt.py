@@ -6,6 +6,7 @@ Usage: python3 -m optimize_mpt <model_file> <data_file>
 import argparse
 
 from mptpy.tools.parsing import Parser
+from mptpy.tools import model_cache
 from mptpy.optimization.optimize import Optimizer
 
 
@@ -67,6 +68,61 @@ def parse_commandlineargs():
         action='store_true'
     )
 
+    parser.add_argument(
+        '--no-cache',
+        dest='cache',
+        action='store_false',
+        help="Parse the model file instead of loading it from the model cache.")
+
+    parser.add_argument(
+        '--max-fits',
+        dest='max_fits',
+        metavar='F',
+        type=int,
+        help='Number of models to evaluate. (Default: unlimited)')
+
+    parser.add_argument(
+        '--max-time',
+        dest='max_time',
+        metavar='T',
+        type=float,
+        help='Wall-clock time of the search in seconds. (Default: unlimited)')
+
+    j_default = 1
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='n_jobs',
+        metavar='J',
+        type=int,
+        default=j_default,
+        help='Number of worker processes fitting models. (Default={})'.
+        format(j_default))
+
+    c_default = 'BIC'
+    parser.add_argument(
+        '-c',
+        '--criterion',
+        choices=['AIC', 'BIC', 'G2'],
+        default=c_default,
+        help='Criterion selecting the best model. (Default={})'.format(
+            c_default))
+
+    m_default = 'random'
+    parser.add_argument(
+        '-m',
+        '--method',
+        choices=['random', 'local', 'smac'],
+        default=m_default,
+        help='Random search, simulated annealing over the neighboring \
+        models or surrogate-based search. (Default={})'.format(m_default))
+
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Continue the random search from its checkpoint and \
+        evaluation file.")
+
     parser.add_argument(
         '-i',
         '--ignore',
@@ -77,9 +133,14 @@ def parse_commandlineargs():
     )
 
     args = parser.parse_args()
+    if args.resume and args.method != 'random':
+        parser.error("--resume is only supported by the random search "
+                     "(-m random)")
     return vars(args)
 
-def run(model_path, data_path, ignore=None, sep=',', header=None, n_optim=10, llik=False):
+def run(model_path, data_path, ignore=None, sep=',', header=None, n_optim=10, llik=False,
+        cache=True, max_fits=None, max_time=None, n_jobs=1, criterion='BIC',
+        method='random', resume=False):
     """ Draw an MPT modelto the command line
 
     Parameters
@@ -89,8 +150,13 @@ def run(model_path, data_path, ignore=None, sep=',', header=None, n_optim=10, ll
     data : str
         path to the data file
     """
-    parser = Parser()
-    mpt = parser.parse(model_path)
+    if resume and method != 'random':
+        raise ValueError("only the random search can be resumed")
+
+    if cache:
+        mpt = model_cache.load_model(model_path)
+    else:
+        mpt = Parser().parse(model_path)
 
     mpt.draw()
 
@@ -100,11 +166,26 @@ def run(model_path, data_path, ignore=None, sep=',', header=None, n_optim=10, ll
 
     optimizer = Optimizer(mpt, data_path, name, sep=sep, func=func, ignore_params=ignore)
 
-    optimizer.init_deletion()
-    optimizer.random_search()
+    if method == 'local':
+        best = optimizer.local_search(
+            max_fits=max_fits, max_time=max_time, n_jobs=n_jobs,
+            criterion=criterion, n_optim=n_optim)
+    elif method == 'smac':
+        best = optimizer.surrogate_search(
+            max_fits=max_fits, max_time=max_time, n_jobs=n_jobs,
+            criterion=criterion, n_optim=n_optim)
+    else:
+        optimizer.init_deletion()
+        best = optimizer.random_search(
+            max_fits=max_fits, max_time=max_time, n_jobs=n_jobs,
+            criterion=criterion, n_optim=n_optim, resume=resume)
 
     # Print the result
     print()
+    if best is not None:
+        model, evaluation = best
+        print("Best model ({}={}):".format(criterion, evaluation[criterion]))
+        print(model)
 
 if __name__ == "__main__":
     ARGS = parse_commandlineargs()
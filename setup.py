@@ -1,11 +1,17 @@
+import re
+
 import setuptools
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
+# single source of the version, it also keys the model and evaluation caches
+with open("mptpy/__init__.py", "r") as fh:
+    version = re.search(r"^__version__ = '(.*)'", fh.read(), re.M).group(1)
+
 setuptools.setup(
     name='mptpy',
-    version='0.0.7',
+    version=version,
     author='Nicolas Riesterer, Paulina Friemann',
     author_email='riestern@cs.uni-freiburg.de, friemanp@cs.uni-freiburg.de',
     description='Module to represent and use multinomial processing trees',
@@ -20,7 +26,5 @@ setuptools.setup(
     ),
     install_requires=[
         "numpy",
-        "sympy",
-        "tqdm",
     ]
 )
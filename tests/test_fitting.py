@@ -8,10 +8,16 @@ Nicolas Riesterer <riestern@cs.uni-freiburg.de>
 """
 
 import os
+import pickle
+import tempfile
+
 import numpy as np
-from nose.tools import assert_equals, assert_true
+from nose.tools import assert_equals, assert_raises, assert_true
 
-from mptpy.fitting import fitter, scipy_fit
+from mptpy.fitting import count_data, fitter, optimize, scipy_fit
+from mptpy.mpt import MPT
+from mptpy.properties import properties
+from mptpy.tools import joint_tree
 
 import context
 
@@ -29,6 +35,64 @@ def test_remove_header():
     assert_true((data_wo_header == data[1:]).all())
 
 
+def test_count_reader():
+    """ Test the streaming reader for count data """
+    reader = count_data.iter_blocks(MODEL_DIR + "/broeder.csv", block_size=16,
+                                    n_categories=20)
+    blocks = list(reader)
+
+    assert_equals(reader.header[:2], ["V1", "V2"])
+    assert_equals([len(block) for block in blocks], [16, 16, 8])
+    assert_equals(list(blocks[0][0][:4]), [1, 5, 1, 53])
+
+    data = fitter.read_data(MODEL_DIR + "/broeder.csv")
+    assert_true((np.concatenate(blocks) == data).all())
+
+    with assert_raises(ValueError):
+        count_data.iter_blocks(MODEL_DIR + "/broeder.csv", n_categories=6)
+
+
+def test_binary_counts():
+    """ Test the memory-mapped binary count format """
+    mpt = context.MPTS["2htms"]
+    csv_file = MODEL_DIR + "/broeder.csv"
+    bin_file = os.path.join(tempfile.mkdtemp(), "broeder.bin")
+
+    n_rows = count_data.csv_to_binary(csv_file, bin_file, mpt=mpt,
+                                      block_size=16)
+    assert_equals(n_rows, 40)
+    assert_true(count_data.is_binary(bin_file))
+    assert_true(not count_data.is_binary(csv_file))
+
+    counts = count_data.load_binary(bin_file)
+    data = fitter.read_data(csv_file)
+    assert_equals(counts.categories, mpt.compile().categories)
+    assert_true((counts.data == data).all())
+    assert_true((fitter.read_data(bin_file) == data).all())
+
+    part = counts.rows(10, 20)
+    assert_true((part[:] == data[10:20]).all())
+    assert_true((pickle.loads(pickle.dumps(part))[:] == data[10:20]).all())
+
+    blocks = list(count_data.iter_blocks(bin_file, block_size=16))
+    assert_equals([len(block) for block in blocks], [16, 16, 8])
+
+    with assert_raises(ValueError):
+        count_data.iter_blocks(bin_file, n_categories=6)
+
+
+def test_fit_batch():
+    """ Test fitting every row of the data separately """
+    np.random.seed(0)
+    mpt = context.MPTS["2htms"]
+    data_file = MODEL_DIR + "/broeder.csv"
+
+    results = list(scipy_fit.fit_batch(mpt, "llik", data_file, n_optim=1,
+                                       block_size=16))
+    assert_equals(len(results), 40)
+    assert_equals(results[0]['n_datasets'], 1)
+
+
 def test_comp_parameter_ratios():
     """ Test the computing of ratios of static parameters """
     params = {
@@ -53,3 +117,90 @@ def test_comp_parameter_ratios():
         ratios[key] = round(value, 1)
 
     assert_equals(ratios, params)
+
+
+def test_join_param_ratios():
+    """ Test the structural computation of the dummy parameter values """
+    mpt = context.MPTS["2htms"]
+    joint = MPT(str(mpt))
+    params = joint_tree.join_params(joint.root, len(mpt.subtrees))
+    data = fitter.read_data(MODEL_DIR + "/broeder.csv")
+
+    model = joint.compile()
+    pooled = fitter.join_param_ratios(model, params, data.sum(axis=0))
+    expected = fitter.compute_parameter_ratios(mpt, data)
+    for param, value in zip(params, pooled):
+        assert_true(np.isclose(value, expected[param]))
+
+    per_dataset = fitter.join_param_ratios(model, params, data)
+    assert_equals(per_dataset.shape, (len(data), len(params)))
+    assert_true(np.allclose(
+        per_dataset[3], fitter.join_param_ratios(model, params, data[3])))
+
+
+def test_closed_form_fit():
+    """ Test that separable parameters are estimated in closed form """
+    np.random.seed(0)
+    data = np.array([30, 10, 25, 35, 12])
+
+    mpt = MPT("a b 0 1 c 2 d 3 4")
+    assert_equals(properties.separable_params(mpt), ["a", "b", "c", "d"])
+    result = scipy_fit.fit_data(mpt, "llik", data, n_optim=1)
+    assert_equals(result['n_params'], 4)
+    assert_true(np.isclose(result['ParamAssignment']['a'], 40 / 112))
+    assert_true(np.isclose(result['G2'], 0))
+
+    # b occurs twice and is fitted numerically with a and c fixed
+    mpt = MPT("a b 0 1 c 2 b 3 4")
+    assert_equals(properties.separable_params(mpt), ["a", "c"])
+    kwargs = scipy_fit._setup_args(mpt, "llik", data)
+    assert_equals(kwargs['free_params'], ["b"])
+    result = scipy_fit._fit(kwargs, n_optim=3)
+    numeric = scipy_fit._fit(dict(kwargs, free_params=["a", "b", "c"],
+                                  closed_params={}), n_optim=3)
+    assert_equals(result['n_params'], 3)
+    assert_true(np.isclose(result['LogLik'], numeric['LogLik']))
+
+
+def test_fit_multi_tree():
+    """ Test that native multi-tree fits equal fits of the joined tree """
+    np.random.seed(0)
+    mpt = context.MPTS["2htms_small"]
+    joint = MPT(str(mpt))
+    joint.subtrees = mpt.subtrees
+
+    data_file = MODEL_DIR + "/broeder-agg_small.csv"
+    native = scipy_fit.fit_mpt(mpt, "llik", data_file, n_optim=2)
+    joined = scipy_fit.fit_mpt(joint, "llik", data_file, n_optim=2)
+
+    assert_equals(native['n_params'], 4)
+    assert_equals(joined['n_params'], 4)
+    assert_true(np.isclose(native['G2'], joined['G2'], atol=1e-4))
+    assert_true('y0' not in native['ParamAssignment'])
+
+
+def test_warm_start():
+    """ A converged warm start needs fewer optimization runs """
+    model = MPT("a b 0 1 c 2 3").compile()
+    data = np.array([30, 10, 25, 35])
+    free_params = ["a", "b", "c"]
+    calls = []
+
+    def fun(*args):
+        calls.append(args[0])
+        return optimize.optim_llik(*args)
+
+    np.random.seed(0)
+    cold, _ = optimize.fit_classical(fun, model, free_params, {}, data,
+                                     n_optim=10, jac=optimize.grad_llik)
+    n_cold = len(calls)
+    assert_true(np.allclose(cold.x, [0.4, 0.75, 25 / 60.], atol=1e-4))
+
+    del calls[:]
+    warm, errs = optimize.fit_classical(
+        fun, model, free_params, {}, data, n_optim=10,
+        jac=optimize.grad_llik, x0={"a": 0.4, "b": 0.7, "unknown": 0.5})
+    assert_true(np.allclose(calls[0][:2], [0.4, 0.7]))
+    assert_true(len(calls) < n_cold)
+    assert_true(np.isclose(warm.fun, cold.fun))
+    assert_equals(errs, 0)
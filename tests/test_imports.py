@@ -0,0 +1,62 @@
+""" Tests that heavy dependencies are only imported when they are used.
+
+Copright 2018 Cognitive Computation Lab
+University of Freiburg
+Paulina Friemann <friemanp@cs.uni-freiburg.de>
+Nicolas Riesterer <riestern@cs.uni-freiburg.de>
+
+"""
+
+import os
+import subprocess
+import sys
+
+from nose.tools import assert_equals, assert_true
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+MODULES = [
+    "mptpy.tools.parsing",
+    "mptpy.fitting.scipy_fit",
+    "mptpy.optimization.optimize",
+]
+
+HEAVY = ["scipy", "sympy", "tqdm", "mptpy.visualization.visualize_mpt"]
+
+# generous bound on the import time in seconds, numpy alone takes ~0.1s
+MAX_IMPORT_TIME = 1.0
+
+
+def import_in_subprocess(module):
+    """ Import the module in a fresh interpreter
+
+    Returns
+    -------
+    float, [str]
+        import time in seconds and the heavy modules that were loaded
+
+    """
+
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import {}\n"
+        "print(time.perf_counter() - start)\n"
+        "print(','.join(m for m in {!r} if m in sys.modules))\n"
+    ).format(module, HEAVY)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, "-c", code], env=env,
+                                     cwd=ROOT, universal_newlines=True)
+    duration, loaded = output.splitlines()
+    return float(duration), [name for name in loaded.split(",") if name]
+
+
+def test_lazy_imports():
+    """ Test that modelling and fitting modules load no heavy dependencies """
+    for module in MODULES:
+        duration, loaded = import_in_subprocess(module)
+        assert_equals(loaded, [], module)
+        assert_true(duration < MAX_IMPORT_TIME,
+                    "import of {} took {:.2f}s".format(module, duration))
@@ -7,7 +7,8 @@ Nicolas Riesterer <riestern@cs.uni-freiburg.de>
 
 """
 
-from nose.tools import assert_equals, assert_false
+from nose.tools import assert_equals, assert_false, assert_true
+from mptpy.compiled_mpt import ParentModel
 from mptpy.mpt import MPT
 from mptpy.properties import properties
 from mptpy.tools.transformations import to_easy
@@ -50,6 +51,15 @@ def test_to_easy():
         "a * bc * c\na * bc * (1-c)\na * (1-bc) * a + a * (1-bc) * (1-a) * e\na * (1-bc) * (1-a) * (1-e)\n(1-a) * d\n(1-a) * (1-d)\n")
 
 
+def test_to_easy_multi_tree():
+    """ Test the translation of multi-tree models to the easy format """
+    mpt = PARSER.parse(MODEL_DIR + "/2htms_small.txt")
+    assert_equals(
+        to_easy(mpt),
+        "Do + (1-Do) * G1\n(1-Do) * (1-G1)\n\n(1-Dn) * G1\n"
+        "Dn + (1-Dn) * (1-G1)\n\nDo + (1-Do) * G2\n(1-Do) * (1-G2)\n")
+
+
 def test_save():
     mpt = PARSER.parse(MODEL_DIR + "/test1.model")
     mpt.save(MODEL_DIR + "/testsave.model")
@@ -74,3 +84,60 @@ def test_identifiable():
     mpt = PARSER.parse(MODEL_DIR + "/test1.model")
     ident = properties.check(mpt, "identifiable")
     assert_equals(ident, True)
+
+
+def test_non_identified():
+    mpt = MPT("a b 0 1 1")
+    assert_equals(properties.non_identified(mpt), [("a", "b")])
+    assert_false(properties.check(mpt, "identifiable"))
+
+    # as many parameters as degrees of freedom, but b has no effect
+    mpt = MPT("a 3 c 2 a b 2 2 c 0 1")
+    assert_equals(properties.non_identified(mpt), [("b",)])
+    assert_false(properties.check(mpt, "identifiable"))
+
+    # cached by the structure, reported with the model's parameter names
+    mpt = MPT("x 3 z 2 x y 2 2 z 0 1")
+    assert_equals(properties.non_identified(mpt), [("y",)])
+
+
+def test_formula_form():
+    """ Models with equal category formulae share their form """
+    def form(word):
+        return properties.formula_form(MPT(word).compile())
+
+    # parameter names, the canonical orders correspond to each other
+    original, params = form("a b 0 1 c 2 3")
+    renamed, renamed_params = form("x y 0 1 z 2 3")
+    assert_equals(original, renamed)
+    assert_equals([dict(a="x", b="y", c="z")[param] for param in params],
+                  renamed_params)
+
+    # b * c + b * (1-c) = b, the parameter c has no effect
+    merged, params = form("a b c 0 0 1 2")
+    assert_equals(merged, form("a b 0 1 2")[0])
+    assert_equals(sorted(params), ["a", "b"])
+
+    # ties between parameters
+    assert_equals(form("a b 0 1 b 2 3")[0], form("c d 0 1 d 2 3")[0])
+    assert_true(form("a b 0 1 b 2 3")[0] != form("a b 0 1 c 2 3")[0])
+    assert_true(form("a b 0 1 2")[0] != form("a 0 b 1 2")[0])
+
+
+def test_submodel():
+    """ Submodels compiled from the parent equal the compiled words """
+    parent = ParentModel(MPT("a b 0 1 c a 2 3 1"))
+
+    # delete c (keep its positive child) and split a into a and a1
+    mask = [1, 1, 1, 1, 0, 1, 1, 1, 0]
+    names = ["a", "b", "0", "1", "c", "a1", "2", "3", "1"]
+    submodel = parent.submodel(mask, names)
+    assert_equals(submodel, MPT("a b 0 1 a1 2 3").compile())
+    assert_equals(submodel.params, ["a", "b", "a1"])
+
+    # the dummy nodes joining trees are no parameters
+    mpt = context.MPTS["2htms_small"]
+    parent = ParentModel(mpt)
+    submodel = parent.submodel([1] * len(parent.tokens), parent.tokens)
+    assert_equals(submodel, mpt.compile())
+    assert_equals(sorted(submodel.params), ["Dn", "Do", "G1", "G2"])
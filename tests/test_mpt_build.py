@@ -8,10 +8,16 @@ Nicolas Riesterer <riestern@cs.uni-freiburg.de>
 """
 
 
-from nose.tools import assert_equals
+import pickle
+from collections import Counter
 
+import numpy as np
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from mptpy.compiled_mpt import CompiledMPT
 from mptpy.node import Node
 from mptpy.mpt import MPT
+from mptpy.tools import joint_tree
 
 import context
 
@@ -49,3 +55,46 @@ def test_mpt_from_word():
     mpt_obj2 = MPT("a bc c 0 1 a 2 e 2 3 d 4 5")
 
     assert_equals(mpt_obj, mpt_obj2)
+
+
+def test_node_sharing():
+    """ Test that identical subtrees are shared and cache their properties """
+    left = Node("a", Node("1"), Node("2"))
+    right = Node("a", Node("1"), Node("2"))
+    root = Node("b", left, Node("c", right, Node("1")))
+
+    assert_true(left is right)
+    assert_equals(hash(left), hash(right))
+    assert_equals(len(root), 9)
+    assert_equals(root.categories(), Counter({"1": 3, "2": 2}))
+    assert_equals(root.answers(), ["1", "2", "1", "2", "1"])
+    assert_true(MPT("b a 1 2 c a 1 2 1").root is root)
+    assert_true(pickle.loads(pickle.dumps(root)) is root)
+
+
+def test_multi_tree():
+    """ Test the native representation of models with multiple trees """
+    mpt = context.MPTS["2htms_small"]
+    compiled = mpt.compile()
+
+    assert_equals(len(mpt.trees), 3)
+    assert_equals([str(root) for root in mpt.trees],
+                  ["Do 0 G1 0 1", "Dn 3 G1 2 3", "Do 4 G2 4 5"])
+    assert_equals(compiled.params, ["Do", "G1", "Dn", "G2"])
+    assert_equals(list(compiled.cat_trees), [0, 0, 1, 1, 2, 2])
+
+    probs = compiled.category_probabilities([0.5, 0.2, 0.3, 0.9])
+    assert_true(np.allclose(np.bincount(compiled.cat_trees, probs), 1))
+
+    joint = MPT(str(mpt))
+    assert_equals(joint_tree.split(joint.root, 3), mpt.trees)
+    assert_equals(joint_tree.join_params(joint.root, 3), ["y0", "y1"])
+
+
+def test_invalid_categories():
+    """ Unreachable and shared categories are rejected with ValueError """
+    with assert_raises(ValueError):
+        CompiledMPT.from_tree(MPT("a 0 1").root, categories=["0", "1", "2"])
+
+    with assert_raises(ValueError):
+        CompiledMPT.from_trees([MPT("a 0 1").root, MPT("b 1 2").root])
@@ -8,12 +8,22 @@ Nicolas Riesterer <riestern@cs.uni-freiburg.de>
 """
 
 from itertools import compress
+import os
+import random
+import tempfile
 
-from nose.tools import assert_equals
+import numpy as np
+from nose.tools import assert_equals, assert_true, assert_raises
 
 from mptpy.mpt import MPT
+from mptpy.mpt_word import MPTWord
+from mptpy.optimization.operations.candidate_store import CandidateStore
 from mptpy.optimization.operations.deletion import Deletion
+from mptpy.optimization.operations.local_search import Neighborhood
+from mptpy.optimization.operations.smac_optim import (
+    Encoder, RandomForest, expected_improvement)
 import mptpy.optimization.operations.substitution as sub
+from mptpy.tools import external_sort, rgs
 import context
 
 
@@ -43,6 +53,166 @@ def test_deletion():
                           "b 1 a 2 0"]))
 
 
+def test_deletion_bounded_memory():
+    """ Spilled runs and regenerated subtrees give the same candidates """
+    out_dir = tempfile.mkdtemp()
+    mpt = MPT("a b c 0 1 d 2 3 e b 1 2 c 3 0")
+
+    expected = list(Deletion(mpt, out=os.path.join(
+        out_dir, "all.bin")).generate_candidates())
+    bounded = Deletion(mpt, out=os.path.join(out_dir, "bounded.bin"),
+                       run_size=5, cache_limit=2).generate_candidates()
+
+    assert_equals(len(bounded), len(expected))
+    assert_equals(list(bounded), expected)
+
+
+def test_unique_sorted_merge_passes(monkeypatch):
+    """ Many runs are merged in passes with a bounded number of open files """
+    n_open = [0, 0]
+
+    class CountedFile(object):
+        def __init__(self, *args):
+            self.file = open(*args)
+
+        def __enter__(self):
+            n_open[0] += 1
+            n_open[1] = max(n_open)
+            return self.file.__enter__()
+
+        def __exit__(self, *args):
+            n_open[0] -= 1
+            return self.file.__exit__(*args)
+
+    monkeypatch.setattr(external_sort, "open", CountedFile, raising=False)
+
+    random.seed(0)
+    items = [(random.randrange(40), idx) for idx in range(200)]
+    first = {}
+    for key, idx in items:
+        first.setdefault(key, idx)
+
+    # 100 runs, four merge passes to 2 runs; 3 open runs and 1 written
+    unique = list(external_sort.unique_sorted(items, run_size=2, fan_in=3))
+    assert_equals(unique, sorted(first.items()))
+    assert_true(n_open[1] <= 4)
+
+    with assert_raises(ValueError):
+        list(external_sort.unique_sorted(items, fan_in=1))
+
+
+def test_deletion_parallel():
+    """ Worker processes give the same candidates in the same order """
+    out_dir = tempfile.mkdtemp()
+    mpt = MPT("a b c 0 1 d 2 3 e b 1 2 c 3 0")
+
+    expected = list(Deletion(mpt, out=os.path.join(
+        out_dir, "seq.bin")).generate_candidates())
+    parallel = Deletion(mpt, out=os.path.join(out_dir, "par.bin"),
+                        n_jobs=2).generate_candidates()
+
+    assert_equals(list(parallel), expected)
+
+
+def test_deletion_count():
+    """ Counted candidates equal the enumerated ones """
+    mpt = MPT("a b c 0 1 d 2 3 e b 1 2 c 3 0")
+    for ignore_params in [[], ["b"]]:
+        deletion = Deletion(mpt, ignore_params=ignore_params)
+        enumerated = sorted(
+            tuple(mask) for masks, _ in deletion.iter_candidates(mpt.root)
+            for mask in masks.tolist())
+
+        assert_equals(deletion.count(), len(enumerated))
+        unranked = sorted(tuple(deletion.unrank(idx))
+                          for idx in range(deletion.count()))
+        assert_equals(unranked, enumerated)
+        assert_equals(deletion.unrank(-1), deletion.unrank(len(unranked) - 1))
+        assert_raises(IndexError, deletion.unrank, len(unranked))
+
+    words = Deletion(mpt).sample(10, random_state=random.Random(0))
+    candidates = list(Deletion(mpt, out=os.path.join(
+        tempfile.mkdtemp(), "candidates.bin")).generate_candidates())
+    assert_true(all(word.str_ in candidates for word in words))
+
+
+def test_candidate_store():
+    """ Test random access to the bit-packed deletion candidates """
+    out = os.path.join(tempfile.mkdtemp(), "candidates.bin")
+    deletion = Deletion(MPTdeletion, out=out)
+    candidates = list(deletion.generate_candidates())
+
+    store = CandidateStore(out)
+    assert_equals(len(store), len(candidates))
+    assert_equals(store[3], candidates[3])
+    assert_equals(store[-1], candidates[-1])
+    assert_equals(deletion.read_number(5), candidates[5])
+    assert_equals(store.masks([0]).shape, (1, len(MPTdeletion.word)))
+
+    words = store.sample(20, random_state=np.random.RandomState(0))
+    assert_equals(len(words), 20)
+    assert_true(all(word.str_ in candidates for word in words))
+
+
+def test_neighborhood():
+    """ Single moves reach every deletion and substitution candidate """
+    mpt = MPT("a b c 0 1 d 2 3 e b 1 2 c 3 0")
+    for ignore_params in [[], ["b"]]:
+        deletion = Deletion(mpt, ignore_params=ignore_params)
+        masks = set(tuple(mask) for blocks, _ in deletion.iter_candidates(
+            mpt.root) for mask in blocks.tolist())
+        neighborhood = Neighborhood(mpt, ignore_params=ignore_params)
+
+        start = neighborhood.candidate([1] * len(mpt.word), mpt.word.tokens)
+        assert_equals(start[0], str(mpt))
+        reached = {start[0]}
+        stack = [start]
+        while stack:
+            for word, mask, names in neighborhood.neighbors(*stack.pop()[1:]):
+                assert_true(tuple(mask) in masks)
+                if word not in reached:
+                    reached.add(word)
+                    stack.append((word, mask, names))
+
+        expected = set()
+        for mask in masks:
+            word = MPTWord(" ".join(compress(mpt.word.tokens, mask)))
+            expected.update(" ".join(tokens) for tokens in sub.generate_all(
+                word, ignore=ignore_params))
+        assert_equals(reached, expected)
+
+
+def test_surrogate():
+    """ Random forest, expected improvement and candidate features """
+    random_state = np.random.RandomState(0)
+    features = random_state.randint(0, 2, size=(200, 6))
+    targets = 3 * features[:, 0] - 2 * features[:, 3] * features[:, 4]
+    forest = RandomForest(n_trees=20, random_state=random_state).fit(
+        features, targets)
+    mean, std = forest.predict([[1, 0, 0, 1, 1, 0], [0, 1, 1, 0, 0, 1]])
+    assert_true(np.allclose(mean, [1, 0], atol=0.25))
+    assert_true(np.all(std < 0.5))
+
+    improvement = expected_improvement(np.array([0., 1., 1.]),
+                                       np.array([0., 0., 1.]), 0.5)
+    assert_true(np.isclose(improvement[0], 0.5))
+    assert_true(np.isclose(improvement[1], 0))
+    assert_true(0 < improvement[2] < 0.5)
+
+    mpt = MPT("a b 0 1 a 2 3")
+    neighborhood = Neighborhood(mpt)
+    encoder = Encoder(neighborhood)
+    tied = neighborhood.candidate([1] * 7, mpt.word.tokens)
+    split = neighborhood.candidate([1] * 7, ["a", "b", "0", "1", "x", "2",
+                                             "3"])
+    deleted = neighborhood.candidate([0, 1, 1, 1, 0, 0, 0], mpt.word.tokens)
+    encoded = encoder.encode([tied, split, deleted])
+    assert_equals(encoded.shape, (3, encoder.n_features))
+    assert_equals(encoded[:, -1].tolist(), [2, 3, 1])
+    assert_equals(encoded[:, -2].tolist(), [7, 7, 3])
+    assert_equals(encoded[:, 7 + 4].tolist(), [1, 0, 0])
+
+
 def test_gen_possible_subtrees():
 
     deletion = Deletion(MPTdeletion)
@@ -74,6 +244,53 @@ def test_substitution():
     assert_equals(param, ["a2", "a1", "a2"])
 """
 
+def test_generate_all():
+    """ Lazy enumeration of the substitutions, split by start and stride """
+    mpt = MPT("a b 0 1 a 2 b a 3 4 5")
+    trees = [" ".join(tokens) for tokens in sub.generate_all(mpt)]
+
+    assert_equals(len(trees), sub.count_all(mpt))
+    assert_equals(len(set(trees)), 10)
+    assert_equals(trees[:2], ["a b 0 1 a 2 b a 3 4 5",
+                              "a b 0 1 a 2 b1 a 3 4 5"])
+    assert_equals(trees[-1], "a b 0 1 a1 2 b1 a2 3 4 5")
+
+    parts = [" ".join(tokens) for start in range(3)
+             for tokens in sub.generate_all(mpt, start=start, stride=3)]
+    assert_equals(sorted(parts), sorted(trees))
+
+    ignored = [" ".join(tokens)
+               for tokens in sub.generate_all(mpt, ignore=["b"])]
+    assert_equals(len(ignored), 5)
+    assert_true(all(" b " in tree for tree in ignored))
+
+
+def test_rgs_rank():
+    """ Lexicographic ranking of restricted growth strings """
+    expected = [[0, 0, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0], [0, 0, 1, 1],
+                [0, 0, 1, 2], [0, 1, 0, 0], [0, 1, 0, 1], [0, 1, 0, 2],
+                [0, 1, 1, 0], [0, 1, 1, 1], [0, 1, 1, 2], [0, 1, 2, 0],
+                [0, 1, 2, 1], [0, 1, 2, 2], [0, 1, 2, 3]]
+    assert_equals([rgs.bell(n) for n in range(6)], [1, 1, 2, 5, 15, 52])
+    assert_equals(rgs.unrank_batch(range(15), 4).tolist(), expected)
+    assert_equals([rgs.unrank(idx, 4).tolist() for idx in range(15)],
+                  expected)
+    assert_equals([rgs.rank(string) for string in expected], list(range(15)))
+
+    # beyond int64
+    assert_equals(rgs.bell(26), 49631246523618756274)
+    rank = rgs.bell(40) // 3
+    assert_equals(rgs.rank(rgs.unrank(rank, 40)), rank)
+    assert_raises(ValueError, rgs.unrank, rgs.bell(5), 5)
+
+    strings = rgs.random_rgs(30, size=3,
+                             random_state=np.random.RandomState(0))
+    assert_equals(strings.shape, (3, 30))
+    for string in strings:
+        assert_true(all(string[idx] <= string[:idx].max() + 1
+                        for idx in range(1, 30)))
+
+
 def test_apply_rgs():
     mpt = "a a 0 1 b 2 3"
     param = "a"
@@ -0,0 +1,281 @@
+""" Tests the model search.
+
+"""
+
+import os
+import random
+import time
+from concurrent import futures
+
+import numpy as np
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from mptpy.compiled_mpt import ParentModel
+from mptpy.mpt import MPT
+from mptpy.optimization.operations.local_search import Neighborhood
+from mptpy.optimization import optimize
+from mptpy.optimization.optimize import Optimizer, evaluate_model
+from mptpy.optimization.warm_start import WarmStarts
+from mptpy.tools import eval_cache, joint_tree
+from mptpy.tools.eval_cache import EvalCache
+
+import context
+
+
+MODEL_DIR = os.path.abspath("tests/test_models/")
+
+BROEDER_SMALL = MODEL_DIR + "/broeder-agg_small.csv"
+
+
+def space_size(mpt):
+    """ Number of deletion and substitution models of an MPT """
+    neighborhood = Neighborhood(mpt)
+    start = neighborhood.candidate([1] * len(mpt.word), mpt.word.tokens)
+    reached = {start[0]}
+    stack = [start]
+    while stack:
+        for neighbor in neighborhood.neighbors(*stack.pop()[1:]):
+            if neighbor[0] not in reached:
+                reached.add(neighbor[0])
+                stack.append(neighbor)
+    return len(reached)
+
+
+def make_optimizer(out_dir, mpt=None, data_path=None, name="search"):
+    """ Optimizer writing its files to out_dir. Defaults to a model with
+    few deletion and substitution models. """
+    out_dir = str(out_dir)
+    if mpt is None:
+        mpt = MPT("a b 0 1 b 2 1")
+        data_path = os.path.join(out_dir, "data.csv")
+        with open(data_path, "w") as data_file:
+            data_file.write("10,20,30\n")
+
+    optimizer = Optimizer(mpt, data_path, name, func="llik")
+    optimizer.deletion.out = os.path.join(out_dir, name + ".bin")
+    optimizer.eval_file = os.path.join(out_dir, name + ".txt")
+    optimizer.checkpoint_file = os.path.join(out_dir, name + ".ckpt")
+    optimizer.cache_file = os.path.join(out_dir, name + ".sqlite")
+    return optimizer
+
+
+def test_random_search(tmp_path):
+    """ Budgeted random search, sequential and with worker processes """
+    for n_jobs in [1, 2]:
+        np.random.seed(0)
+        random.seed(0)
+        optimizer = make_optimizer(tmp_path, context.MPTS["2htms_small"],
+                                   BROEDER_SMALL, "jobs{}".format(n_jobs))
+        model, evaluation = optimizer.random_search(
+            max_fits=6, n_jobs=n_jobs, criterion="AIC")
+
+        evaluations = dict(optimizer.read_evaluations())
+
+        # models sampled twice are skipped without counting
+        assert_equals(len(evaluations), 6)
+        assert_equals(evaluations[model]["AIC"], evaluation["AIC"])
+        assert_equals(optimizer.best, (model, evaluation))
+
+    with assert_raises(ValueError):
+        optimizer.random_search(max_fits=1, criterion="RMSE")
+
+
+def test_random_search_exhausted(tmp_path):
+    """ The random search ends once it samples only evaluated models """
+    optimizer = make_optimizer(tmp_path)
+    random.seed(0)
+    np.random.seed(0)
+    optimizer.random_search(max_fits=10, n_optim=2)
+    models = [model for model, _ in optimizer.read_evaluations()]
+    assert_equals(sorted(set(models)), sorted(models))
+    assert_equals(len(models), space_size(optimizer.mpt))
+
+
+def test_random_search_deadline(tmp_path, monkeypatch):
+    """ Once the time is up, the search blocks on the running fits instead
+    of polling them """
+    evaluate = optimize.evaluate_candidate
+    wait = futures.wait
+    n_waits = [0]
+
+    def slow_evaluate(candidate, settings, cache=None, x0=None):
+        time.sleep(0.3)
+        return evaluate(candidate, settings, x0=x0)
+
+    def counting_wait(*args, **kwargs):
+        n_waits[0] += 1
+        return wait(*args, **kwargs)
+
+    # fits run in a thread, so they are still running at the deadline
+    monkeypatch.setattr(optimize, "evaluate_candidate", slow_evaluate)
+    monkeypatch.setattr(optimize, "_SerialPool",
+                        lambda: futures.ThreadPoolExecutor(1))
+    monkeypatch.setattr(futures, "wait", counting_wait)
+
+    optimizer = make_optimizer(tmp_path)
+    optimizer.random_search(max_time=0.05, n_optim=2)
+
+    assert_true(n_waits[0] <= 3)
+    assert_equals(len(list(optimizer.read_evaluations())), 1)
+
+
+def test_resume_search(tmp_path):
+    """ A resumed search continues with the same models """
+    def search(name, max_fits, resume=False):
+        optimizer = make_optimizer(tmp_path, context.MPTS["2htms_small"],
+                                   BROEDER_SMALL, name)
+        optimizer.random_search(max_fits=max_fits, n_optim=2, resume=resume)
+        return [model for model, _ in optimizer.read_evaluations()]
+
+    np.random.seed(1)
+    random.seed(1)
+    uninterrupted = search("full", 12)
+
+    np.random.seed(1)
+    random.seed(1)
+    search("parts", 5)
+    np.random.seed(2)
+    random.seed(2)
+    resumed = search("parts", 12, resume=True)
+
+    assert_equals(resumed, uninterrupted)
+    assert_equals(len(set(resumed)), len(resumed))
+
+
+def test_eval_cache(tmp_path):
+    """ Models equal up to parameter names are fitted once """
+    optimizer = make_optimizer(tmp_path, context.MPTS["2htms_small"],
+                               BROEDER_SMALL)
+    settings = optimizer.eval_settings(n_optim=2)
+
+    model = "y0 Do 0 G1 0 1 y1 G1 2 3 G2 4 5"
+    renamed = "y0 a 0 b 0 1 y1 b 2 3 c 4 5"
+    cache = EvalCache(optimizer.cache_file)
+    evaluation = evaluate_model(model, settings, cache)
+    cache.close()
+
+    # new process: the evaluation is found on disk
+    cache = EvalCache(optimizer.cache_file)
+    renamed = MPT(joint_tree.split(MPT(renamed).root, 3)).compile()
+    found, cached = cache.get(renamed, settings["fingerprint"])
+    assert_true(found)
+    assert_equals(cached["AIC"], evaluation["AIC"])
+    assert_equals(cached["ParamAssignment"]["b"],
+                  evaluation["ParamAssignment"]["G1"])
+
+    # other fit settings are not found
+    found, _ = cache.get(renamed, "other")
+    assert_true(not found)
+
+
+def test_warm_starts():
+    """ Estimates of the nearest fitted model are mapped onto candidates """
+    parent = ParentModel(MPT("a b 0 1 c a 2 3 1"))
+    warm_starts = WarmStarts(parent.is_param, size=2)
+    assert_equals(warm_starts.initial_estimates([1] * 9, parent.tokens),
+                  None)
+
+    full = ["a", "b", "0", "1", "c", "a1", "2", "3", "1"]
+    warm_starts.add([1] * 9, full, {"a": 0.2, "b": 0.3, "c": 0.4, "a1": 0.6})
+    deleted = [1, 1, 1, 1, 0, 1, 1, 1, 0]
+    warm_starts.add(deleted, full, {"a": 0.75, "b": 0.3, "a1": 0.25})
+
+    # nearest is the model with c deleted, the tied a and a1 are merged
+    tied = ["a", "b", "0", "1", "c", "a", "2", "3", "1"]
+    assert_equals(warm_starts.initial_estimates(deleted, tied),
+                  {"a": 0.5, "b": 0.3})
+
+    # the oldest model is dropped, among the nearest models the one with
+    # the same ties is used; c is deleted in it and not estimated
+    warm_starts.add(deleted, tied, {"a": 0.5, "b": 0.1})
+    assert_equals(warm_starts.initial_estimates([1] * 9, full),
+                  {"a": 0.75, "b": 0.3, "a1": 0.25})
+
+
+def test_local_search(tmp_path):
+    """ Simulated annealing within the fit budget """
+    mpt = context.MPTS["2htms_small"]
+    optimizer = make_optimizer(tmp_path, mpt, BROEDER_SMALL)
+
+    random.seed(0)
+    np.random.seed(0)
+    model, evaluation = optimizer.local_search(max_fits=12, criterion="AIC",
+                                               n_optim=2)
+
+    evaluations = list(optimizer.read_evaluations())
+    assert_equals(len(evaluations), 12)
+    assert_equals(evaluations[0][0], str(mpt))
+    assert_equals(len(set(model for model, _ in evaluations)), 12)
+    assert_equals(evaluation["AIC"], min(
+        result["AIC"] for _, result in evaluations if result is not None))
+
+    with assert_raises(ValueError):
+        optimizer.local_search(criterion="RMSE")
+
+
+def test_surrogate_search(tmp_path):
+    """ Surrogate-based search within the fit budget """
+    mpt = context.MPTS["2htms_small"]
+    optimizer = make_optimizer(tmp_path, mpt, BROEDER_SMALL)
+
+    random.seed(0)
+    np.random.seed(0)
+    model, evaluation = optimizer.surrogate_search(
+        max_fits=12, criterion="AIC", n_optim=2, n_initial=4)
+
+    evaluations = list(optimizer.read_evaluations())
+    assert_equals(len(evaluations), 12)
+    assert_equals(evaluations[0][0], str(mpt))
+    assert_equals(len(set(model for model, _ in evaluations)), 12)
+    assert_equals(evaluation["AIC"], min(
+        result["AIC"] for _, result in evaluations if result is not None))
+
+
+def test_eval_cache_identifiability():
+    """ A model with a parameter without effect does not share its cached
+    evaluation with its identifiable reduction """
+    reduced = "a b 0 1 2"
+    redundant = "a b c 0 0 1 2"
+    data = np.array([30, 20, 50])
+    settings = {"leaf_test": MPT(reduced).word.is_leaf, "n_trees": 1,
+                "func": "llik", "data": data, "n_optim": 2,
+                "fingerprint": eval_cache.settings_key(data, func="llik")}
+
+    for order in [[reduced, redundant], [redundant, reduced]]:
+        cache = EvalCache()
+        evaluations = dict((model, evaluate_model(model, settings, cache))
+                           for model in order)
+        assert_equals(evaluations[redundant], None)
+        assert_equals(evaluations[reduced]["n_params"], 2)
+        assert_equals(sorted(evaluations[reduced]["ParamAssignment"]),
+                      ["a", "b"])
+
+
+def test_local_search_exhausted(tmp_path):
+    """ The local search ends once every model is evaluated """
+    optimizer = make_optimizer(tmp_path)
+    n_models = space_size(optimizer.mpt)
+    assert_equals(n_models, 4)
+
+    random.seed(0)
+    np.random.seed(0)
+    optimizer.local_search(max_fits=10, criterion="AIC", n_optim=2)
+    models = [model for model, _ in optimizer.read_evaluations()]
+    assert_equals(len(models), n_models)
+    assert_equals(len(set(models)), n_models)
+
+
+def test_surrogate_search_exhausted(tmp_path):
+    """ The surrogate search fits new models until the budget or the
+    candidate space is exhausted, also if random draws are known """
+    for max_fits in [3, 10]:
+        optimizer = make_optimizer(tmp_path, name="fits{}".format(max_fits))
+        n_models = space_size(optimizer.mpt)
+
+        random.seed(0)
+        np.random.seed(0)
+        optimizer.surrogate_search(max_fits=max_fits, criterion="AIC",
+                                   n_optim=2, n_initial=1, random_prob=0.5)
+        models = [model for model, _ in optimizer.read_evaluations()]
+        assert_equals(len(models), min(max_fits, n_models))
+        assert_equals(len(set(models)), len(models))
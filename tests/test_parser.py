@@ -8,9 +8,14 @@ Nicolas Riesterer <riestern@cs.uni-freiburg.de>
 """
 
 import os
-from nose.tools import assert_equals
+import shutil
+import tempfile
+from nose.tools import assert_equals, assert_raises, assert_true
 
+from mptpy.compiled_mpt import CompiledMPT
 from mptpy.mpt import MPT
+from mptpy.tools.parsing import Parser, ParseError
+from mptpy.tools import model_cache
 
 import context
 
@@ -39,3 +44,93 @@ def test_bmpt_parsing_w_joining():
     """ tests the bmpt parser with joining trees """
     mpt = context.MPTS["testBMPT2"]
     assert_equals(str(mpt), "y0 a c 0 1 1 b 2 3")
+
+
+def test_easy_compiled():
+    """ Tests the branch structure built while parsing the easy format """
+    mpt = context.MPTS["test1"]
+    compiled = mpt.compiled
+
+    assert_equals(compiled.params, ["a", "bc", "c", "e", "d"])
+    assert_equals(compiled.categories, ["0", "1", "2", "3", "4", "5"])
+    assert_equals(list(compiled.branch_cats), [0, 1, 2, 2, 3, 4, 5])
+    # a * (1-bc) * (1-a) * e
+    assert_equals(list(compiled.branch_pos[3]), [1, 0, 0, 1, 0])
+    assert_equals(list(compiled.branch_neg[3]), [1, 1, 0, 0, 0])
+    assert_equals(compiled, CompiledMPT.from_tree(mpt.root))
+
+
+def test_easy_parse_errors():
+    """ Tests the error locations reported by the easy parser """
+    parser = Parser()
+
+    with assert_raises(ParseError) as err:
+        parser.build(["a * b", "a * (1 b)", "(1-a)"])
+    assert_equals((err.exception.line, err.exception.col), (2, 8))
+
+    with assert_raises(ParseError) as err:
+        parser.build(["a * b", "a * (1-c)", "(1-a)"])
+    assert_equals((err.exception.line, err.exception.col), (2, 8))
+
+    with assert_raises(ParseError) as err:
+        parser.build(["a * b", "(1-a)"])
+    assert_equals((err.exception.line, err.exception.col), (1, 5))
+
+
+def test_parameter_names():
+    """ Parameter names may contain any character but whitespace and the
+    operators, and do not start with a digit """
+    mpt = Parser().build(["a.b * c-d", "a.b * (1 - c-d)", "(1-a.b)"])
+    assert_equals(str(mpt), "a.b c-d 0 1 2")
+
+    with assert_raises(ParseError) as err:
+        Parser().build(["a * 2b", "(1-a)"])
+    assert_equals(str(err.exception),
+                  "<model>:1:5: expected parameter or '(1-', found '2'")
+
+
+def test_format_detection():
+    """ Easy files with one factor per line are not taken for BMPT """
+    mpt = Parser().parse_text("a\n(1 - a)\n\nb\n(1-b)\n")
+    assert_equals(str(mpt), "y0 a 0 1 b 2 3")
+    assert_equals(mpt.compiled.params, ["a", "b"])
+
+
+def test_bmpt_parse_errors():
+    """ Malformed BMPT words raise located parse errors """
+    parser = Parser()
+
+    with assert_raises(ParseError) as err:
+        parser.parse_text("# tree\na b 0\n", source="model.txt")
+    assert_equals(err.exception.line, 2)
+    assert_true(str(err.exception).startswith("model.txt:2: "))
+
+    with assert_raises(ParseError) as err:
+        parser.parse_text("a 0 1\nb 1 2\n")
+    assert_equals(err.exception.line, 2)
+
+
+def test_model_cache():
+    """ Tests loading models through the persistent model cache """
+    tmp_dir = tempfile.mkdtemp()
+    model_path = os.path.join(tmp_dir, "model.txt")
+    cache_dir = os.path.join(tmp_dir, "cache")
+
+    with open(model_path, "w") as model_file:
+        model_file.write("a * b\na * (1-b)\n(1-a)\n")
+
+    mpt = model_cache.load_model(model_path, cache_dir=cache_dir)
+    assert_equals(len(os.listdir(cache_dir)), 1)
+    cached = model_cache.load_model(model_path, cache_dir=cache_dir)
+    assert_equals(str(cached), str(mpt))
+    assert_equals(cached.compiled, mpt.compiled)
+    assert_true(cached.root is mpt.root)
+
+    # modifying the file invalidates the entry
+    with open(model_path, "w") as model_file:
+        model_file.write("c * b\nc * (1-b)\n(1-c)\n")
+    changed = model_cache.load_model(model_path, cache_dir=cache_dir)
+    assert_equals(str(changed), "c b 0 1 2")
+    assert_equals(len(os.listdir(cache_dir)), 2)
+
+    shutil.rmtree(tmp_dir)